@@ -0,0 +1,28 @@
+import importlib
+
+__version__ = "1.0"
+
+# the fitting functions are imported on first use, so that e.g. reading fit
+# files with ActFit.file does not import scipy
+_EXPORTS = {
+    "active_fit": "fit",
+    "batch_fit": "fit",
+    "BatchResult": "fit",
+    "global_fit": "globalfit",
+    "GlobalResult": "globalfit",
+}
+
+__all__ = tuple(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,435 @@
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+import glob
+import os
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+import warnings
+
+import numpy as np
+
+from . import loaders
+from .compiled import CompiledModel
+from .file import dump, read
+from .fit import LOSSES, active_fit, parameter_names
+from .roi import ROI, select
+from .source import function_sources
+from .stats import fit_statistics
+
+__all__ = (
+    "FileResult",
+    "add_arguments",
+    "expand_paths",
+    "fit_files",
+    "main",
+    "write_table",
+)
+
+
+class FileResult(NamedTuple):
+    path: str
+    params: Optional[Dict[str, float]]
+    errors: Optional[Dict[str, float]]
+    stats: Dict[str, float]
+    error: Optional[str]
+    seconds: float
+    output: Optional[str]
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+
+def expand_paths(patterns: Sequence[str]) -> List[str]:
+    """Files matching any of the glob patterns, in order and without repeats
+
+    :param patterns: glob patterns or plain paths
+    """
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            if match not in seen:
+                seen.add(match)
+                paths.append(match)
+    return paths
+
+
+_worker_state = None
+
+
+def _init_worker(source, name, p0, bounds, variables, options, compile_, roi):
+    # imported by the first fit otherwise, which would then seem slow
+    import scipy.optimize
+
+    global _worker_state
+    namespace = {"np": np}
+    exec(compile(source, "<source>", "exec"), namespace)
+    func = namespace[name]
+    func_source = function_sources(source).get(name)
+    model = CompiledModel(func, func_source, None if compile_ else [])
+    _worker_state = (
+        namespace,
+        func,
+        func_source,
+        model,
+        p0,
+        bounds,
+        variables,
+        options,
+        roi,
+    )
+
+
+def _resolve(namespace, arrays, pattern, path):
+    if pattern is None:
+        return None
+    name = pattern.format(name=loaders.variable_name(path))
+    if name in arrays:
+        return arrays[name]
+    if name in namespace:
+        return namespace[name]
+    raise KeyError(f"no array {name!r} in {path} or the source")
+
+
+def _targets(paths, output):
+    """``.actfit`` file of each data file in ``output``, unique among them
+
+    Files are named after their stem. Files sharing a stem are named after
+    their path relative to the directory all of them are in instead, and
+    numbered if that still isn't unique, e.g. ``x.csv`` and ``x.tsv``.
+    """
+    if output is None:
+        return [None] * len(paths)
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    if len(set(stems)) < len(stems):
+        counts = Counter(stems)
+        bases = [os.path.splitext(os.path.abspath(path))[0] for path in paths]
+        try:
+            common = os.path.commonpath([os.path.dirname(base) for base in bases])
+        except ValueError:
+            # e.g. on different drives
+            common = None
+        for i, (stem, base) in enumerate(zip(stems, bases)):
+            if counts[stem] > 1 and common is not None:
+                stems[i] = os.path.relpath(base, common).replace(os.sep, "_")
+        counts = Counter(stems)
+        stems = [
+            f"{stem}-{i}" if counts[stem] > 1 else stem for i, stem in enumerate(stems)
+        ]
+    return [os.path.join(output, stem + ".actfit") for stem in stems]
+
+
+def _fit_file(path, target=None):
+    import scipy.optimize as opt
+
+    (
+        namespace,
+        func,
+        func_source,
+        model,
+        p0,
+        bounds,
+        variables,
+        options,
+        roi,
+    ) = _worker_state
+    start = time.perf_counter()
+    try:
+        arrays = loaders.load(path)
+        xs, data, sigma = (
+            _resolve(namespace, arrays, variables[key], path)
+            for key in ("xs", "data", "sigma")
+        )
+        xs, data, sigma = select(roi, xs, data, sigma)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", opt.OptimizeWarning)
+            params, cov = active_fit(
+                model, xs, data, p0=p0, bounds=bounds, sigma=sigma, **options
+            )
+
+        names = parameter_names(func)
+        values = dict(zip(names, map(float, params)))
+        result = fit_statistics(
+            model(xs, *params), data, len(names), covariance=cov, sigma=sigma
+        )
+        stats = dict(
+            n_params=len(names),
+            loss=options.get("loss", "linear"),
+            weighted=sigma is not None,
+            absolute_sigma=options.get("absolute_sigma", False),
+            n_points=result.n_points,
+            rss=result.rss,
+            chi2=result.chi2,
+            reduced_chi2=result.reduced_chi2,
+            r_squared=result.r_squared,
+        )
+        if target is not None:
+            extra = {"data_file": os.path.abspath(path)}
+            if not roi.everything:
+                extra["roi"] = roi.to_json()
+            with open(target, "wb") as f:
+                dump(
+                    func,
+                    values,
+                    f,
+                    bounds={n: (float(l), float(u)) for n, l, u in zip(names, *bounds)},
+                    covariance=cov,
+                    stats=stats,
+                    source=func_source,
+                    extra=extra,
+                )
+        errors = dict(zip(names, map(float, result.errors)))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        return FileResult(
+            path, None, None, {}, error, time.perf_counter() - start, None
+        )
+    return FileResult(
+        path, values, errors, stats, None, time.perf_counter() - start, target
+    )
+
+
+def fit_files(
+    paths: Sequence[str],
+    source: Optional[str] = None,
+    template: Optional[str] = None,
+    function: Optional[str] = None,
+    xs: str = "xs",
+    data: str = "{name}",
+    sigma: Optional[str] = None,
+    output: Optional[str] = None,
+    processes: Optional[int] = None,
+    compile_: bool = True,
+    **options,
+) -> Iterator[FileResult]:
+    """Fit one model to many data files in parallel
+
+    Every worker process executes the source once, then loads, fits and
+    optionally saves one file at a time. ``xs``, ``data`` and ``sigma`` name
+    the arrays to fit; ``{name}`` in them is replaced by the variable name
+    :func:`~ActFit.loaders.load` derives from the file name, e.g.
+    ``"{name}_1"`` is the second column of a CSV file. Names missing from
+    the file are looked up in the source.
+
+    :param paths: data files
+    :param source: source text defining the model, as saved from the source
+        window, by default the function stored in ``template``
+    :param template: ``.actfit`` file providing the function name, initial
+        parameters, bounds, loss, whether sigma is absolute and the x ranges
+        of its region of interest
+    :param function: name of the model function, by default the template's
+    :param xs: name of the independent variable
+    :param data: name of the data
+    :param sigma: name of the data's uncertainties, if any
+    :param output: directory to write one ``.actfit`` file per data file to,
+        named after the file, or after its path if the names collide
+    :param processes: number of worker processes, by default one per core
+    :param compile_: whether to evaluate the model through
+        :class:`~ActFit.compiled.CompiledModel`
+    :param options: passed on to :func:`~ActFit.fit.active_fit`, overriding
+        the template's
+    :return: results in order of completion
+    """
+    fit = read(template) if template is not None else None
+    name = function or (fit.name if fit is not None else None)
+    if source is None:
+        if fit is None:
+            raise ValueError("either a source or a template is required")
+        source = fit.source
+    if name is None:
+        raise ValueError("no function given")
+    namespace = {"np": np}
+    exec(compile(source, "<source>", "exec"), namespace)
+    names = parameter_names(namespace[name])
+
+    params, bounds, stats, roi = {}, {}, {}, ROI()
+    if fit is not None:
+        params, bounds, stats = fit.params, fit.bounds, fit.stats
+        # excluded samples are indices into the template's data
+        roi = ROI(ROI.from_json(fit.extra.get("roi")).spans)
+    p0 = np.array([params.get(n, 1.0) for n in names])
+    lower, upper = (
+        np.array([bounds.get(n, (-np.inf, np.inf))[i] for n in names]) for i in (0, 1)
+    )
+    if stats.get("loss") in LOSSES:
+        options.setdefault("loss", stats["loss"])
+    if "absolute_sigma" in stats:
+        options.setdefault("absolute_sigma", stats["absolute_sigma"])
+
+    if output is not None:
+        os.makedirs(output, exist_ok=True)
+    variables = dict(xs=xs, data=data, sigma=sigma)
+    initargs = (
+        source,
+        name,
+        p0,
+        (lower, upper),
+        variables,
+        options,
+        compile_,
+        roi,
+    )
+    targets = _targets(paths, output)
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(paths) <= 1:
+        _init_worker(*initargs)
+        for path, target in zip(paths, targets):
+            yield _fit_file(path, target)
+        return
+    with ProcessPoolExecutor(
+        min(processes, len(paths)), initializer=_init_worker, initargs=initargs
+    ) as pool:
+        futures = [
+            pool.submit(_fit_file, path, target) for path, target in zip(paths, targets)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def write_table(results: Iterable[FileResult], file, delimiter: str = ",") -> None:
+    """Write fit results as a delimited table, one row per file
+
+    Columns are the file, its status, every parameter followed by its
+    standard error, and the goodness of fit.
+
+    :param results: results of :func:`fit_files`
+    :param file: text file to write to
+    :param delimiter: column delimiter
+    """
+    results = list(results)
+    names = []
+    for result in results:
+        for name in result.params or ():
+            if name not in names:
+                names.append(name)
+    columns = ["n_points", "rss", "chi2", "reduced_chi2", "r_squared"]
+    writer = csv.writer(file, delimiter=delimiter, lineterminator="\n")
+    writer.writerow(
+        ["file", "error"]
+        + [column for name in names for column in (name, name + "_error")]
+        + columns
+        + ["seconds"]
+    )
+    for result in results:
+        params, errors = result.params or {}, result.errors or {}
+        writer.writerow(
+            [result.path, result.error or ""]
+            + [
+                value
+                for name in names
+                for value in (params.get(name, ""), errors.get(name, ""))
+            ]
+            + [result.stats.get(column, "") for column in columns]
+            + [f"{result.seconds:.6f}"]
+        )
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the command line arguments of :func:`main` to ``parser``"""
+    parser.add_argument(
+        "files", nargs="+", help="data files or glob patterns, quoted for large sets"
+    )
+    parser.add_argument(
+        "-s", "--source", help="source file saved from the source window"
+    )
+    parser.add_argument(
+        "-t",
+        "--template",
+        help=".actfit file with the initial parameters, bounds and loss",
+    )
+    parser.add_argument("-f", "--function", help="model function, default: template's")
+    parser.add_argument("--xs", default="xs", help="independent variable (default: xs)")
+    parser.add_argument(
+        "--data",
+        default="{name}",
+        help="data to fit, {name} is the file's variable name (default: {name})",
+    )
+    parser.add_argument("--sigma", help="uncertainties of the data")
+    parser.add_argument("--loss", choices=LOSSES, help="default: template's or linear")
+    parser.add_argument(
+        "--absolute-sigma", action="store_true", default=None, help="sigma is absolute"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="actfit-results",
+        help="directory for the .actfit files and the table (default: actfit-results)",
+    )
+    parser.add_argument(
+        "--table", help="results table, default: results.csv in the output directory"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None, help="worker processes (default: cores)"
+    )
+    parser.add_argument(
+        "--no-compile", action="store_true", help="evaluate the model in python"
+    )
+
+
+def main(args: argparse.Namespace, log=sys.stderr) -> int:
+    """Fit files as given on the command line, see :func:`add_arguments`
+
+    :return: exit status, 1 if any fit failed
+    """
+    paths = expand_paths(args.files)
+    if not paths:
+        print("no data files match", file=log)
+        return 2
+    source = None
+    if args.source is not None:
+        with open(args.source) as f:
+            source = f.read()
+    options = {}
+    if args.loss is not None:
+        options["loss"] = args.loss
+    if args.absolute_sigma is not None:
+        options["absolute_sigma"] = args.absolute_sigma
+
+    results = []
+    start = time.perf_counter()
+    for result in fit_files(
+        paths,
+        source=source,
+        template=args.template,
+        function=args.function,
+        xs=args.xs,
+        data=args.data,
+        sigma=args.sigma,
+        output=args.output,
+        processes=args.jobs,
+        compile_=not args.no_compile,
+        **options,
+    ):
+        results.append(result)
+        rate = len(results) / (time.perf_counter() - start)
+        status = "ok" if result.success else result.error
+        print(
+            f"[{len(results)}/{len(paths)}] {result.path}: {status}"
+            f" ({rate:.1f} fits/s)",
+            file=log,
+        )
+    elapsed = time.perf_counter() - start
+
+    order = {path: i for i, path in enumerate(paths)}
+    results.sort(key=lambda result: order[result.path])
+    table = args.table or os.path.join(args.output, "results.csv")
+    with open(table, "w", newline="") as f:
+        write_table(results, f, delimiter="\t" if table.endswith(".tsv") else ",")
+    failed = sum(not result.success for result in results)
+    print(
+        f"{len(results) - failed} of {len(results)} fits succeeded in {elapsed:.2f} s"
+        f" ({len(results) / elapsed:.1f} fits/s), results in {table}",
+        file=log,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit a model to many data files")
+    add_arguments(parser)
+    sys.exit(main(parser.parse_args()))
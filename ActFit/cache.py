@@ -0,0 +1,118 @@
+from collections import OrderedDict
+import hashlib
+import json
+from typing import Callable, Optional, Sequence, Tuple
+import weakref
+
+import numpy as np
+
+__all__ = ("FitCache", "array_checksum")
+
+
+_checksums = {}
+
+
+def array_checksum(array) -> str:
+    """Checksum of an array's shape, type and contents
+
+    The checksum of every array object is computed once and remembered for
+    as long as the object lives, so large, memory-mapped data is read only
+    on first use. In-place modifications after that are not detected.
+
+    :param array: array to checksum
+    """
+    key = id(array)
+    cached = _checksums.get(key)
+    if cached is not None and cached[0]() is array:
+        return cached[1]
+    a = np.ascontiguousarray(array)
+    digest = hashlib.sha1(f"{a.dtype.str}{a.shape}".encode("ascii"))
+    digest.update(memoryview(a.reshape(-1)).cast("B"))
+    checksum = digest.hexdigest()
+    try:
+        ref = weakref.ref(array, lambda _, key=key: _checksums.pop(key, None))
+    except TypeError:
+        return checksum
+    _checksums[key] = (ref, checksum)
+    return checksum
+
+
+class FitCache:
+    """Least recently used fit results
+
+    Results are keyed on a hash of the model source, the checksums of the
+    fitted arrays, the initial parameters and the bounds.
+
+    :param maxsize: number of results to keep
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self._results = OrderedDict()
+        self._maxsize = maxsize
+
+    def __len__(self):
+        return len(self._results)
+
+    @staticmethod
+    def key(
+        func: Callable,
+        source: Optional[str],
+        xs,
+        data,
+        p0: Sequence[float],
+        bounds: Tuple[Sequence[float], Sequence[float]],
+        sigma=None,
+        **options,
+    ) -> str:
+        """Hash identifying a fit
+
+        :param func: model function, only identified by its name and object
+            identity if ``source`` is not given
+        :param source: source text of the model
+        :param xs: independent variable
+        :param data: dependent data
+        :param p0: initial parameters
+        :param bounds: ``(lower, upper)`` parameter bounds
+        :param sigma: uncertainties of ``data``
+        :param options: further JSON serializable fit options, e.g. the loss
+        """
+        if source is None:
+            source = f"{getattr(func, '__name__', '')}@{id(func)}"
+        identity = json.dumps(
+            [
+                source,
+                array_checksum(xs),
+                array_checksum(data),
+                [float(p) for p in p0],
+                [[float(b) for b in bound] for bound in bounds],
+                None if sigma is None else array_checksum(sigma),
+                options,
+            ],
+            sort_keys=True,
+        )
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Cached ``(params, cov)``, or ``None``
+
+        :param key: see :meth:`key`
+        """
+        result = self._results.get(key)
+        if result is not None:
+            self._results.move_to_end(key)
+        return result
+
+    def put(self, key: str, params, cov) -> None:
+        """Store a fit result
+
+        :param key: see :meth:`key`
+        :param params: fitted parameters
+        :param cov: their covariance
+        """
+        self._results[key] = (params, cov)
+        self._results.move_to_end(key)
+        while len(self._results) > self._maxsize:
+            self._results.popitem(last=False)
+
+    def clear(self) -> None:
+        self._results.clear()
@@ -0,0 +1,269 @@
+import ast
+from collections import OrderedDict
+import hashlib
+import inspect
+import threading
+import time
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+from .source import UnsupportedSource, argument_names, return_expression
+
+__all__ = ("BACKENDS", "CompiledModel", "ModelCache", "available_backends")
+
+
+#: compilation backends in order of preference
+BACKENDS = ("numexpr", "numba")
+
+_NUMEXPR_FUNCTIONS = {
+    "sin",
+    "cos",
+    "tan",
+    "arcsin",
+    "arccos",
+    "arctan",
+    "arctan2",
+    "sinh",
+    "cosh",
+    "tanh",
+    "arcsinh",
+    "arccosh",
+    "arctanh",
+    "log",
+    "log10",
+    "log1p",
+    "exp",
+    "expm1",
+    "sqrt",
+    "abs",
+    "where",
+}
+_NUMEXPR_OPERATORS = {
+    ast.Add: "+",
+    ast.Sub: "-",
+    ast.Mult: "*",
+    ast.Div: "/",
+    ast.Pow: "**",
+}
+
+
+def available_backends():
+    """Backends out of :data:`BACKENDS` that can be imported"""
+    backends = []
+    for name in BACKENDS:
+        try:
+            __import__(name)
+        except ImportError:
+            continue
+        backends.append(name)
+    return backends
+
+
+def _numexpr_expression(node, names, globals_):
+    def convert(node):
+        value = getattr(node, "value", getattr(node, "n", None))
+        if type(node).__name__ in ("Constant", "Num") and isinstance(
+            value, (int, float)
+        ):
+            return repr(value)
+        if isinstance(node, ast.Name):
+            if node.id in names:
+                return node.id
+            value = globals_.get(node.id)
+            if isinstance(value, (int, float)):
+                return repr(value)
+        if (
+            isinstance(node, ast.Attribute)
+            and isinstance(node.value, ast.Name)
+            and isinstance(globals_.get(node.value.id), type(np))
+        ):
+            value = getattr(globals_[node.value.id], node.attr, None)
+            if isinstance(value, float):
+                return repr(value)
+        if isinstance(node, ast.BinOp) and type(node.op) in _NUMEXPR_OPERATORS:
+            op = _NUMEXPR_OPERATORS[type(node.op)]
+            return f"({convert(node.left)} {op} {convert(node.right)})"
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return f"(-{convert(node.operand)})"
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.UAdd):
+            return convert(node.operand)
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and isinstance(node.func.value, ast.Name)
+            and globals_.get(node.func.value.id) is np
+            and not node.keywords
+        ):
+            name, args = node.func.attr, [convert(arg) for arg in node.args]
+            if name == "power" and len(args) == 2:
+                return f"({args[0]} ** {args[1]})"
+            if name == "square" and len(args) == 1:
+                return f"({args[0]} ** 2)"
+            if name == "absolute":
+                name = "abs"
+            if name in _NUMEXPR_FUNCTIONS:
+                return f"{name}({', '.join(args)})"
+        raise UnsupportedSource(ast.dump(node))
+
+    return convert(node)
+
+
+def _compile_numexpr(func, source):
+    import numexpr
+
+    func_def = ast.parse(source).body[0]
+    names = argument_names(func_def)
+    expression = _numexpr_expression(
+        return_expression(func_def), set(names), getattr(func, "__globals__", {})
+    )
+    numexpr.validate(expression, local_dict={name: 1.0 for name in names})
+
+    def compiled(*args):
+        return numexpr.evaluate(expression, local_dict=dict(zip(names, args)))
+
+    return compiled
+
+
+def _compile_numba(func, source):
+    import numba
+
+    return numba.njit(func)
+
+
+_COMPILERS = {"numexpr": _compile_numexpr, "numba": _compile_numba}
+
+
+def _rebuild(python, source, backend):
+    return CompiledModel(python, source, backends=[] if backend is None else [backend])
+
+
+class CompiledModel:
+    """A model function evaluated through the fastest working backend
+
+    The first call with every kind of input (dimensions and dtypes) is
+    checked against the plain python function. Inputs the backend can't
+    handle or gets wrong, e.g. complex parameters for numba, are evaluated in
+    python from then on. Every call is timed.
+
+    :param python: plain python model function ``func(xs, *params)``
+    :param source: source text of its ``def``
+    :param backends: backends to try, defaults to :func:`available_backends`
+    """
+
+    def __init__(
+        self,
+        python: Callable,
+        source: Optional[str],
+        backends: Optional[Sequence[str]] = None,
+    ):
+        self.python = python
+        self.source = source
+        self.backend = None
+        self._compiled = None
+        self.__signature__ = inspect.signature(python)
+        self.__name__ = getattr(python, "__name__", "model")
+        self.__globals__ = getattr(python, "__globals__", {})
+        self._verified = set()
+        self._unsupported = set()
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.total_time = 0.0
+
+        if source is None:
+            return
+        for backend in available_backends() if backends is None else backends:
+            try:
+                self._compiled = _COMPILERS[backend](python, source)
+            except Exception:
+                continue
+            self.backend = backend
+            break
+
+    def __reduce__(self):
+        return _rebuild, (self.python, self.source, self.backend)
+
+    @property
+    def mean_time(self):
+        """Mean wall time of one evaluation in seconds"""
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def reset_timing(self):
+        with self._lock:
+            self.calls = 0
+            self.total_time = 0.0
+
+    @staticmethod
+    def _kind(args):
+        return tuple((np.ndim(arg), np.result_type(arg).kind) for arg in args)
+
+    def _evaluate(self, args):
+        if self._compiled is None:
+            return self.python(*args)
+        kind = self._kind(args)
+        if kind in self._unsupported:
+            return self.python(*args)
+        try:
+            ys = self._compiled(*args)
+        except Exception:
+            self._unsupported.add(kind)
+            return self.python(*args)
+        if kind not in self._verified:
+            # compare against python once for every kind of input
+            expected = self.python(*args)
+            if np.shape(ys) != np.shape(expected) or not np.allclose(
+                ys, expected, rtol=1e-7, equal_nan=True
+            ):
+                self._unsupported.add(kind)
+                return expected
+            self._verified.add(kind)
+        return ys
+
+    def __call__(self, xs, *params, **kwparams):
+        if kwparams:
+            params = params + tuple(
+                kwparams[name] for name in list(self.__signature__.parameters)[1:]
+            )
+        start = time.perf_counter()
+        ys = self._evaluate((xs,) + params)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.calls += 1
+            self.total_time += elapsed
+        return ys
+
+
+class ModelCache:
+    """Compiled models keyed on a hash of their source
+
+    Re-running unchanged source returns the already compiled model.
+
+    :param maxsize: number of models to keep
+    :param backends: backends to try, defaults to :func:`available_backends`
+    """
+
+    def __init__(self, maxsize: int = 64, backends: Optional[Sequence[str]] = None):
+        self._models = OrderedDict()
+        self._maxsize = maxsize
+        self.backends = backends
+
+    @staticmethod
+    def key(source: str) -> str:
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    def get(self, func: Callable, source: Optional[str]) -> CompiledModel:
+        """Compiled version of ``func``, compiling it on first use
+
+        :param func: plain python model function
+        :param source: source text of its ``def``
+        """
+        key = self.key(source) if source is not None else id(func)
+        model = self._models.get(key)
+        if model is None or (source is None and model.python is not func):
+            model = self._models[key] = CompiledModel(func, source, self.backends)
+            while len(self._models) > self._maxsize:
+                self._models.popitem(last=False)
+        else:
+            self._models.move_to_end(key)
+        return model
@@ -1,46 +1,592 @@
+"""Reading and writing of ``.actfit`` files
+
+An ``.actfit`` file is a small binary container::
+
+    magic        8 bytes   b"\\x93ACTFIT\\n"
+    version      uint16    little-endian format version
+    reserved     uint16
+    header size  uint32    little-endian length of the JSON header
+    header       JSON      function source, parameters, bounds, covariance,
+                           statistics, provenance and the array directory
+    padding                up to the next multiple of :data:`ALIGNMENT`
+    arrays                 raw little-endian blocks, each aligned
+
+Everything but the arrays lives in the header, so reading parameters or
+metadata never touches the array blocks, and the blocks can be
+memory-mapped. Files written by older versions of ActFit are dill pickles
+of ``(func, params)`` and are still read by :func:`load`.
+
+Many fits can be collected in one archive file, see :class:`Archive`.
+"""
+
+from datetime import datetime, timezone
+import inspect
 from io import BytesIO
-from typing import Tuple, Dict, Callable, Union
+import json
+import os
+import platform
+import struct
+import textwrap
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+__all__ = (
+    "Archive",
+    "FitFile",
+    "dump",
+    "dumps",
+    "load",
+    "load_params",
+    "loads",
+    "read",
+    "reads",
+)
+
+
+MAGIC = b"\x93ACTFIT\n"
+ARCHIVE_MAGIC = b"\x93ACTARC\n"
+VERSION = 1
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct("<8sHHI")
+_TRAILER = struct.Struct("<QQ8s")
+
+PathOrFile = Union[str, os.PathLike, BinaryIO]
+
 
-import dill
+def _padding(offset: int) -> int:
+    return -offset % ALIGNMENT
 
-__all__ = ("dump", "dumps", "load", "loads")
+
+def _function_source(func: Callable, source: Optional[str]) -> str:
+    if source is None:
+        try:
+            source = textwrap.dedent(inspect.getsource(func))
+        except (OSError, TypeError):
+            raise ValueError(
+                f"source of {getattr(func, '__name__', func)!r} is not available"
+            )
+    return source
+
+
+def _provenance() -> Dict[str, str]:
+    from . import __version__
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "actfit": __version__,
+        "numpy": np.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def _little_endian(array) -> np.ndarray:
+    array = np.asarray(array)
+    if array.dtype.kind not in "biufc":
+        raise TypeError(f"can't store arrays of type {array.dtype}")
+    return np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
 
 
 def dump(
-    func: Callable, params: Dict[str, float], file: BytesIO, *args, **kwargs
+    func: Callable,
+    params: Dict[str, float],
+    file: BinaryIO,
+    *,
+    bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+    covariance=None,
+    stats: Optional[Dict[str, Any]] = None,
+    xs=None,
+    data=None,
+    source: Optional[str] = None,
+    extra: Optional[Dict[str, Any]] = None,
 ) -> None:
     """Dump a fit to file
-    
+
     :param func: fitted function
     :param params: fitted parameters
     :param file: file object to dump into
+    :param bounds: parameter bounds
+    :param covariance: parameter covariance matrix
+    :param stats: fit statistics
+    :param xs: independent variable to store alongside the fit
+    :param data: dependent data to store alongside the fit
+    :param source: source text of ``func``, looked up if not given
+    :param extra: further JSON serializable metadata
+    :raises ValueError: if ``source`` isn't given and can't be looked up,
+        e.g. for a lambda
     """
-    dill.dump((func, params), file, *args, **kwargs)
+    arrays = {
+        name: _little_endian(array)
+        for name, array in (("xs", xs), ("data", data))
+        if array is not None
+    }
+    header = {
+        "function": {
+            "name": getattr(func, "__name__", None),
+            "source": _function_source(func, source),
+        },
+        "params": {name: float(value) for name, value in params.items()},
+        "bounds": {
+            name: [float(lower), float(upper)]
+            for name, (lower, upper) in (bounds or {}).items()
+        },
+        "covariance": None if covariance is None else np.asarray(covariance).tolist(),
+        "stats": stats or {},
+        "provenance": _provenance(),
+        "extra": extra or {},
+        "arrays": {},
+    }
+
+    # array offsets depend on the header size and vice versa, so fix the
+    # directory with placeholder offsets first and pad the header instead
+    for name, array in arrays.items():
+        header["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": 0,
+        }
+    size = len(json.dumps(header).encode("utf-8")) + 32 * len(arrays)
+    offset = _PREAMBLE.size + size
+    offset += _padding(offset)
+    for name, array in arrays.items():
+        header["arrays"][name]["offset"] = offset
+        offset += array.nbytes + _padding(array.nbytes)
+
+    encoded = json.dumps(header).encode("utf-8")
+    encoded += b" " * (size - len(encoded))
+    file.write(_PREAMBLE.pack(MAGIC, VERSION, 0, len(encoded)))
+    file.write(encoded)
+    written = _PREAMBLE.size + len(encoded)
+    for array in arrays.values():
+        file.write(b"\0" * _padding(written))
+        written += _padding(written)
+        file.write(memoryview(array.reshape(-1)).cast("B"))
+        written += array.nbytes
 
 
-def dumps(func: Callable, params: Dict[str, float], *args, **kwargs) -> bytes:
+def dumps(func: Callable, params: Dict[str, float], **kwargs) -> bytes:
     """Dump a fit to bytes/str
-    
+
     :param func: fitted function
     :param params: fitted parameters
+    :param kwargs: see :func:`dump`
     """
     file = BytesIO()
-    dump(func, params, file, *args, **kwargs)
+    dump(func, params, file, **kwargs)
     return file.getvalue()
 
 
-def load(file: BytesIO, *args, **kwargs) -> Tuple[Callable, Dict[str, float]]:
+class FitFile:
+    """A fit read from an ``.actfit`` file
+
+    Only the header is read on construction; arrays are read, or
+    memory-mapped if the file is on disk, on first access.
+
+    :param header: decoded JSON header
+    :param source: path of the file, or a file object positioned anywhere
+    :param start: offset of the container within ``source``
+    """
+
+    def __init__(self, header: Dict[str, Any], source, start: int = 0):
+        self.header = header
+        self._source = source
+        self._start = start
+        self._arrays = {}
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.header["function"]["name"]
+
+    @property
+    def source(self) -> str:
+        return self.header["function"]["source"]
+
+    @property
+    def params(self) -> Dict[str, float]:
+        return dict(self.header["params"])
+
+    @property
+    def bounds(self) -> Dict[str, Tuple[float, float]]:
+        return {name: tuple(bound) for name, bound in self.header["bounds"].items()}
+
+    @property
+    def covariance(self) -> Optional[np.ndarray]:
+        covariance = self.header["covariance"]
+        return None if covariance is None else np.array(covariance, dtype=float)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return self.header["stats"]
+
+    @property
+    def provenance(self) -> Dict[str, str]:
+        return self.header["provenance"]
+
+    @property
+    def extra(self) -> Dict[str, Any]:
+        return self.header.get("extra", {})
+
+    @property
+    def array_names(self):
+        return list(self.header["arrays"])
+
+    def array(self, name: str) -> np.ndarray:
+        """Stored array, memory-mapped when the file is on disk
+
+        :param name: ``"xs"`` or ``"data"``
+        """
+        if name not in self._arrays:
+            entry = self.header["arrays"][name]
+            dtype, shape = np.dtype(entry["dtype"]), tuple(entry["shape"])
+            offset = self._start + entry["offset"]
+            if isinstance(self._source, (str, os.PathLike)):
+                array = np.memmap(
+                    self._source, dtype=dtype, mode="r", offset=offset, shape=shape
+                )
+            else:
+                self._source.seek(offset)
+                count = int(np.prod(shape))
+                buffer = self._source.read(count * dtype.itemsize)
+                array = np.frombuffer(buffer, dtype=dtype, count=count)
+                array = array.reshape(shape)
+            self._arrays[name] = array
+        return self._arrays[name]
+
+    @property
+    def xs(self) -> Optional[np.ndarray]:
+        return self.array("xs") if "xs" in self.header["arrays"] else None
+
+    @property
+    def data(self) -> Optional[np.ndarray]:
+        return self.array("data") if "data" in self.header["arrays"] else None
+
+    def function(self, globals_: Optional[Dict[str, Any]] = None) -> Callable:
+        """Compile the stored function source
+
+        This executes the stored source, only call it for trusted files.
+
+        :param globals_: globals to execute the source in, defaults to numpy
+            imported as ``np``
+        """
+        namespace = dict(globals_ if globals_ is not None else {"np": np})
+        exec(compile(self.source, "<actfit>", "exec"), namespace)
+        return namespace[self.name]
+
+
+def _read_header(file: BinaryIO) -> Dict[str, Any]:
+    preamble = file.read(_PREAMBLE.size)
+    if len(preamble) < _PREAMBLE.size:
+        raise ValueError("not an .actfit file")
+    magic, version, _, size = _PREAMBLE.unpack(preamble)
+    if magic != MAGIC:
+        raise ValueError("not an .actfit file")
+    if version > VERSION:
+        raise ValueError(f".actfit format version {version} is not supported")
+    return json.loads(file.read(size).decode("utf-8"))
+
+
+def read(file: PathOrFile) -> FitFile:
+    """Read the header of an ``.actfit`` file
+
+    :param file: path or file object to read from
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            return FitFile(_read_header(f), file)
+    start = file.tell()
+    header = _read_header(file)
+    path = getattr(file, "name", None)
+    if isinstance(path, str) and os.path.isfile(path):
+        return FitFile(header, path, start)
+    return FitFile(header, file, start)
+
+
+def reads(s: bytes) -> FitFile:
+    """Read an ``.actfit`` file from bytes
+
+    :param s: bytes to read from
+    """
+    return read(BytesIO(s))
+
+
+def _is_container(file: BinaryIO) -> bool:
+    start = file.tell()
+    magic = file.read(len(MAGIC))
+    file.seek(start)
+    return magic == MAGIC
+
+
+def load(file: BinaryIO, *args, **kwargs) -> Tuple[Callable, Dict[str, float]]:
     """Load a fit from file
-    
+
+    Legacy dill pickles are still accepted; like the stored function source
+    they execute code, so only load trusted files. Use :func:`read` to
+    inspect parameters and metadata without executing anything.
+
     :param file: file to load from
     """
+    if _is_container(file):
+        fit = read(file)
+        return fit.function(), fit.params
+    import dill
+
     return dill.load(file, *args, **kwargs)
 
 
 def loads(s: Union[str, bytes], *args, **kwargs) -> Tuple[Callable, Dict[str, float]]:
     """Load a fit from str/bytes
-    
+
     :param s: byte-/string to load from
     """
     file = BytesIO(s)
     return load(file, *args, **kwargs)
+
+
+class Archive:
+    """Many fits appended to one indexed file
+
+    The archive is a preamble like the one of ``.actfit`` files, the fits as
+    complete, aligned ``.actfit`` containers one after the other, JSON index
+    records of their keys, offsets, function names and parameters, and a
+    trailer locating the last record. Nothing committed is overwritten:
+    fits are appended after the last trailer, and a flush writes a record of
+    just the entries added since, listing where the earlier records are, and
+    a new trailer. After a crash the archive opens with the fits of the last
+    complete record.
+
+    Like a binary counter, a record absorbs the records before it that hold
+    no more entries than itself, so an index of ``n`` entries is about
+    ``log2(n)`` records and every entry is rewritten about as often, however
+    often the archive is flushed. Opening reads only the last record; the
+    others are read the first time the index is needed. Still, batch appends
+    within one ``with`` block to write one record per batch::
+
+        with Archive("campaign.actarc", "a") as archive:
+            for key, params in fits.items():
+                archive.append(key, func, params, source=source)
+
+    :param path: archive path
+    :param mode: ``"r"`` to read, ``"a"`` to append, creating the archive if
+        necessary, or ``"w"`` to start a new one
+    """
+
+    def __init__(self, path: Union[str, os.PathLike], mode: str = "r"):
+        if mode not in ("r", "a", "w"):
+            raise ValueError(f"invalid mode {mode!r}")
+        self.path = path
+        self.mode = mode
+        self._added = {}
+        self._entries = None
+        if mode == "w" or (mode == "a" and not os.path.exists(path)):
+            self._file = open(path, "w+b")
+            self._file.write(_PREAMBLE.pack(ARCHIVE_MAGIC, VERSION, 0, 0))
+            self._records = []
+            self._end = _PREAMBLE.size
+            self._dirty = True
+            self.flush()
+        else:
+            self._file = open(path, "rb" if mode == "r" else "r+b")
+            self._records, self._end = _read_index(self._file)
+            self._dirty = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def keys(self):
+        return self.index.keys()
+
+    @property
+    def index(self) -> Dict[str, Dict[str, Any]]:
+        """Index entries by key, without touching the stored fits"""
+        if self._entries is None:
+            self._entries = {}
+            for record in self._records:
+                self._entries.update(_record_entries(self._file, record))
+            self._entries.update(self._added)
+        return self._entries
+
+    def __getitem__(self, key: str) -> FitFile:
+        offset = self.index[key]["offset"]
+        self._file.seek(offset)
+        return FitFile(_read_header(self._file), self.path, offset)
+
+    def append(
+        self, key: str, func: Callable, params: Dict[str, float], **kwargs
+    ) -> None:
+        """Append a fit, replacing the index entry of an existing key
+
+        :param key: key to access the fit by
+        :param func: fitted function
+        :param params: fitted parameters
+        :param kwargs: passed on to :func:`dump`
+        """
+        if self.mode == "r":
+            raise ValueError("archive is opened read-only")
+        # after the last trailer, which stays valid until the next flush
+        offset = self._end + _padding(self._end)
+        self._file.seek(self._end)
+        self._file.write(b"\0" * (offset - self._end))
+        try:
+            dump(func, params, self._file, **kwargs)
+        except BaseException:
+            self._file.truncate(self._end)
+            raise
+        self._end = self._file.tell()
+        self._added[str(key)] = {
+            "offset": offset,
+            "function": getattr(func, "__name__", None),
+            "params": {name: float(value) for name, value in params.items()},
+        }
+        if self._entries is not None:
+            self._entries[str(key)] = self._added[str(key)]
+        self._dirty = True
+
+    def flush(self) -> None:
+        """Write an index record of the fits appended since the last one and
+        a trailer after them, and sync them"""
+        if not self._dirty:
+            return
+        entries = self._added
+        while self._records and self._records[-1][2] <= len(entries):
+            # the newer entry of a key replaced since wins
+            entries = {**_record_entries(self._file, self._records.pop()), **entries}
+        index = {"entries": entries, "previous": self._records}
+        record = json.dumps(index).encode("utf-8")
+        offset = self._end
+        self._file.seek(offset)
+        self._file.write(record)
+        self._file.write(_TRAILER.pack(offset, len(record), ARCHIVE_MAGIC))
+        self._end = self._file.tell()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        # e.g. a fit whose append didn't finish before a crash
+        self._file.truncate()
+        self._records.append([offset, len(record), len(entries)])
+        self._added = {}
+        self._dirty = False
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        if self.mode != "r":
+            self.flush()
+        self._file.close()
+
+
+def _read_record(file: BinaryIO, offset: int, size: int) -> Optional[dict]:
+    file.seek(offset)
+    try:
+        record = json.loads(file.read(size).decode("utf-8"))
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) and "entries" in record else None
+
+
+def _record_entries(file: BinaryIO, record: List[int]) -> Dict[str, Dict[str, Any]]:
+    """Entries of an index record ``[offset, size, count]`` listed by a
+    later one"""
+    offset, size, _ = record
+    found = _read_record(file, offset, size)
+    if found is None:
+        # synced before the record listing it, so not torn by a crash
+        raise ValueError("archive index is damaged")
+    return found["entries"]
+
+
+def _read_trailer(file: BinaryIO, stop: int) -> Optional[List[List[int]]]:
+    """Index records ``[offset, size, count]``, oldest first, of a trailer
+    ending at ``stop``, ``None`` if there isn't a complete trailer"""
+    if stop - _TRAILER.size < _PREAMBLE.size:
+        return None
+    file.seek(stop - _TRAILER.size)
+    offset, size, magic = _TRAILER.unpack(file.read(_TRAILER.size))
+    if (
+        magic != ARCHIVE_MAGIC
+        or offset < _PREAMBLE.size
+        or offset + size != stop - _TRAILER.size
+    ):
+        return None
+    record = _read_record(file, offset, size)
+    if record is None:
+        return None
+    previous = record.get("previous") or []
+    return previous + [[offset, size, len(record["entries"])]]
+
+
+def _read_index(file: BinaryIO) -> Tuple[List[List[int]], int]:
+    """Index records ``[offset, size, count]`` of an archive, oldest first,
+    and the end of the trailer
+
+    The trailer is usually at the end of the file. If an append didn't
+    finish, e.g. after a crash, the last complete trailer before it is used.
+    """
+    file.seek(0)
+    magic, version, _, _ = _PREAMBLE.unpack(file.read(_PREAMBLE.size))
+    if magic != ARCHIVE_MAGIC:
+        raise ValueError("not an ActFit archive")
+    if version > VERSION:
+        raise ValueError(f"archive format version {version} is not supported")
+    stop = file.seek(0, os.SEEK_END)
+    records = _read_trailer(file, stop)
+    if records is not None:
+        return records, stop
+    block = 1 << 20
+    while stop > _PREAMBLE.size:
+        start = max(stop - block, _PREAMBLE.size)
+        file.seek(start)
+        chunk = file.read(stop - start)
+        end = len(chunk)
+        while True:
+            found = chunk.rfind(ARCHIVE_MAGIC, 0, end)
+            if found < 0:
+                break
+            records = _read_trailer(file, start + found + len(ARCHIVE_MAGIC))
+            if records is not None:
+                return records, start + found + len(ARCHIVE_MAGIC)
+            end = found + len(ARCHIVE_MAGIC) - 1
+        if start == _PREAMBLE.size:
+            break
+        # magic straddling the chunks is found in the next one
+        stop = start + len(ARCHIVE_MAGIC) - 1
+    raise ValueError("archive index is missing")
+
+
+def load_params(path: Union[str, os.PathLike]) -> np.ndarray:
+    """Parameters of every fit in an archive as one structured array
+
+    Only the index is read. The array has a ``key`` field followed by one
+    ``float64`` field per parameter name found in the archive; parameters a
+    fit doesn't have are ``nan``.
+
+    :param path: archive path
+    """
+    entries = {}
+    with open(path, "rb") as file:
+        records, _ = _read_index(file)
+        for record in records:
+            entries.update(_record_entries(file, record))
+    names = list(
+        dict.fromkeys(name for entry in entries.values() for name in entry["params"])
+    )
+    width = max((len(key) for key in entries), default=1)
+    result = np.full(
+        len(entries), np.nan, dtype=[("key", f"U{width}")] + [(n, "f8") for n in names]
+    )
+    result["key"] = list(entries)
+    for name in names:
+        result[name] = [entry["params"].get(name, np.nan) for entry in entries.values()]
+    return result
@@ -0,0 +1,275 @@
+from concurrent.futures import ProcessPoolExecutor
+import inspect
+import os
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple, Union
+import warnings
+
+import numpy as np
+
+__all__ = (
+    "LOSSES",
+    "active_fit",
+    "batch_fit",
+    "BatchResult",
+    "noise_scale",
+    "parameter_names",
+)
+
+
+#: losses of ``scipy.optimize.least_squares``, all but ``"linear"`` are robust
+LOSSES = ("linear", "soft_l1", "huber", "cauchy", "arctan")
+
+
+Bounds = Tuple[Union[float, Sequence[float]], Union[float, Sequence[float]]]
+
+
+class BatchResult(NamedTuple):
+    params: np.ndarray
+    covariances: np.ndarray
+    success: np.ndarray
+
+
+def parameter_names(func: Callable) -> List[str]:
+    """Names of the fit parameters of a model function
+
+    :param func: model function ``func(xs, *params)``
+    """
+    return list(inspect.signature(func).parameters)[1:]
+
+
+def noise_scale(xs, data) -> float:
+    """Robust estimate of the noise level of data
+
+    The median absolute deviation of the differences between neighbouring
+    samples, ordered along a one-dimensional ``xs``, is insensitive to both a
+    smooth underlying signal and a minority of outliers.
+
+    :param xs: independent variable
+    :param data: dependent data
+    """
+    data = np.asarray(data, dtype=float).ravel()
+    if np.ndim(xs) == 1 and len(xs) == len(data):
+        xs = np.asarray(xs)
+        if not np.all(xs[1:] >= xs[:-1]):
+            data = data[np.argsort(xs, kind="stable")]
+    differences = np.diff(data)
+    differences = differences[np.isfinite(differences)]
+    if len(differences) == 0:
+        return 1.0
+    deviation = np.median(np.abs(differences - np.median(differences)))
+    scale = 1.4826 * deviation / np.sqrt(2)
+    return float(scale) if scale > 0 else 1.0
+
+
+def active_fit(
+    func: Callable,
+    xs,
+    data,
+    p0: Optional[Sequence[float]] = None,
+    bounds: Bounds = (-np.inf, np.inf),
+    callback: Optional[Callable] = None,
+    sigma=None,
+    absolute_sigma: bool = False,
+    loss: str = "linear",
+    f_scale: Optional[float] = None,
+    **kwargs,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Fit a function to data, like ``scipy.optimize.curve_fit``
+
+    Robust losses are minimized by ``scipy.optimize.least_squares`` through
+    ``curve_fit``'s ``"trf"`` method, which down-weights residuals larger
+    than ``f_scale`` so outliers don't need to be masked by hand.
+
+    Data with more than one dimension, e.g. an image with ``xs`` a
+    ``(2, H, W)`` meshgrid, is fitted ravelled along with the model values,
+    ``sigma`` and a Jacobian. Ravelling contiguous arrays doesn't copy them.
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable
+    :param data: dependent data
+    :param p0: initial parameters
+    :param bounds: ``(lower, upper)`` parameter bounds
+    :param callback: called as ``callback(nfev, params, ys)`` after every model
+        evaluation; raising from it aborts the fit
+    :param sigma: uncertainties of ``data``
+    :param absolute_sigma: whether ``sigma`` is absolute rather than relative
+    :param loss: one of :data:`LOSSES`
+    :param f_scale: residual at which a robust loss sets in, in units of
+        ``sigma`` if given; defaults to 1 with ``sigma`` and to
+        :func:`noise_scale` without
+    :param kwargs: passed on to ``curve_fit``
+    :return: optimal parameters and their covariance
+    """
+    if loss not in LOSSES:
+        raise ValueError(f"unknown loss {loss!r}, expected one of {LOSSES}")
+    if loss != "linear":
+        if f_scale is None:
+            f_scale = 1.0 if sigma is not None else noise_scale(xs, data)
+        kwargs.update(method="trf", loss=loss, f_scale=f_scale)
+
+    if callback is not None:
+        model = func
+        nfev = 0
+
+        def func(xs, *params):
+            nonlocal nfev
+            ys = model(xs, *params)
+            nfev += 1
+            callback(nfev, params, ys)
+            return ys
+
+    data = np.asarray(data)
+    if data.ndim > 1:
+        # the callback above still sees model values shaped like the data
+        shaped, shape = func, data.shape
+
+        def func(xs, *params):
+            return np.ravel(shaped(xs, *params))
+
+        if sigma is not None and np.shape(sigma) == shape:
+            sigma = np.ravel(sigma)
+        jac = kwargs.get("jac")
+        if callable(jac):
+            kwargs["jac"] = lambda xs, *params: np.reshape(
+                jac(xs, *params), (data.size, -1)
+            )
+        data = data.ravel()
+
+    import scipy.optimize as opt
+
+    return opt.curve_fit(
+        func,
+        xs,
+        data,
+        p0=p0,
+        bounds=bounds,
+        sigma=sigma,
+        absolute_sigma=absolute_sigma,
+        **kwargs,
+    )
+
+
+_worker_state = None
+
+
+def _init_batch_worker(func, xs, data, p0, bounds, kwargs):
+    import dill
+
+    global _worker_state
+    _worker_state = (dill.loads(func), xs, data, p0, bounds, kwargs)
+
+
+def _fit_rows(rows):
+    import scipy.optimize as opt
+
+    func, xs, data, p0, bounds, kwargs = _worker_state
+    n = len(p0)
+    params = np.full((len(rows), n), np.nan)
+    covariances = np.full((len(rows), n, n), np.nan)
+    success = np.zeros(len(rows), dtype=bool)
+    for i, (row_xs, row_data, row_p0) in enumerate(rows):
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", opt.OptimizeWarning)
+                params[i], covariances[i] = active_fit(
+                    func,
+                    xs if row_xs is None else row_xs,
+                    data if row_data is None else row_data,
+                    p0=p0 if row_p0 is None else row_p0,
+                    bounds=bounds,
+                    **kwargs,
+                )
+        except (RuntimeError, ValueError):
+            continue
+        success[i] = True
+    return params, covariances, success
+
+
+def _fit_pool(func, xs, data, rows, p0, bounds, processes, chunksize, kwargs):
+    """Fit ``(xs, data, p0)`` rows in chunks across a process pool
+
+    ``None`` entries in a row fall back to the shared ``xs``/``data``/``p0``.
+    """
+    import dill
+
+    n = len(rows)
+    processes = processes or os.cpu_count() or 1
+    chunksize = chunksize or max(1, -(-n // (processes * 4)))
+    chunks = [rows[i : i + chunksize] for i in range(0, n, chunksize)]
+    initargs = (dill.dumps(func), xs, data, p0, bounds, kwargs)
+
+    if processes == 1 or len(chunks) == 1:
+        _init_batch_worker(*initargs)
+        results = list(map(_fit_rows, chunks))
+    else:
+        with ProcessPoolExecutor(
+            min(processes, len(chunks)),
+            initializer=_init_batch_worker,
+            initargs=initargs,
+        ) as pool:
+            results = list(pool.map(_fit_rows, chunks))
+
+    if not results:
+        p = len(p0)
+        return BatchResult(
+            np.empty((0, p)), np.empty((0, p, p)), np.empty(0, dtype=bool)
+        )
+    params, covariances, success = zip(*results)
+    return BatchResult(
+        np.concatenate(params), np.concatenate(covariances), np.concatenate(success)
+    )
+
+
+def _per_dataset(xs, datasets):
+    if len(datasets) == 0 or len(xs) != len(datasets):
+        return False
+    if isinstance(xs, (list, tuple)):
+        return np.ndim(xs[0]) >= np.ndim(datasets[0])
+    return np.ndim(xs) > np.ndim(datasets[0])
+
+
+def batch_fit(
+    func: Callable,
+    xs,
+    datasets,
+    p0: Optional[Sequence[float]] = None,
+    bounds: Bounds = (-np.inf, np.inf),
+    processes: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    **kwargs,
+) -> BatchResult:
+    """Fit the same function to many datasets across a process pool
+
+    :param func: model function ``func(xs, *params)``, must be serializable
+        with dill
+    :param xs: independent variable shared by all datasets, or one per dataset
+        (a list, or an array with one more dimension than a dataset)
+    :param datasets: 2D array with one dataset per row, or a sequence of arrays
+    :param p0: initial parameters, defaults to ones
+    :param bounds: ``(lower, upper)`` parameter bounds
+    :param processes: number of worker processes, defaults to the number of
+        CPUs; ``1`` fits in the calling process
+    :param chunksize: datasets per task, defaults to an even split into four
+        tasks per worker
+    :param kwargs: passed on to ``curve_fit``
+    :return: stacked parameters ``(n, p)``, covariances ``(n, p, p)`` and
+        convergence flags ``(n,)``
+    """
+    if p0 is None:
+        p0 = np.ones(len(parameter_names(func)))
+    p0 = np.asarray(p0, dtype=float)
+
+    n = len(datasets)
+    per_row_xs = _per_dataset(xs, datasets)
+    rows = [(xs[i] if per_row_xs else None, datasets[i], None) for i in range(n)]
+    return _fit_pool(
+        func,
+        None if per_row_xs else xs,
+        None,
+        rows,
+        p0,
+        bounds,
+        processes,
+        chunksize,
+        kwargs,
+    )
@@ -0,0 +1,214 @@
+from typing import Callable, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from .fit import LOSSES, Bounds, _per_dataset, noise_scale, parameter_names
+
+__all__ = ("GlobalResult", "global_fit")
+
+
+class GlobalResult(NamedTuple):
+    params: np.ndarray
+    errors: np.ndarray
+    covariance: np.ndarray
+    shared: np.ndarray
+    success: bool
+
+    def columns(self, index: int) -> np.ndarray:
+        """Positions of dataset ``index``'s parameters in the packed vector"""
+        return _columns(self.shared, index)
+
+    def dataset_covariance(self, index: int) -> np.ndarray:
+        """Covariance of the parameters of dataset ``index``"""
+        columns = self.columns(index)
+        return self.covariance[np.ix_(columns, columns)]
+
+
+def _columns(shared, index):
+    n_shared = int(shared.sum())
+    n_local = len(shared) - n_shared
+    columns = np.empty(len(shared), dtype=int)
+    columns[shared] = np.arange(n_shared)
+    columns[~shared] = n_shared + index * n_local + np.arange(n_local)
+    return columns
+
+
+def _shared_mask(names, shared):
+    if len(shared) == len(names) and all(
+        isinstance(s, (bool, np.bool_)) for s in shared
+    ):
+        return np.array(shared, dtype=bool)
+    unknown = set(shared) - set(names)
+    if unknown:
+        raise ValueError(f"unknown parameters {sorted(unknown)}")
+    return np.array([name in shared for name in names], dtype=bool)
+
+
+def _covariance(jac, cost, n_residuals, absolute_sigma):
+    import scipy.sparse as sparse
+
+    jac = sparse.csr_matrix(jac) if not sparse.issparse(jac) else jac
+    hessian = (jac.T @ jac).toarray()
+    # Moore-Penrose inverse dropping negligible singular values, as curve_fit
+    _, s, vt = np.linalg.svd(hessian)
+    threshold = np.finfo(float).eps * max(hessian.shape) * (s[0] if len(s) else 0)
+    s, vt = s[s > threshold], vt[: np.sum(s > threshold)]
+    covariance = (vt.T / s) @ vt
+    if not absolute_sigma:
+        dof = n_residuals - hessian.shape[0]
+        covariance = covariance * (2 * cost / dof if dof > 0 else np.inf)
+    return covariance
+
+
+def global_fit(
+    func: Callable,
+    xs,
+    datasets: Sequence,
+    shared: Sequence[Union[str, bool]],
+    p0=None,
+    bounds: Bounds = (-np.inf, np.inf),
+    sigma=None,
+    absolute_sigma: bool = False,
+    loss: str = "linear",
+    f_scale: Optional[float] = None,
+    jac: Optional[Callable] = None,
+    callback: Optional[Callable] = None,
+    **kwargs,
+) -> GlobalResult:
+    """Fit one model to several datasets at once with shared parameters
+
+    Shared parameters take one value for all datasets, the others one value
+    per dataset. All residuals are stacked into one vector and solved by
+    ``scipy.optimize.least_squares`` with the block-sparse Jacobian
+    structure this implies, so each Jacobian costs as many evaluations of
+    every dataset as there are parameters, not parameters times datasets.
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable shared by all datasets, or one per dataset
+    :param datasets: sequence of dependent data arrays
+    :param shared: names of the shared parameters, or one flag per parameter
+    :param p0: initial parameters, one row for all datasets or one per dataset
+    :param bounds: ``(lower, upper)`` parameter bounds, scalars or one per
+        parameter
+    :param sigma: uncertainties, a scalar, one array for all datasets or one
+        per dataset
+    :param absolute_sigma: whether ``sigma`` is absolute rather than relative
+    :param loss: one of :data:`~ActFit.fit.LOSSES`
+    :param f_scale: residual at which a robust loss sets in, see
+        :func:`~ActFit.fit.active_fit`
+    :param jac: model Jacobian ``jac(xs, *params)`` of shape ``(len(xs),
+        n_params)``, finite differences if not given
+    :param callback: called as ``callback(nfev, packed_params, residuals)``
+        after every evaluation of all datasets; raising from it aborts the fit
+    :param kwargs: passed on to ``least_squares``
+    """
+    import scipy.optimize as opt
+    import scipy.sparse as sparse
+
+    if loss not in LOSSES:
+        raise ValueError(f"unknown loss {loss!r}, expected one of {LOSSES}")
+    names = parameter_names(func)
+    n, n_datasets = len(names), len(datasets)
+    shared = _shared_mask(names, shared)
+    n_shared = int(shared.sum())
+    n_local = n - n_shared
+
+    xs_list = list(xs) if _per_dataset(xs, datasets) else [xs] * n_datasets
+    data_list = [np.asarray(data, dtype=float).ravel() for data in datasets]
+    if sigma is None or np.ndim(sigma) == 0 or (
+        isinstance(sigma, np.ndarray) and sigma.ndim == 1
+    ):
+        sigma_list = [sigma] * n_datasets
+    else:
+        sigma_list = list(sigma)
+    weights = [
+        None if s is None else 1 / np.broadcast_to(np.asarray(s, float), d.shape)
+        for s, d in zip(sigma_list, data_list)
+    ]
+    sizes = [len(data) for data in data_list]
+    stops = np.cumsum(sizes)
+    starts = stops - sizes
+    n_residuals = int(stops[-1]) if n_datasets else 0
+
+    p0 = np.ones(n) if p0 is None else np.asarray(p0, dtype=float)
+    p0 = np.broadcast_to(p0, (n_datasets, n))
+    packed0 = np.concatenate([p0[0, shared], p0[:, ~shared].ravel()])
+    lower, upper = (np.broadcast_to(np.asarray(b, float), (n,)) for b in bounds)
+    packed_bounds = tuple(
+        np.concatenate([b[shared], np.tile(b[~shared], n_datasets)])
+        for b in (lower, upper)
+    )
+    packed0 = np.clip(packed0, *packed_bounds)
+
+    def unpack(packed):
+        full = np.empty((n_datasets, n))
+        full[:, shared] = packed[:n_shared]
+        full[:, ~shared] = packed[n_shared:].reshape(n_datasets, n_local)
+        return full
+
+    nfev = 0
+
+    def residuals(packed):
+        nonlocal nfev
+        out = np.empty(n_residuals)
+        for i, params in enumerate(unpack(packed)):
+            r = np.ravel(func(xs_list[i], *params)) - data_list[i]
+            if weights[i] is not None:
+                r = r * weights[i]
+            out[starts[i] : stops[i]] = r
+        nfev += 1
+        if callback is not None:
+            callback(nfev, packed, out)
+        return out
+
+    # dataset i's residuals depend on the shared and on its own local columns
+    rows = np.concatenate(
+        [np.repeat(np.arange(start, stop), n) for start, stop in zip(starts, stops)]
+    )
+    columns = np.concatenate(
+        [np.tile(_columns(shared, i), size) for i, size in enumerate(sizes)]
+    )
+    shape = (n_residuals, len(packed0))
+
+    if jac is not None:
+
+        def jacobian(packed):
+            values = []
+            for i, params in enumerate(unpack(packed)):
+                block = np.asarray(jac(xs_list[i], *params)).reshape(sizes[i], n)
+                if weights[i] is not None:
+                    block = block * weights[i][:, None]
+                values.append(block.ravel())
+            return sparse.csr_matrix((np.concatenate(values), (rows, columns)), shape)
+
+        kwargs.update(jac=jacobian)
+    else:
+        kwargs.update(
+            jac="2-point",
+            jac_sparsity=sparse.csr_matrix(
+                (np.ones(len(rows)), (rows, columns)), shape
+            ),
+        )
+
+    if loss != "linear" and f_scale is None:
+        f_scale = (
+            1.0
+            if sigma is not None
+            else np.median([noise_scale(x, d) for x, d in zip(xs_list, data_list)])
+        )
+    result = opt.least_squares(
+        residuals,
+        packed0,
+        bounds=packed_bounds,
+        method="trf",
+        tr_solver="lsmr",
+        loss=loss,
+        f_scale=1.0 if f_scale is None else f_scale,
+        **kwargs,
+    )
+
+    covariance = _covariance(result.jac, result.cost, n_residuals, absolute_sigma)
+    params = unpack(result.x)
+    errors = np.sqrt(np.abs(np.diag(covariance)))
+    errors = np.stack([errors[_columns(shared, i)] for i in range(n_datasets)])
+    return GlobalResult(params, errors, covariance, shared, bool(result.success))
@@ -0,0 +1,374 @@
+import ast
+import copy
+import time
+from typing import Callable, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .fit import parameter_names
+from .source import UnsupportedSource, argument_names, return_expression
+
+__all__ = (
+    "Jacobian",
+    "NotDifferentiable",
+    "build_jacobian",
+    "complex_step_jacobian",
+    "symbolic_jacobian",
+)
+
+
+class NotDifferentiable(UnsupportedSource):
+    pass
+
+
+class Jacobian(NamedTuple):
+    """Jacobian of a model with respect to its parameters
+
+    :param func: ``func(xs, *params)`` returning an ``(n, p)`` array, or
+        ``None`` if finite differences have to be used
+    :param method: ``"symbolic"``, ``"complex-step"`` or ``"finite-difference"``
+    :param evaluations: model evaluations needed per Jacobian
+    """
+
+    func: Optional[Callable]
+    method: str
+    evaluations: int
+
+
+def _expr(src):
+    return ast.parse(src, mode="eval").body
+
+
+def _number(node):
+    if type(node).__name__ not in ("Constant", "Num"):
+        return None
+    value = getattr(node, "value", getattr(node, "n", None))
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return value
+
+
+def _const(value):
+    return _expr(repr(float(value)))
+
+
+def _bin(left, op, right):
+    return ast.BinOp(left=left, op=op, right=right)
+
+
+def _call(name, *args):
+    return ast.Call(
+        func=ast.Attribute(
+            value=ast.Name(id="__np", ctx=ast.Load()), attr=name, ctx=ast.Load()
+        ),
+        args=list(args),
+        keywords=[],
+    )
+
+
+def _neg(a):
+    value = _number(a)
+    if value is not None:
+        return _const(-value)
+    return ast.UnaryOp(op=ast.USub(), operand=a)
+
+
+def _add(a, b):
+    if _number(a) == 0:
+        return b
+    if _number(b) == 0:
+        return a
+    return _bin(a, ast.Add(), b)
+
+
+def _sub(a, b):
+    if _number(b) == 0:
+        return a
+    if _number(a) == 0:
+        return _neg(b)
+    return _bin(a, ast.Sub(), b)
+
+
+def _mul(a, b):
+    if _number(a) == 0 or _number(b) == 0:
+        return _const(0)
+    if _number(a) == 1:
+        return b
+    if _number(b) == 1:
+        return a
+    return _bin(a, ast.Mult(), b)
+
+
+def _div(a, b):
+    if _number(a) == 0:
+        return _const(0)
+    if _number(b) == 1:
+        return a
+    return _bin(a, ast.Div(), b)
+
+
+def _pow(a, b):
+    return _bin(a, ast.Pow(), b)
+
+
+_NUMPY_ALIASES = ("np", "numpy")
+
+
+def _numpy_function(node):
+    func = node.func
+    if (
+        isinstance(func, ast.Attribute)
+        and isinstance(func.value, ast.Name)
+        and func.value.id in _NUMPY_ALIASES
+        and not node.keywords
+    ):
+        return func.attr
+    raise NotDifferentiable(ast.dump(node))
+
+
+def _derive_call(node, var):
+    name = _numpy_function(node)
+    args = [_rename(arg) for arg in node.args]
+    dargs = [_derive(arg, var) for arg in node.args]
+
+    if name == "power" and len(args) == 2:
+        return _derive_pow(args[0], args[1], dargs[0], dargs[1])
+    if len(args) != 1:
+        raise NotDifferentiable(name)
+    (u,), (du,) = args, dargs
+    if _number(du) == 0:
+        return _const(0)
+
+    if name == "sin":
+        outer = _call("cos", u)
+    elif name == "cos":
+        outer = _neg(_call("sin", u))
+    elif name == "tan":
+        outer = _div(_const(1), _pow(_call("cos", u), _const(2)))
+    elif name == "exp":
+        outer = _call("exp", u)
+    elif name == "log":
+        outer = _div(_const(1), u)
+    elif name == "log10":
+        outer = _div(_const(1), _mul(u, _call("log", _const(10))))
+    elif name == "sqrt":
+        outer = _div(_const(0.5), _call("sqrt", u))
+    elif name == "square":
+        outer = _mul(_const(2), u)
+    elif name == "sinh":
+        outer = _call("cosh", u)
+    elif name == "cosh":
+        outer = _call("sinh", u)
+    elif name == "tanh":
+        outer = _sub(_const(1), _pow(_call("tanh", u), _const(2)))
+    elif name == "arctan":
+        outer = _div(_const(1), _add(_const(1), _pow(u, _const(2))))
+    else:
+        raise NotDifferentiable(name)
+    return _mul(outer, du)
+
+
+def _derive_pow(u, v, du, dv):
+    exponent = _number(v)
+    if _number(dv) == 0:
+        if _number(du) == 0:
+            return _const(0)
+        if exponent is not None:
+            return _mul(_mul(_const(exponent), _pow(u, _const(exponent - 1))), du)
+        return _mul(_mul(v, _pow(u, _sub(v, _const(1)))), du)
+    # d(u**v) = u**v * (v' log(u) + v u' / u)
+    return _mul(
+        _pow(u, v), _add(_mul(dv, _call("log", u)), _div(_mul(v, du), u))
+    )
+
+
+def _rename(node):
+    """Copy of ``node`` with numpy references routed through ``__np``"""
+
+    class Renamer(ast.NodeTransformer):
+        def visit_Name(self, name):
+            if name.id in _NUMPY_ALIASES:
+                return ast.Name(id="__np", ctx=name.ctx)
+            return name
+
+    return Renamer().visit(copy.deepcopy(node))
+
+
+def _derive(node, var):
+    if _number(node) is not None:
+        return _const(0)
+    if isinstance(node, ast.Name):
+        return _const(1 if node.id == var else 0)
+    if isinstance(node, ast.Attribute):
+        if isinstance(node.value, ast.Name) and node.value.id in _NUMPY_ALIASES:
+            return _const(0)
+        raise NotDifferentiable(ast.dump(node))
+    if isinstance(node, ast.Subscript):
+        # coordinates of a multi-dimensional xs, e.g. xs[0]
+        if not any(
+            isinstance(name, ast.Name) and name.id == var for name in ast.walk(node)
+        ):
+            return _const(0)
+        raise NotDifferentiable(ast.dump(node))
+    if isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, ast.USub):
+            return _neg(_derive(node.operand, var))
+        if isinstance(node.op, ast.UAdd):
+            return _derive(node.operand, var)
+    if isinstance(node, ast.BinOp):
+        u, v = _rename(node.left), _rename(node.right)
+        du, dv = _derive(node.left, var), _derive(node.right, var)
+        if isinstance(node.op, ast.Add):
+            return _add(du, dv)
+        if isinstance(node.op, ast.Sub):
+            return _sub(du, dv)
+        if isinstance(node.op, ast.Mult):
+            return _add(_mul(du, v), _mul(u, dv))
+        if isinstance(node.op, ast.Div):
+            if _number(dv) == 0:
+                return _div(du, v)
+            return _div(_sub(_mul(du, v), _mul(u, dv)), _pow(v, _const(2)))
+        if isinstance(node.op, ast.Pow):
+            return _derive_pow(u, v, du, dv)
+    if isinstance(node, ast.Call):
+        return _derive_call(node, var)
+    raise NotDifferentiable(ast.dump(node))
+
+
+def symbolic_jacobian(source: str, globals_: Optional[dict] = None) -> Callable:
+    """Differentiate a model function symbolically
+
+    Supported are functions made of simple assignments and a single return
+    of an arithmetic expression of numpy functions.
+
+    :param source: source text of the ``def`` of the model
+    :param globals_: globals the model is evaluated in
+    :raises UnsupportedSource: if the function is not supported
+    :return: ``jac(xs, *params)`` returning an ``(n, p)`` array
+    """
+    tree = ast.parse(source)
+    func_def = tree.body[0]
+    names = argument_names(func_def)
+    expression = return_expression(func_def)
+
+    jac_tree = ast.parse(f"def __jac({', '.join(names)}):\n    return ()")
+    jac_tree.body[0].body[0].value = ast.Tuple(
+        elts=[_derive(expression, name) for name in names[1:]], ctx=ast.Load()
+    )
+    ast.fix_missing_locations(jac_tree)
+    namespace = dict(globals_ or {}, __np=np)
+    exec(compile(jac_tree, "<jacobian>", "exec"), namespace)
+    columns = namespace["__jac"]
+
+    def jac(xs, *params):
+        ys = columns(xs, *params)
+        if np.ndim(xs) > 1 and any(np.ndim(y) for y in ys):
+            # e.g. a (2, H, W) meshgrid with (H, W) model values
+            shape = np.broadcast(*ys).shape
+        else:
+            shape = np.broadcast(xs, *ys).shape
+        return np.stack([np.broadcast_to(y, shape) for y in ys], axis=-1)
+
+    return jac
+
+
+def complex_step_jacobian(func: Callable, step: float = 1e-20) -> Callable:
+    """Jacobian by complex-step differentiation in one broadcast evaluation
+
+    The model is called once with every parameter given as a column of
+    complex values, each row carrying an imaginary step in one parameter.
+
+    :param func: model function ``func(xs, *params)``, must broadcast over
+        its parameters and accept complex input
+    :param step: imaginary step size
+    :return: ``jac(xs, *params)`` returning an ``(n, p)`` array
+    """
+
+    def jac(xs, *params):
+        p = len(params)
+        shifted = np.asarray(params, dtype=complex)[:, None] + 1j * step * np.eye(p)
+        ys = func(xs, *(column[:, None] for column in shifted))
+        return np.imag(ys).T / step
+
+    return jac
+
+
+def _agrees(jac, func, xs, p0, rtol=1e-4):
+    """Compare a Jacobian against central differences at ``p0``"""
+    p0 = np.asarray(p0, dtype=float)
+    expected = []
+    for i in range(len(p0)):
+        h = 1e-6 * max(1.0, abs(p0[i]))
+        lower, upper = p0.copy(), p0.copy()
+        lower[i] -= h
+        upper[i] += h
+        expected.append((func(xs, *upper) - func(xs, *lower)) / (2 * h))
+    expected = np.stack(np.broadcast_arrays(*expected), axis=-1)
+    actual = jac(xs, *p0)
+    if actual.shape != expected.shape or not np.all(np.isfinite(actual)):
+        return False
+    scale = np.max(np.abs(expected)) or 1.0
+    return np.allclose(actual, expected, rtol=rtol, atol=rtol * scale)
+
+
+def _sample(xs, size):
+    """About ``size`` samples of ``xs``"""
+    if isinstance(xs, np.ndarray) and xs.ndim > 1:
+        # a corner of a grid, e.g. of a (2, H, W) meshgrid
+        side = int(np.sqrt(size))
+        return xs[..., :side, :side]
+    return np.asarray(xs)[: min(len(xs), size)] if np.ndim(xs) == 1 else xs
+
+
+def _cheaper(jac, func, xs, p0, evaluations, repeat=3):
+    """Whether ``jac`` takes less time than ``evaluations`` calls of ``func``"""
+
+    def best(call):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    return best(lambda: jac(xs, *p0)) < evaluations * best(lambda: func(xs, *p0))
+
+
+def build_jacobian(
+    func: Callable, xs, p0: Sequence[float], source: Optional[str] = None
+) -> Jacobian:
+    """Find the cheapest reliable way to compute the Jacobian of a model
+
+    Symbolic differentiation of ``source`` is tried first, then a broadcast
+    complex step. Every candidate is checked against central differences at
+    ``p0``; if none agrees, ``curve_fit`` falls back to finite differences.
+    Complex arithmetic costs several times as much as real, so the complex
+    step is only used if it is timed faster than the ``p`` model evaluations
+    of finite differences.
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable
+    :param p0: parameters to validate the Jacobian at
+    :param source: source text of the ``def`` of the model
+    """
+    n_params = len(parameter_names(func))
+    sample = _sample(xs, 64)
+
+    if source is not None:
+        try:
+            jac = symbolic_jacobian(source, getattr(func, "__globals__", None))
+            if _agrees(jac, func, sample, p0):
+                return Jacobian(jac, "symbolic", 0)
+        except Exception:
+            pass
+
+    try:
+        jac = complex_step_jacobian(func)
+        if _agrees(jac, func, sample, p0) and _cheaper(
+            jac, func, _sample(xs, 4096), p0, n_params
+        ):
+            return Jacobian(jac, "complex-step", 1)
+    except Exception:
+        pass
+
+    return Jacobian(None, "finite-difference", n_params)
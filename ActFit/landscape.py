@@ -0,0 +1,218 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import functools
+import os
+from typing import Callable, Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .fit import parameter_names
+
+__all__ = ("Landscape", "broadcasts", "chi2_landscape")
+
+
+class Landscape(NamedTuple):
+    names: Tuple[str, str]
+    x: np.ndarray
+    y: np.ndarray
+    chi2: np.ndarray
+    n_points: int
+    n_sampled: int
+    vectorized: bool
+
+    def nearest(self, x: float, y: float) -> Tuple[float, float]:
+        """Grid values of the cell containing ``(x, y)``"""
+        i = int(np.argmin(np.abs(self.x - x)))
+        j = int(np.argmin(np.abs(self.y - y)))
+        return float(self.x[i]), float(self.y[j])
+
+    @property
+    def minimum(self) -> Tuple[float, float]:
+        """Grid values with the smallest chi-square"""
+        j, i = np.unravel_index(np.nanargmin(self.chi2), self.chi2.shape)
+        return float(self.x[i]), float(self.y[j])
+
+
+def _grid_args(params, columns, grid, ndim):
+    """Parameters with the grid columns as arrays broadcasting against xs"""
+    args = list(params)
+    shape = (len(grid),) + (1,) * ndim
+    for column, values in zip(columns, grid.T):
+        args[column] = values.reshape(shape)
+    return args
+
+
+def broadcasts(func: Callable, xs, params: Sequence[float], columns) -> bool:
+    """Whether ``func`` evaluates a stack of parameter sets in one call
+
+    Two parameter sets are evaluated at once, with the varied parameters as
+    arrays broadcasting against ``xs``, and compared to separate calls.
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable
+    :param params: all parameters
+    :param columns: positions of the varied parameters
+    """
+    params = np.asarray(params, dtype=float)
+    grid = np.stack([params[list(columns)]] * 2)
+    grid[1] = grid[1] * 1.01 + 0.01
+    xs = np.asarray(xs)
+    try:
+        with np.errstate(all="ignore"):
+            stacked = np.asarray(
+                func(xs[np.newaxis], *_grid_args(params, columns, grid, xs.ndim))
+            )
+            expected = []
+            for row in grid:
+                single = params.copy()
+                single[list(columns)] = row
+                expected.append(np.broadcast_to(func(xs, *single), xs.shape))
+    except Exception:
+        return False
+    return stacked.shape == (2,) + xs.shape and np.allclose(
+        stacked, expected, rtol=1e-9, atol=0, equal_nan=True
+    )
+
+
+def _chunk_chi2(func, xs, data, weights, params, columns, grid):
+    with np.errstate(all="ignore"):
+        ys = func(xs[np.newaxis], *_grid_args(params, columns, grid, xs.ndim))
+        r = np.subtract(ys, data).reshape(len(grid), -1)
+        if weights is not None:
+            r *= weights.reshape(-1)
+        return np.einsum("ij,ij->i", r, r)
+
+
+_worker_state = None
+
+
+def _init_worker(func, xs, data, weights, params, columns):
+    import dill
+
+    global _worker_state
+    _worker_state = (dill.loads(func), xs, data, weights, params, columns)
+
+
+def _rows_chi2(grid):
+    func, xs, data, weights, params, columns = _worker_state
+    out = np.empty(len(grid))
+    single = np.array(params, dtype=float)
+    with np.errstate(all="ignore"):
+        for i, row in enumerate(grid):
+            single[list(columns)] = row
+            r = np.subtract(func(xs, *single), data).reshape(-1)
+            if weights is not None:
+                r = r * weights.reshape(-1)
+            out[i] = np.dot(r, r)
+    return out
+
+
+def chi2_landscape(
+    func: Callable,
+    xs,
+    data,
+    params: Dict[str, float],
+    names: Tuple[str, str],
+    ranges: Tuple[Tuple[float, float], Tuple[float, float]],
+    n: int = 100,
+    sigma=None,
+    max_points: Optional[int] = None,
+    chunk_size: int = 1 << 16,
+    processes: Optional[int] = None,
+    callback: Optional[Callable] = None,
+) -> Landscape:
+    """Chi-square of a model on a grid over two of its parameters
+
+    The other parameters are held at their values in ``params``. Models that
+    broadcast, see :func:`broadcasts`, are evaluated for many grid points per
+    call, in chunks of about ``chunk_size`` model values spread over threads.
+    Other models are evaluated point by point across a process pool, or in
+    this process if the model can't be pickled.
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable
+    :param data: dependent data
+    :param params: all parameters by name
+    :param names: the two parameters to vary, along x and y
+    :param ranges: ``(lower, upper)`` range of each of them
+    :param n: grid points along each axis
+    :param sigma: uncertainties of ``data``, giving the weighted chi-square
+    :param max_points: evaluate at most this many, evenly strided data
+        points and scale the sums up
+    :param chunk_size: model values per broadcast call
+    :param processes: threads or processes to use, by default one per core
+    :param callback: called as ``callback(done, total)`` with the number of
+        finished grid points; raising from it aborts
+    """
+    order = parameter_names(func)
+    values = np.array([params[name] for name in order], dtype=float)
+    columns = [order.index(name) for name in names]
+    x = np.linspace(*ranges[0], n)
+    y = np.linspace(*ranges[1], n)
+    grid = np.stack(np.meshgrid(x, y), axis=-1).reshape(-1, 2)
+
+    xs, data = np.asarray(xs), np.asarray(data, dtype=float)
+    weights = None if sigma is None else 1 / np.broadcast_to(sigma, data.shape)
+    n_points = data.size
+    if max_points is not None and n_points > max_points:
+        step = -(-n_points // max_points)
+        # rows of images, with xs e.g. a (2, H, W) meshgrid
+        rows = (Ellipsis, slice(None, None, step)) + (slice(None),) * (data.ndim - 1)
+        if xs.shape[xs.ndim - data.ndim :] == data.shape:
+            xs, data = xs[rows], data[rows]
+            if weights is not None:
+                weights = weights[rows]
+    n_sampled = data.size
+
+    processes = processes or os.cpu_count() or 1
+    vectorized = broadcasts(func, xs, values, columns)
+    pool = None
+    if vectorized:
+        rows = max(1, chunk_size // max(n_sampled, 1))
+        evaluate = functools.partial(
+            _chunk_chi2, func, xs, data, weights, values, columns
+        )
+        if processes > 1:
+            # numpy releases the GIL, threads share the data
+            pool = ThreadPoolExecutor(processes)
+    else:
+        import dill
+
+        rows = max(1, -(-len(grid) // (processes * 16)))
+        evaluate = _rows_chi2
+        initargs = (xs, data, weights, values, columns)
+        try:
+            pickled = dill.dumps(func) if processes > 1 else None
+        except Exception:
+            pickled = None
+        if pickled is None:
+            global _worker_state
+            _worker_state = (func,) + initargs
+        else:
+            pool = ProcessPoolExecutor(
+                processes, initializer=_init_worker, initargs=(pickled,) + initargs
+            )
+
+    starts = range(0, len(grid), rows)
+    futures = []
+    if pool is None:
+        results = (evaluate(grid[start : start + rows]) for start in starts)
+    else:
+        futures = [
+            pool.submit(evaluate, grid[start : start + rows]) for start in starts
+        ]
+        results = (future.result() for future in futures)
+    chi2 = np.empty(len(grid))
+    try:
+        for start, result in zip(starts, results):
+            chi2[start : start + len(result)] = result
+            if callback is not None:
+                callback(start + len(result), len(grid))
+    finally:
+        for future in futures:
+            future.cancel()
+        if pool is not None:
+            pool.shutdown(wait=False)
+    chi2 *= n_points / n_sampled
+    return Landscape(
+        tuple(names), x, y, chi2.reshape(n, n), n_points, n_sampled, vectorized
+    )
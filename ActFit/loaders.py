@@ -0,0 +1,268 @@
+import hashlib
+import keyword
+import os
+import re
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+__all__ = (
+    "load",
+    "load_csv",
+    "load_hdf5",
+    "load_npy",
+    "load_raw",
+    "variable_name",
+)
+
+
+#: rows parsed per chunk when converting text files
+CHUNK_ROWS = 1 << 16
+
+RAW_EXTENSIONS = (".bin", ".raw", ".dat")
+CSV_EXTENSIONS = (".csv", ".tsv", ".txt")
+HDF5_EXTENSIONS = (".h5", ".hdf5", ".hdf")
+
+
+def variable_name(path: str) -> str:
+    """A python identifier derived from a file name
+
+    :param path: file path
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    name = re.sub(r"\W", "_", stem) or "data"
+    if name[0].isdigit():
+        name = "_" + name
+    if keyword.iskeyword(name):
+        name += "_"
+    return name
+
+
+def load_npy(path: str) -> np.memmap:
+    """Memory-map a ``.npy`` file read-only
+
+    :param path: file path
+    """
+    return np.load(path, mmap_mode="r")
+
+
+def load_raw(
+    path: str,
+    dtype="<f8",
+    shape: Optional[Sequence[int]] = None,
+    offset: int = 0,
+    order: str = "C",
+) -> np.memmap:
+    """Memory-map a headerless binary file read-only
+
+    :param path: file path
+    :param dtype: element type, native little-endian ``float64`` avoids any
+        conversion copy when fitting
+    :param shape: array shape, defaults to a flat array of the whole file
+    :param offset: bytes to skip at the beginning of the file
+    :param order: memory layout of multi-dimensional data
+    """
+    return np.memmap(
+        path, dtype=dtype, mode="r", offset=offset, shape=shape, order=order
+    )
+
+
+def _cache_directory():
+    """Per-user directory for converted copies of files in read-only folders"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "ActFit")
+
+
+def _sidecar(path, cache_dir, options=()):
+    """Path of the converted copy of ``path``
+
+    The name depends on the conversion ``options``, and on the whole of
+    ``path`` unless the copy is next to the file.
+    """
+    path = os.path.abspath(path)
+    directory = cache_dir or os.path.dirname(path)
+    if cache_dir is None and not os.access(directory, os.W_OK):
+        directory = _cache_directory()
+    key = options if directory == os.path.dirname(path) else (path, options)
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:8]
+    return os.path.join(directory, f"{os.path.basename(path)}.{digest}.npy")
+
+
+def _up_to_date(sidecar, path):
+    if not os.path.exists(sidecar):
+        return False
+    return os.path.getmtime(sidecar) >= os.path.getmtime(path)
+
+
+def _write_sidecar(sidecar, fill, dtype, shape, fortran_order=False):
+    """Write a ``.npy`` copy through a temporary file in the same directory
+
+    The copy only replaces ``sidecar`` once ``fill`` succeeded, so a failed
+    conversion leaves no partial copy behind that looks up to date.
+
+    :param fill: called with the mapped array to fill it
+    """
+    os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+    temporary = f"{sidecar}.{os.getpid()}.tmp"
+    try:
+        out = np.lib.format.open_memmap(
+            temporary,
+            mode="w+",
+            dtype=dtype,
+            shape=shape,
+            fortran_order=fortran_order,
+        )
+        fill(out)
+        out.flush()
+        del out
+        os.replace(temporary, sidecar)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def load_csv(
+    path: str,
+    delimiter: Optional[str] = None,
+    skiprows: int = 0,
+    dtype="<f8",
+    cache_dir: Optional[str] = None,
+) -> np.memmap:
+    """Memory-map a delimited text file through a cached ``.npy`` copy
+
+    The text is parsed once, :data:`CHUNK_ROWS` rows at a time, into a
+    column-major ``<path>.<key>.npy`` next to the file, so every column is a
+    contiguous view. The copy goes to ``cache_dir`` if given, or to the user's
+    cache directory if the file's directory isn't writable. It is reused
+    until the text file changes; ``key`` covers ``delimiter``, ``skiprows``
+    and ``dtype``, so loading with other options converts again.
+
+    :param path: file path
+    :param delimiter: column delimiter, defaults to ``","`` for ``.csv`` files
+        and whitespace otherwise
+    :param skiprows: header lines to skip
+    :param dtype: element type
+    :param cache_dir: directory for the converted copy, defaults to the file's
+    :return: ``(rows, columns)`` array, or ``(rows,)`` for a single column
+    """
+    if delimiter is None and path.lower().endswith(".csv"):
+        delimiter = ","
+    sidecar = _sidecar(path, cache_dir, (delimiter, skiprows, np.dtype(dtype).str))
+    if not _up_to_date(sidecar, path):
+
+        def rows(file):
+            for i, line in enumerate(file):
+                if i >= skiprows and line.strip() and not line.startswith("#"):
+                    yield line
+
+        with open(path, "r") as file:
+            n_rows = sum(1 for _ in rows(file))
+        with open(path, "r") as file:
+            lines = rows(file)
+            first = next(lines, None)
+            if first is None:
+                raise ValueError(f"{path} contains no data")
+            n_columns = len(first.split(delimiter))
+            shape = (n_rows, n_columns) if n_columns > 1 else (n_rows,)
+
+            def fill(out):
+                chunk, start = [first], 0
+                for line in lines:
+                    chunk.append(line)
+                    if len(chunk) == CHUNK_ROWS:
+                        out[start : start + len(chunk)] = np.loadtxt(
+                            chunk, delimiter=delimiter, dtype=dtype, ndmin=len(shape)
+                        )
+                        start += len(chunk)
+                        chunk = []
+                if chunk:
+                    out[start : start + len(chunk)] = np.loadtxt(
+                        chunk, delimiter=delimiter, dtype=dtype, ndmin=len(shape)
+                    )
+
+            _write_sidecar(sidecar, fill, dtype, shape, fortran_order=True)
+    return load_npy(sidecar)
+
+
+def load_hdf5(path: str, cache_dir: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Memory-map every dataset of an HDF5 file
+
+    Contiguous, uncompressed datasets are mapped directly from the HDF5 file.
+    Chunked or compressed ones are copied once, chunk by chunk, into a cached
+    ``.npy`` file. Requires ``h5py``.
+
+    :param path: file path
+    :param cache_dir: directory for converted copies
+    :return: mapping of dataset path to array
+    """
+    import h5py
+
+    arrays = {}
+    with h5py.File(path, "r") as file:
+        datasets = []
+        file.visititems(
+            lambda name, obj: datasets.append(name)
+            if isinstance(obj, h5py.Dataset)
+            else None
+        )
+        for name in datasets:
+            dataset = file[name]
+            if dataset.dtype.kind not in "biuf" or dataset.size == 0:
+                continue
+            offset = dataset.id.get_offset()
+            if dataset.chunks is None and offset is not None:
+                arrays[name] = np.memmap(
+                    path,
+                    dtype=dataset.dtype,
+                    mode="r",
+                    offset=offset,
+                    shape=dataset.shape,
+                )
+                continue
+            sidecar = _sidecar(f"{path}.{name.replace('/', '.')}", cache_dir)
+            if not _up_to_date(sidecar, path):
+
+                def fill(out, dataset=dataset):
+                    step = max(1, CHUNK_ROWS * 16 // max(1, dataset[0:1].size))
+                    for start in range(0, dataset.shape[0], step):
+                        out[start : start + step] = dataset[start : start + step]
+
+                _write_sidecar(sidecar, fill, dataset.dtype, dataset.shape)
+            arrays[name] = load_npy(sidecar)
+    return arrays
+
+
+def load(path: str, **kwargs) -> Dict[str, np.ndarray]:
+    """Memory-map a data file, choosing the loader by extension
+
+    ``.npy`` files are mapped directly, :data:`RAW_EXTENSIONS` are treated as
+    headerless binary, :data:`CSV_EXTENSIONS` as delimited text and
+    :data:`HDF5_EXTENSIONS` as HDF5. Columns of two-dimensional text data are
+    additionally returned as ``<name>_<column>`` views.
+
+    :param path: file path
+    :param kwargs: passed on to the loader
+    :return: mapping of variable name to array
+    """
+    name = variable_name(path)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return {name: load_npy(path)}
+    if extension in RAW_EXTENSIONS:
+        return {name: load_raw(path, **kwargs)}
+    if extension in HDF5_EXTENSIONS:
+        return {
+            name + "_" + re.sub(r"\W", "_", key): array
+            for key, array in load_hdf5(path, **kwargs).items()
+        }
+    if extension in CSV_EXTENSIONS:
+        array = load_csv(path, **kwargs)
+        arrays = {name: array}
+        if array.ndim == 2:
+            for column in range(array.shape[1]):
+                arrays[f"{name}_{column}"] = array[:, column]
+        return arrays
+    raise ValueError(f"unsupported file type {extension!r}")
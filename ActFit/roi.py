@@ -0,0 +1,151 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+__all__ = ("ROI", "positions", "select")
+
+
+class ROI(NamedTuple):
+    """Region of interest, the samples of one-dimensional data to fit
+
+    :param spans: ``(lower, upper)`` ranges of x to fit, all of x if empty
+    :param excluded: indices of single samples left out
+    """
+
+    spans: Tuple[Tuple[float, float], ...] = ()
+    excluded: Tuple[int, ...] = ()
+
+    @property
+    def everything(self) -> bool:
+        """Whether the region covers all samples"""
+        return not self.spans and not self.excluded
+
+    def add_span(self, lower: float, upper: float) -> "ROI":
+        """The region with ``[lower, upper]`` added, merging overlaps"""
+        spans = sorted(self.spans + ((min(lower, upper), max(lower, upper)),))
+        merged = [spans[0]]
+        for lower, upper in spans[1:]:
+            if lower <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], upper))
+            else:
+                merged.append((lower, upper))
+        return self._replace(spans=tuple(merged))
+
+    def remove_span(self, x: float) -> "ROI":
+        """The region without the spans containing ``x``"""
+        spans = tuple(span for span in self.spans if not span[0] <= x <= span[1])
+        return self._replace(spans=spans)
+
+    def toggle(self, index: int) -> "ROI":
+        """The region with sample ``index`` excluded, or included again"""
+        excluded = set(self.excluded) ^ {int(index)}
+        return self._replace(excluded=tuple(sorted(excluded)))
+
+    def to_json(self) -> Dict[str, Any]:
+        return dict(
+            spans=[[float(lower), float(upper)] for lower, upper in self.spans],
+            excluded=[int(index) for index in self.excluded],
+        )
+
+    @classmethod
+    def from_json(cls, value: Optional[Dict[str, Any]]) -> "ROI":
+        value = value or {}
+        return cls(
+            tuple(
+                (float(lower), float(upper)) for lower, upper in value.get("spans", ())
+            ),
+            tuple(int(index) for index in value.get("excluded", ())),
+        )
+
+    def mask(self, positions) -> np.ndarray:
+        """Which samples at ``positions`` are inside the region"""
+        positions = np.asarray(positions)
+        if not self.spans:
+            inside = np.ones(len(positions), dtype=bool)
+        else:
+            inside = np.zeros(len(positions), dtype=bool)
+            for lower, upper in self.spans:
+                inside |= (positions >= lower) & (positions <= upper)
+        excluded = np.array(self.excluded, dtype=int)
+        inside[excluded[(excluded >= 0) & (excluded < len(positions))]] = False
+        return inside
+
+    def slices(self, positions) -> Optional[List[slice]]:
+        """Contiguous runs of samples inside the region
+
+        :param positions: x of every sample
+        :return: ascending slices, or ``None`` unless ``positions`` are sorted
+        """
+        positions = np.asarray(positions)
+        if not np.all(positions[1:] >= positions[:-1]):
+            return None
+        n = len(positions)
+        if self.spans:
+            lower, upper = np.array(self.spans).T
+            runs = zip(
+                np.searchsorted(positions, lower, side="left"),
+                np.searchsorted(positions, upper, side="right"),
+            )
+        else:
+            runs = [(0, n)]
+        excluded = np.array(self.excluded, dtype=int)
+        slices = []
+        for start, stop in runs:
+            cuts = excluded[(excluded >= start) & (excluded < stop)]
+            for cut in cuts:
+                if cut > start:
+                    slices.append(slice(int(start), int(cut)))
+                start = cut + 1
+            if stop > start:
+                slices.append(slice(int(start), int(stop)))
+        return slices
+
+
+def positions(xs, data) -> Optional[np.ndarray]:
+    """x of every sample as the plot shows it, the sample index if ``xs``
+    has more than one dimension
+
+    :return: positions, or ``None`` for multi-dimensional data, e.g. images
+    """
+    if data is None or xs is None or np.ndim(data) != 1:
+        return None
+    if np.ndim(xs) == 1 and len(xs) == len(data):
+        return np.asarray(xs)
+    return np.arange(len(data))
+
+
+def select(roi: ROI, xs, data, sigma=None):
+    """The samples inside a region of interest
+
+    Sorted samples are cut into contiguous runs, so a region of a single
+    run selects views of the arrays and several runs copy only the samples
+    inside them. Unsorted samples are selected through a mask.
+    Multi-dimensional data isn't restricted.
+
+    :param roi: region to select
+    :param xs: independent variable, samples along its last axis
+    :param data: dependent data
+    :param sigma: uncertainties of ``data``
+    :return: ``(xs, data, sigma)`` inside the region
+    """
+    at = positions(xs, data)
+    if roi.everything or at is None:
+        return xs, data, sigma
+    arrays = [np.asarray(xs), np.asarray(data)]
+    if sigma is not None:
+        arrays.append(np.asarray(sigma))
+    slices = roi.slices(at)
+    if slices is None:
+        mask = roi.mask(at)
+        selected = [array[..., mask] for array in arrays]
+    elif len(slices) <= 1:
+        run = slices[0] if slices else slice(0, 0)
+        selected = [array[..., run] for array in arrays]
+    else:
+        selected = [
+            np.concatenate([array[..., run] for run in slices], axis=-1)
+            for array in arrays
+        ]
+    if sigma is None:
+        selected.append(None)
+    return tuple(selected)
@@ -0,0 +1,148 @@
+from typing import Callable, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .fit import _fit_pool
+
+__all__ = ("auto_seed", "evaluate_batch", "latin_hypercube", "SeedResult")
+
+
+#: upper limit for the number of elements of one broadcast model evaluation
+CHUNK_ELEMENTS = 1 << 22
+
+
+class SeedResult(NamedTuple):
+    params: np.ndarray
+    covariance: np.ndarray
+    residual: float
+    seeds: np.ndarray
+    seed_residuals: np.ndarray
+
+
+def latin_hypercube(
+    n: int, lower: Sequence[float], upper: Sequence[float], rng=None
+) -> np.ndarray:
+    """Latin hypercube sample of a box
+
+    :param n: number of samples
+    :param lower: lower corner of the box
+    :param upper: upper corner of the box
+    :param rng: ``numpy.random.RandomState`` to draw from
+    :return: ``(n, len(lower))`` array of samples
+    """
+    rng = rng or np.random
+    lower, upper = np.asarray(lower, dtype=float), np.asarray(upper, dtype=float)
+    strata = np.argsort(rng.random_sample((len(lower), n)), axis=1).T
+    unit = (strata + rng.random_sample(strata.shape)) / n
+    return lower + unit * (upper - lower)
+
+
+def _broadcasts(func, xs, samples):
+    try:
+        ys = func(xs, *(p[:, None] for p in samples[:2].T))
+        return np.shape(ys) == (2,) + np.shape(xs) and np.allclose(
+            ys[1], func(xs, *samples[1]), equal_nan=True
+        )
+    except Exception:
+        return False
+
+
+def evaluate_batch(
+    func: Callable, xs, data, samples: np.ndarray, callback: Optional[Callable] = None
+) -> np.ndarray:
+    """Residual sum of squares of a model for many parameter vectors
+
+    Models that broadcast over their parameters are evaluated for a whole
+    chunk of samples in a single call, others one sample at a time.
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable
+    :param data: dependent data
+    :param samples: ``(n, p)`` parameter vectors
+    :param callback: called as ``callback(n_done, residuals)`` after each
+        chunk; raising from it aborts
+    :return: ``(n,)`` residuals, ``inf`` where the model is not finite
+    """
+    xs, data = np.asarray(xs), np.asarray(data)
+    residuals = np.full(len(samples), np.inf)
+    if _broadcasts(func, xs, samples):
+        chunk = max(1, CHUNK_ELEMENTS // max(xs.size, 1))
+        for start in range(0, len(samples), chunk):
+            block = samples[start : start + chunk]
+            ys = func(xs, *(p[:, None] for p in block.T))
+            residuals[start : start + chunk] = np.sum(
+                np.square(ys - data), axis=tuple(range(1, np.ndim(ys)))
+            )
+            if callback is not None:
+                callback(start + len(block), residuals)
+    else:
+        for i, sample in enumerate(samples):
+            try:
+                residuals[i] = np.sum(np.square(func(xs, *sample) - data))
+            except Exception:
+                pass
+            if callback is not None and (i + 1) % 64 == 0:
+                callback(i + 1, residuals)
+    residuals[~np.isfinite(residuals)] = np.inf
+    return residuals
+
+
+def auto_seed(
+    func: Callable,
+    xs,
+    data,
+    bounds: Tuple[Sequence[float], Sequence[float]],
+    n_samples: int = 1024,
+    n_best: int = 8,
+    processes: Optional[int] = None,
+    rng=None,
+    callback: Optional[Callable] = None,
+) -> SeedResult:
+    """Search a parameter box for good initial values and refine them
+
+    The box is sampled with a latin hypercube, the ``n_best`` samples with
+    the smallest residual are refined with ``curve_fit`` in parallel and the
+    best refinement wins.
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable
+    :param data: dependent data
+    :param bounds: ``(lower, upper)`` corners of the search box, also used as
+        fit bounds
+    :param n_samples: number of samples drawn from the box
+    :param n_best: number of samples to refine
+    :param processes: number of worker processes for the refinement
+    :param rng: ``numpy.random.RandomState`` to draw from
+    :param callback: see :func:`evaluate_batch`
+    :return: winning parameters, their covariance and residual, plus the
+        refined seeds and their residuals
+    """
+    lower, upper = np.asarray(bounds[0], float), np.asarray(bounds[1], float)
+    lower, upper = np.minimum(lower, upper), np.maximum(lower, upper)
+
+    samples = latin_hypercube(n_samples, lower, upper, rng=rng)
+    residuals = evaluate_batch(func, xs, data, samples, callback=callback)
+    best = np.argsort(residuals)[: max(1, n_best)]
+    seeds = samples[best]
+
+    refined = _fit_pool(
+        func,
+        xs,
+        data,
+        [(None, None, seed) for seed in seeds],
+        seeds[0],
+        (lower, upper),
+        processes,
+        1,
+        {},
+    )
+    candidates = np.where(refined.success[:, None], refined.params, seeds)
+    final = evaluate_batch(func, xs, data, candidates)
+    winner = int(np.argmin(final))
+    return SeedResult(
+        candidates[winner],
+        refined.covariances[winner],
+        float(final[winner]),
+        seeds,
+        residuals[best],
+    )
@@ -0,0 +1,187 @@
+import ast
+import copy
+from typing import Dict, FrozenSet, List, NamedTuple, Tuple
+
+__all__ = (
+    "Statement",
+    "UnsupportedSource",
+    "argument_names",
+    "function_sources",
+    "return_expression",
+    "split_statements",
+    "statement_names",
+)
+
+
+class UnsupportedSource(Exception):
+    pass
+
+
+class Statement(NamedTuple):
+    lineno: int
+    text: str
+    node: ast.stmt
+
+
+def split_statements(code: str) -> List[Statement]:
+    """Split source code into its top-level statements
+
+    :param code: python source
+    :return: statements with their first line number and source text
+    """
+    tree = ast.parse(code)
+    lines = code.splitlines(keepends=True)
+    starts = [
+        min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        for node in tree.body
+    ]
+    statements = []
+    for node, start, stop in zip(tree.body, starts, starts[1:] + [len(lines) + 1]):
+        text = "".join(lines[start - 1 : stop - 1]).rstrip()
+        statements.append(Statement(start, text, node))
+    return statements
+
+
+def function_sources(code: str) -> Dict[str, str]:
+    """Source text of every top-level function definition
+
+    :param code: python source
+    :return: mapping of function name to its source text
+    """
+    return {
+        statement.node.name: statement.text
+        for statement in split_statements(code)
+        if isinstance(statement.node, (ast.FunctionDef, ast.AsyncFunctionDef))
+    }
+
+
+def argument_names(func_def: ast.AST) -> List[str]:
+    """Positional argument names of a plain function definition
+
+    :param func_def: ``def`` node
+    :raises UnsupportedSource: for anything but positional arguments
+    """
+    if not isinstance(func_def, ast.FunctionDef):
+        raise UnsupportedSource("not a function definition")
+    args = func_def.args
+    if args.vararg or args.kwarg or args.kwonlyargs or args.defaults:
+        raise UnsupportedSource("unsupported signature")
+    return [arg.arg for arg in args.args]
+
+
+def return_expression(func_def: ast.FunctionDef) -> ast.expr:
+    """The returned expression of a function with simple assignments inlined
+
+    :param func_def: ``def`` node made of an optional docstring, assignments
+        to plain names and a single ``return``
+    :raises UnsupportedSource: for any other function body
+    """
+    bindings = {}
+
+    class Inliner(ast.NodeTransformer):
+        def visit_Name(self, name):
+            if isinstance(name.ctx, ast.Load) and name.id in bindings:
+                return copy.deepcopy(bindings[name.id])
+            return name
+
+    body = func_def.body
+    if body and ast.get_docstring(func_def) is not None:
+        body = body[1:]
+    for statement in body:
+        if (
+            isinstance(statement, ast.Assign)
+            and len(statement.targets) == 1
+            and isinstance(statement.targets[0], ast.Name)
+        ):
+            bindings[statement.targets[0].id] = Inliner().visit(statement.value)
+        elif isinstance(statement, ast.Return) and statement.value is not None:
+            return Inliner().visit(statement.value)
+        else:
+            raise UnsupportedSource(ast.dump(statement))
+    raise UnsupportedSource("no return statement")
+
+
+_SCOPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+_COMPREHENSIONS = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+def _stored_names(nodes):
+    return {
+        node.id
+        for root in nodes
+        for node in ast.walk(root)
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load)
+    }
+
+
+def statement_names(node: ast.stmt) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """Names a top-level statement reads and (re)binds
+
+    Reads of names that are local to a nested function, class or
+    comprehension are ignored, as are its bindings. A subscript or attribute
+    assignment counts as a write of its base name; mutation through method
+    calls is not detected.
+
+    :param node: top-level statement
+    :return: ``(reads, writes)``
+    """
+    reads, writes = set(), set()
+
+    def base_name(target):
+        while isinstance(target, (ast.Attribute, ast.Subscript, ast.Starred)):
+            target = target.value
+        return target.id if isinstance(target, ast.Name) else None
+
+    def visit(node, nested, bound):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                if node.id not in bound:
+                    reads.add(node.id)
+            elif not nested:
+                writes.add(node.id)
+            return
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if not nested:
+                for alias in node.names:
+                    if alias.name != "*":
+                        writes.add(alias.asname or alias.name.split(".")[0])
+            return
+        if isinstance(node, _SCOPES):
+            if not nested and not isinstance(node, ast.Lambda):
+                writes.add(node.name)
+            outer = list(getattr(node, "decorator_list", []))
+            outer += getattr(node, "bases", []) + getattr(node, "keywords", [])
+            inner = set(bound)
+            if not isinstance(node, ast.ClassDef):
+                args = node.args
+                outer += args.defaults + [d for d in args.kw_defaults if d]
+                inner.update(
+                    arg.arg
+                    for arg in args.args
+                    + args.kwonlyargs
+                    + getattr(args, "posonlyargs", [])
+                    + [args.vararg, args.kwarg]
+                    if arg is not None
+                )
+            body = node.body if isinstance(node.body, list) else [node.body]
+            inner.update(_stored_names(body))
+            for child in outer:
+                visit(child, nested, bound)
+            for child in body:
+                visit(child, True, inner)
+            return
+        if isinstance(node, _COMPREHENSIONS):
+            inner = set(bound) | _stored_names(gen.target for gen in node.generators)
+            for child in ast.iter_child_nodes(node):
+                visit(child, True, inner)
+            return
+        if isinstance(node, (ast.Assign, ast.AugAssign, ast.AnnAssign)) and not nested:
+            for target in getattr(node, "targets", None) or [node.target]:
+                name = base_name(target)
+                if name is not None:
+                    writes.add(name)
+        for child in ast.iter_child_nodes(node):
+            visit(child, nested, bound)
+
+    visit(node, False, set())
+    return frozenset(reads), frozenset(writes)
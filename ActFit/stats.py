@@ -0,0 +1,79 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+__all__ = ("FitStatistics", "fit_statistics")
+
+
+class FitStatistics(NamedTuple):
+    rss: float
+    chi2: float
+    reduced_chi2: float
+    r_squared: float
+    n_points: int
+    n_params: int
+    n_sampled: int
+    errors: Optional[np.ndarray]
+    correlations: Optional[np.ndarray]
+
+
+def fit_statistics(
+    ys,
+    data,
+    n_params: int,
+    n_points: Optional[int] = None,
+    covariance=None,
+    sigma=None,
+) -> FitStatistics:
+    """Goodness of fit from one model evaluation
+
+    ``ys`` and ``data`` may be a subset of the fitted points, e.g. every
+    k-th sample in view; the sums are then scaled up to ``n_points``. The
+    subset must be unbiased, min/max picks of a decimated plot overstate
+    the residuals.
+    Non-finite residuals are ignored. Without ``sigma`` the chi-square is
+    the residual sum of squares.
+
+    :param ys: model values
+    :param data: data at the same points
+    :param n_params: number of fitted parameters
+    :param n_points: total number of points, defaults to the size of ``data``
+    :param covariance: parameter covariance for standard errors and
+        correlations
+    :param sigma: uncertainties of ``data``
+    """
+    ys, data = np.asarray(ys).ravel(), np.asarray(data).ravel()
+    residuals = data - ys
+    weighted = residuals if sigma is None else residuals / np.ravel(sigma)
+    finite = np.isfinite(weighted)
+    if not finite.all():
+        residuals, weighted, data = residuals[finite], weighted[finite], data[finite]
+    n_sampled = len(residuals)
+    n_points = n_sampled if n_points is None else n_points
+    scale = n_points / n_sampled if n_sampled else np.nan
+
+    rss = float(np.dot(residuals, residuals)) * scale
+    chi2 = float(np.dot(weighted, weighted)) * scale
+    deviations = data - data.mean() if n_sampled else data
+    tss = float(np.dot(deviations, deviations)) * scale
+    dof = n_points - n_params
+    reduced_chi2 = chi2 / dof if dof > 0 else np.nan
+    r_squared = 1 - rss / tss if tss > 0 else np.nan
+
+    errors = correlations = None
+    if covariance is not None:
+        covariance = np.asarray(covariance, dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            errors = np.sqrt(np.diag(covariance))
+            correlations = covariance / np.outer(errors, errors)
+    return FitStatistics(
+        rss,
+        chi2,
+        reduced_chi2,
+        r_squared,
+        n_points,
+        n_params,
+        n_sampled,
+        errors,
+        correlations,
+    )
@@ -0,0 +1,325 @@
+import functools
+import io
+import os
+import socket
+import threading
+import time
+from typing import NamedTuple, Optional, Tuple
+import weakref
+
+import numpy as np
+
+__all__ = (
+    "Snapshot",
+    "Stream",
+    "StreamReader",
+    "follow_file",
+    "read_pipe",
+    "read_socket",
+    "stream_column",
+)
+
+
+class Snapshot(NamedTuple):
+    """Samples of a stream as of one :meth:`Stream.update`
+
+    :param columns: one array per column, e.g. ``(xs, ys)``
+    :param count: samples appended to the stream so far, including any a
+        ring buffer dropped
+    :param time: ``time.monotonic()`` when the newest sample was appended
+    """
+
+    columns: Tuple[np.ndarray, ...]
+    count: int
+    time: float
+
+
+class Stream:
+    """Samples appended while they are acquired, e.g. by a reader thread
+
+    Samples are stored column by column, so every column is a contiguous
+    array. Only a ring buffer never reallocates: it keeps the last
+    ``capacity`` samples. A growing stream does reallocate, doubling its
+    capacity and copying the samples so far whenever it is full, which
+    copies every sample less than twice on average; pass the expected number
+    of samples as ``capacity`` to avoid that.
+
+    Appended samples become visible to readers with :meth:`update`, which
+    publishes a :attr:`snapshot` whose columns all have the same length.
+    Snapshots of a growing stream are views into its buffer, which later
+    appends leave alone; ring buffers copy, as they overwrite the oldest
+    samples.
+
+    :param columns: values per sample, e.g. 2 for x and y, 3 with sigma
+    :param capacity: initial capacity of a growing stream, or the size of a
+        ring buffer
+    :param ring: keep only the last ``capacity`` samples
+    """
+
+    def __init__(self, columns: int = 2, capacity: int = 1 << 16, ring: bool = False):
+        self.columns = columns
+        self.ring = ring
+        self._buffer = np.empty((columns, max(capacity, 1)))
+        self._count = 0
+        self._time = time.monotonic()
+        self._lock = threading.Lock()
+        self.reader = None
+        self.snapshot = Snapshot(tuple(self._buffer[:, :0]), 0, self._time)
+
+    def __repr__(self):
+        kind = "ring" if self.ring else "growing"
+        return f"<Stream {kind}, {self.columns} columns, {self.snapshot.count} samples>"
+
+    @property
+    def count(self) -> int:
+        """Samples appended so far, published or not"""
+        return self._count
+
+    def append(self, samples) -> None:
+        """Append samples, thread safe
+
+        A full growing stream is copied to a buffer of twice the capacity
+        first.
+
+        :param samples: ``(n, columns)`` array, or a single sample
+        """
+        samples = np.asarray(samples, dtype=float).reshape(-1, self.columns)
+        n = len(samples)
+        if n == 0:
+            return
+        with self._lock:
+            capacity = self._buffer.shape[1]
+            if self.ring:
+                if n > capacity:
+                    samples, n = samples[-capacity:], capacity
+                start = self._count % capacity
+                head = min(n, capacity - start)
+                self._buffer[:, start : start + head] = samples[:head].T
+                self._buffer[:, : n - head] = samples[head:].T
+            else:
+                if self._count + n > capacity:
+                    grown = np.empty((self.columns, max(2 * capacity, self._count + n)))
+                    grown[:, : self._count] = self._buffer[:, : self._count]
+                    self._buffer = grown
+                self._buffer[:, self._count : self._count + n] = samples.T
+            self._count += n
+            self._time = time.monotonic()
+
+    def update(self) -> bool:
+        """Publish the samples appended since the last update
+
+        :return: whether there were any
+        """
+        with self._lock:
+            count = self._count
+            if count == self.snapshot.count:
+                return False
+            capacity = self._buffer.shape[1]
+            if not self.ring:
+                columns = self._buffer[:, :count]
+            elif count <= capacity:
+                columns = self._buffer[:, :count].copy()
+            else:
+                start = count % capacity
+                columns = np.concatenate(
+                    (self._buffer[:, start:], self._buffer[:, :start]), axis=1
+                )
+            self.snapshot = Snapshot(tuple(columns), count, self._time)
+        return True
+
+    def close(self) -> None:
+        """Stop the reader, if any"""
+        if self.reader is not None:
+            self.reader.stop()
+
+
+def stream_column(value, index: int):
+    """Column ``index`` of the published samples if ``value`` is a
+    :class:`Stream`, else ``value``
+
+    :return: the column, or ``None`` if the stream has no such column
+    """
+    if not isinstance(value, Stream):
+        return value
+    columns = value.snapshot.columns
+    return columns[index] if index < len(columns) else None
+
+
+def _parse(text: bytes, columns: int, delimiter: Optional[str]) -> np.ndarray:
+    """Rows of numbers in ``text``, skipping lines that aren't, e.g. headers"""
+    if delimiter is not None:
+        text = text.replace(delimiter.encode(), b" ")
+    if not text.strip():
+        return np.empty((0, columns))
+    try:
+        # raises unless every line has as many values as the first
+        values = np.loadtxt(io.BytesIO(text), ndmin=2)
+        if values.shape[1] == columns:
+            return values
+    except ValueError:
+        pass
+    rows = []
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) == columns:
+            try:
+                rows.append([float(field) for field in fields])
+            except ValueError:
+                pass
+    return np.array(rows, dtype=float).reshape(-1, columns)
+
+
+class StreamReader(threading.Thread):
+    """Append the delimited lines read from a byte source to a stream
+
+    The reader ends when the source is exhausted, when :meth:`stop` is
+    called, or after the stream was garbage collected.
+
+    :param stream: stream to append to
+    :param read: ``read(size)`` returning the bytes available, blocking until
+        some are; ``b""`` means the end, or no data yet if ``follow``
+    :param follow: keep polling at the end, like ``tail -f``
+    :param delimiter: between the values of a line, whitespace by default
+    :param interval: seconds between polls at the end when following
+    :param close: called when the reader ends
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(
+        self, stream, read, follow=False, delimiter=None, interval=0.05, close=None
+    ):
+        super().__init__(daemon=True)
+        self._stream = weakref.ref(stream)
+        self._columns = stream.columns
+        self._read = read
+        self._follow = follow
+        self._delimiter = delimiter
+        self._interval = interval
+        self._close = close
+        self._stopping = threading.Event()
+        self.error = None
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        rest = b""
+        try:
+            while not self._stopping.is_set():
+                chunk = self._read(self.CHUNK_SIZE)
+                if not chunk:
+                    if not self._follow or self._stream() is None:
+                        break
+                    self._stopping.wait(self._interval)
+                    continue
+                rest += chunk
+                end = rest.rfind(b"\n") + 1
+                if not end:
+                    continue
+                lines, rest = rest[:end], rest[end:]
+                stream = self._stream()
+                if stream is None:
+                    break
+                stream.append(_parse(lines, self._columns, self._delimiter))
+                del stream
+        except Exception as e:
+            self.error = e
+        finally:
+            if self._close is not None:
+                self._close()
+
+
+def _start(stream, read, **kwargs):
+    stream.reader = StreamReader(stream, read, **kwargs)
+    stream.reader.start()
+    return stream
+
+
+def follow_file(
+    path: str,
+    columns: int = 2,
+    delimiter: Optional[str] = None,
+    capacity: int = 1 << 16,
+    ring: bool = False,
+    interval: float = 0.05,
+) -> Stream:
+    """Stream the lines of a text file while it is being written
+
+    Lines already in the file are read first. Lines that aren't
+    ``columns`` numbers, e.g. a header, are skipped.
+
+    :param path: file to follow
+    :param columns: values per line
+    :param delimiter: between the values, whitespace by default, e.g. ``","``
+    :param capacity: see :class:`Stream`
+    :param ring: see :class:`Stream`
+    :param interval: seconds between checks for new lines
+    """
+    f = open(path, "rb")
+    return _start(
+        Stream(columns, capacity, ring),
+        f.read,
+        follow=True,
+        delimiter=delimiter,
+        interval=interval,
+        close=f.close,
+    )
+
+
+def read_socket(
+    address,
+    columns: int = 2,
+    delimiter: Optional[str] = None,
+    capacity: int = 1 << 16,
+    ring: bool = False,
+) -> Stream:
+    """Stream the lines sent to a local socket until it is closed
+
+    :param address: ``(host, port)`` of a TCP socket or the path of a Unix
+        socket to connect to
+    :param columns: values per line
+    :param delimiter: between the values, whitespace by default
+    :param capacity: see :class:`Stream`
+    :param ring: see :class:`Stream`
+    """
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(address)
+    return _start(
+        Stream(columns, capacity, ring),
+        sock.recv,
+        delimiter=delimiter,
+        close=sock.close,
+    )
+
+
+def read_pipe(
+    pipe,
+    columns: int = 2,
+    delimiter: Optional[str] = None,
+    capacity: int = 1 << 16,
+    ring: bool = False,
+) -> Stream:
+    """Stream the lines written to a pipe until it is closed
+
+    :param pipe: file descriptor, file object like a subprocess's ``stdout``,
+        or path of a named pipe
+    :param columns: values per line
+    :param delimiter: between the values, whitespace by default
+    :param capacity: see :class:`Stream`
+    :param ring: see :class:`Stream`
+    """
+    close = None
+    if isinstance(pipe, str):
+        pipe = os.open(pipe, os.O_RDONLY)
+        close = functools.partial(os.close, pipe)
+    fd = pipe if isinstance(pipe, int) else pipe.fileno()
+    return _start(
+        Stream(columns, capacity, ring),
+        lambda size: os.read(fd, size),
+        delimiter=delimiter,
+        close=close,
+    )
@@ -1,10 +1,14 @@
 import sys
-from .app import App
+
+from .profiler import STARTUP
 
 
 def main():
+    for name in ("tkinter", "numpy"):
+        STARTUP.import_module(name)
+    App = STARTUP.import_module("ActFit.ui.app").App
     sys.exit(
-        App.run(
+        App.run_from_cmd(
             src="""def f(xs, m, b, c):
     return m * np.sin(b * xs) + c
 
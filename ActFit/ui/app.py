@@ -1,21 +1,33 @@
 import argparse as argp
+import atexit
 from copy import copy
 import inspect
+import os
+import sys
 import tkinter as tk
-from tkinter import messagebox, filedialog
+from tkinter import messagebox, filedialog, simpledialog
 from tkinter import scrolledtext
 import tkinter.ttk as ttk
 
 import numpy as np
-import scipy.optimize as opt
 
 
 from .env import Env
+from .sandbox import SandboxEnv
 from .param_slider import ParamSlider
 from .plot import Plot
 from .fitui import FitUI
+from .landscape import LandscapeView
+from .uncertainty import UncertaintyView
+from .stats import StatsPanel
+from .profiler import PROFILER, STARTUP
 from .utils import *
-from ..file import dump
+from ..compiled import ModelCache
+from ..file import Archive, dump
+from ..roi import select
+from ..stats import fit_statistics
+from .. import batch, loaders
+from ..stream import Stream, stream_column
 
 
 _ABOUT_TEXT = (
@@ -41,15 +53,43 @@ _ABOUT_TEXT = (
 
 
 class App(ttk.Frame):
-    def __init__(self, *args, src=None, **kwargs):
+    def __init__(
+        self,
+        *args,
+        src=None,
+        sandbox=False,
+        cpu_limit=10.0,
+        memory_limit=None,
+        timeout=60.0,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
 
-        self._env = Env(globals_={"np": np})
+        if sandbox:
+            self._env = SandboxEnv(
+                globals_={"np": np},
+                cpu_seconds=cpu_limit,
+                memory_bytes=memory_limit,
+                timeout=timeout,
+            )
+        else:
+            self._env = Env(globals_={"np": np})
+        self._sandboxed = sandbox
+        self._models = ModelCache()
+        self._python_models = ModelCache(backends=[])
+        self._compile = tk.BooleanVar(self, True)
 
         menubar = tk.Menu(self)
 
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Save Fit", command=event_wrapper(self._save_fit))
+        file_menu.add_command(
+            label="Save Fit with Data",
+            command=event_wrapper(lambda: self._save_fit(with_data=True)),
+        )
+        file_menu.add_command(
+            label="Add Fit to Archive", command=event_wrapper(self._archive_fit)
+        )
         file_menu.add_separator()
         file_menu.add_command(
             label="Load Source", command=event_wrapper(self._load_source)
@@ -57,17 +97,48 @@ class App(ttk.Frame):
         file_menu.add_command(
             label="Save Source", command=event_wrapper(self._save_source)
         )
+        file_menu.add_command(label="Load Data", command=event_wrapper(self._load_data))
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.quit)
         menubar.add_cascade(label="File", menu=file_menu)
 
+        options_menu = tk.Menu(menubar, tearoff=0)
+        options_menu.add_checkbutton(label="Compile Models", variable=self._compile)
+        menubar.add_cascade(label="Options", menu=options_menu)
+
+        view_menu = tk.Menu(menubar, tearoff=0)
+        view_menu.add_command(
+            label="χ² Landscape", command=event_wrapper(self._open_landscape)
+        )
+        view_menu.add_command(
+            label="Parameter Uncertainty",
+            command=event_wrapper(self._open_uncertainty),
+        )
+        menubar.add_cascade(label="View", menu=view_menu)
+
+        self._profile = tk.BooleanVar(self, False)
+        debug_menu = tk.Menu(menubar, tearoff=0)
+        debug_menu.add_checkbutton(
+            label="Profile",
+            variable=self._profile,
+            command=event_wrapper(self._toggle_profile),
+        )
+        debug_menu.add_command(
+            label="Export Trace", command=event_wrapper(self._export_trace)
+        )
+        debug_menu.add_command(label="Clear Trace", command=PROFILER.clear)
+        debug_menu.add_command(
+            label="Startup Report", command=event_wrapper(self._show_startup)
+        )
+        menubar.add_cascade(label="Debug", menu=debug_menu)
+
         menubar.add_command(label="About", command=event_wrapper(self._spawn_about))
 
         self.master.config(menu=menubar)
 
         self._src = self._env.build_src_view(self)
         self._src.pack(fill=tk.BOTH, expand=True)
-        self._src.populate(src)
+        self._src.populate(src, run=False)
 
         picker_frame = ttk.Frame(self)
         picker_frame.pack(fill=tk.BOTH, expand=True)
@@ -78,6 +149,9 @@ class App(ttk.Frame):
         self._plot = Plot(self)
         self._plot.pack(fill=tk.BOTH, expand=True)
 
+        self._stats = StatsPanel(self)
+        self._stats.pack(fill=tk.X, expand=False)
+
         self._func_choice = self._env.build_picker(
             picker_frame, "Function", callable_=True, command=self._fitui.update
         )
@@ -93,31 +167,180 @@ class App(ttk.Frame):
         )
         self._data_choice.grid(column=2, row=2, sticky="ew")
 
-        self.bind_all("<<SOURCE.DONE>>", event_wrapper(self._plot.reset), add="+")
-        self.bind_all("<<SOURCE.RESET>>", event_wrapper(self._plot.reset), add="+")
-        self.bind_all("<<FITUI.UPDATED>>", event_wrapper(self._plot.plot), add="+")
-        self.bind_all("<<PARAM.UPDATED>>", event_wrapper(self._plot.plot), add="+")
-        self.bind_all("<<FITUI.DONE>>", event_wrapper(self._plot.plot), add="+")
-        self.bind_all(
-            "<<PICKER.CHOSEN.Space>>", event_wrapper(self._plot.plot), add="+"
+        self._sigma_choice = self._env.build_picker(
+            picker_frame,
+            "Sigma",
+            callable_=False,
+            command=self._plot.update_fit,
+            optional=True,
+        )
+        self._sigma_choice.grid(column=3, row=2, sticky="ew")
+
+        dataset_frame = ttk.Frame(picker_frame)
+        dataset_frame.grid(column=4, row=2, sticky="ew")
+        ttk.Label(dataset_frame, text="Dataset:").grid(column=0, row=0)
+        self._dataset = tk.StringVar(self, "0")
+        self._dataset_box = ttk.Spinbox(
+            dataset_frame,
+            from_=0,
+            to=0,
+            width=5,
+            textvariable=self._dataset,
+            command=event_wrapper(self._select_dataset),
+        )
+        self._dataset_box.grid(column=1, row=0)
+
+        self._timing = tk.StringVar(self, "")
+        timing_label = ttk.Label(picker_frame, textvariable=self._timing)
+        timing_label.grid(column=0, row=3, columnspan=5, sticky="w")
+
+        self._bind_event("<<SOURCE.DONE>>", self._plot.reset, self._fitui.update)
+        self._bind_event("<<SOURCE.RESET>>", self._plot.reset)
+        self._bind_event("<<FITUI.UPDATED>>", self._plot.plot)
+        self._bind_event(
+            "<<PARAM.UPDATED>>", self._plot.update_fit, self._update_landscape
         )
-        self.bind_all("<<PICKER.CHOSEN.Data>>", event_wrapper(self._plot.plot), add="+")
-        self.bind_all(
-            "<<PICKER.CHOSEN.Function>>",
-            event_wrapper(chain_call(self._fitui.update, self._plot.plot)),
-            add="+",
+        self._bind_event("<<FITUI.DONE>>", self._plot.refine, self._update_landscape)
+        self._bind_event("<<FITUI.UNCERTAINTY>>", self._open_uncertainty)
+        self._bind_event("<<PLOT.EVALUATED>>", self._stats.update)
+        self._bind_event("<<PICKER.CHOSEN.Space>>", self._plot.plot)
+        self._bind_event(
+            "<<PICKER.CHOSEN.Data>>", self._update_datasets, self._plot.plot
         )
+        self._bind_event("<<PICKER.CHOSEN.Sigma>>", self._plot.update_fit)
+        self._bind_event(
+            "<<PICKER.CHOSEN.Function>>", self._fitui.update, self._plot.plot
+        )
+
+        self._landscape = None
+        self._uncertainty = None
+
+        # run the source once the window is shown, the first plot then
+        # imports matplotlib
+        self._mapped = self.bind("<Map>", event_wrapper(self._start))
+
+    def _start(self):
+        self.unbind("<Map>", self._mapped)
+        STARTUP.mark("window shown")
+        self.after_idle(event_wrapper(self._run_source))
+        self.after(self.STREAM_INTERVAL, self._poll_streams)
+
+    STREAM_INTERVAL = 100  # ms
 
+    def _poll_streams(self):
+        choices = (self._xs_choice, self._data_choice, self._sigma_choice)
+        streams = {id(c.value): c.value for c in choices if isinstance(c.value, Stream)}
+        if any([stream.update() for stream in streams.values()]):
+            self._plot.extend()
+        if self.stream is not None:
+            self._fitui.stream_updated(self.stream.snapshot)
+        self.after(self.STREAM_INTERVAL, self._poll_streams)
+
+    def _run_source(self):
         self._src.run()
+        STARTUP.mark("source executed")
         self._fitui.update()
+        self._update_timing()
+
+    def _update_datasets(self):
+        datasets = self.datasets
+        self._dataset_box.config(to=len(datasets) - 1 if datasets else 0)
+        self._dataset.set(str(self.dataset_index))
+
+    def _select_dataset(self):
+        self._fitui.show_dataset(self.dataset_index)
+        self._plot.plot()
+
+    def _open_landscape(self):
+        if self._landscape is not None and self._landscape.winfo_exists():
+            self._landscape.lift()
+            return
+        self._landscape = LandscapeView(self)
+
+    def _open_uncertainty(self):
+        if self._uncertainty is not None and self._uncertainty.winfo_exists():
+            self._uncertainty.lift()
+            return
+        self._uncertainty = UncertaintyView(self)
+
+    def _update_landscape(self):
+        if self._landscape is not None and self._landscape.winfo_exists():
+            self._landscape.update_overlay()
+
+    def set_params(self, values):
+        """Move the named sliders to ``values`` and update the fit"""
+        self._fitui.set_values(values)
+
+    def _bind_event(self, sequence, *funcs):
+        handler = funcs[0] if len(funcs) == 1 else chain_call(*funcs)
+        name = f"{sequence} {handler.__qualname__}"
+        self.bind_all(sequence, event_wrapper(handler, name=name), add="+")
+
+    def _fit_record(self, with_data=False):
+        fit_kwargs = self._fitui.fit_kwargs
+        xs, data, sigma = self.fit_arrays
+        stats = {
+            "n_params": len(self.params),
+            "loss": fit_kwargs["loss"],
+            "weighted": sigma is not None,
+            "absolute_sigma": fit_kwargs["absolute_sigma"],
+        }
+        if self.plot_ready:
+            result = fit_statistics(
+                self.evaluate(xs), data, len(self.params), sigma=sigma
+            )
+            stats.update(
+                n_points=result.n_points,
+                rss=result.rss,
+                chi2=result.chi2,
+                reduced_chi2=result.reduced_chi2,
+                r_squared=result.r_squared,
+            )
+        return dict(
+            bounds=self._fitui.boundaries,
+            covariance=self._fitui.covariance,
+            stats=stats,
+            xs=self.xs if with_data else None,
+            data=self.data if with_data else None,
+            source=self.func_source,
+            extra=None if self.roi.everything else {"roi": self.roi.to_json()},
+        )
 
-    def _save_fit(self):
+    def _save_fit(self, with_data=False):
         path = filedialog.asksaveasfilename(
             master=self, filetypes=[("ActFit files", "*.actfit"), ("All files", "*")]
         )
-        if path:
+        if not path:
+            return
+        try:
             with open(path, "wb") as f:
-                dump(self.func, self.params, f)
+                dump(self.func, self.params, f, **self._fit_record(with_data))
+        except (TypeError, ValueError) as e:
+            # e.g. a lambda without source, don't leave a broken file behind
+            os.remove(path)
+            messagebox.showerror(type(e).__name__, e.args[0] if e.args else path)
+
+    def _archive_fit(self):
+        path = filedialog.asksaveasfilename(
+            master=self,
+            filetypes=[("ActFit archives", "*.actarc"), ("All files", "*")],
+            confirmoverwrite=False,
+        )
+        if not path:
+            return
+        key = simpledialog.askstring(
+            "Add Fit to Archive",
+            "Key:",
+            initialvalue=self._data_choice.name or "",
+            parent=self,
+        )
+        if not key:
+            return
+        try:
+            with Archive(path, "a") as archive:
+                archive.append(key, self.func, self.params, **self._fit_record())
+        except Exception as e:
+            messagebox.showerror(type(e).__name__, e.args[0] if e.args else path)
 
     def _load_source(self):
         path = filedialog.askopenfilename(
@@ -127,6 +350,40 @@ class App(ttk.Frame):
             with open(path, "r") as f:
                 self._src.populate(f.read())
 
+    def _load_data(self):
+        filetypes = [
+            ("NumPy files", (".npy",)),
+            ("Text files", loaders.CSV_EXTENSIONS),
+            ("HDF5 files", loaders.HDF5_EXTENSIONS),
+            ("Raw binary files", loaders.RAW_EXTENSIONS),
+        ]
+        path = filedialog.askopenfilename(
+            master=self,
+            filetypes=[
+                (label, " ".join("*" + extension for extension in extensions))
+                for label, extensions in filetypes
+            ]
+            + [("All files", "*")],
+        )
+        if not path:
+            return
+        kwargs = {}
+        if path.lower().endswith(loaders.RAW_EXTENSIONS):
+            dtype = simpledialog.askstring(
+                "Load Data", "Element type:", initialvalue="<f8", parent=self
+            )
+            if not dtype:
+                return
+            kwargs["dtype"] = dtype
+        try:
+            arrays = loaders.load(path, **kwargs)
+        except Exception as e:
+            messagebox.showerror(type(e).__name__, e.args[0] if e.args else path)
+            return
+        for name, array in arrays.items():
+            self._env.bind(name, array)
+        self._plot.plot()
+
     def _save_source(self):
         path = filedialog.asksaveasfilename(
             master=self, filetypes=[("Python files", "*.py"), ("All files", "*")]
@@ -135,6 +392,38 @@ class App(ttk.Frame):
             with open(path, "w") as f:
                 f.write(self._src.text)
 
+    TIMING_INTERVAL = 500  # ms
+
+    def _update_timing(self):
+        model = self.model
+        if model is None:
+            self._timing.set("")
+        else:
+            self._timing.set(
+                f"{model.__name__}: {model.backend or 'python'}, "
+                f"{model.mean_time * 1e3:.3f} ms/evaluation ({model.calls} calls)"
+            )
+        if PROFILER.enabled:
+            self._plot.update_profile()
+        self.after(self.TIMING_INTERVAL, self._update_timing)
+
+    def _toggle_profile(self):
+        PROFILER.enabled = self._profile.get()
+        self._plot.show_profile = PROFILER.enabled
+        self._plot.update_fit()
+
+    def _show_startup(self):
+        messagebox.showinfo("Startup", STARTUP.report(), parent=self)
+
+    def _export_trace(self):
+        path = filedialog.asksaveasfilename(
+            master=self,
+            defaultextension=".json",
+            filetypes=[("Chrome trace", "*.json"), ("All files", "*")],
+        )
+        if path:
+            PROFILER.export(path)
+
     def _spawn_about(self):
         t = tk.Toplevel(self)
         t.wm_title("About")
@@ -148,35 +437,203 @@ class App(ttk.Frame):
     def params(self):
         return self._fitui.params
 
+    @property
+    def boundaries(self):
+        return self._fitui.boundaries
+
+    @property
+    def fit_path(self):
+        """Parameters at every evaluation of the last fit, one row each"""
+        return self._fitui.fit_path
+
+    @property
+    def covariance(self):
+        return self._fitui.covariance
+
+    @property
+    def fit_kwargs(self):
+        return self._fitui.fit_kwargs
+
+    @property
+    def evaluation(self):
+        return self._plot.evaluation
+
     @property
     def func(self):
         return self._func_choice.value
 
+    @property
+    def func_name(self):
+        return self._func_choice.name
+
+    @property
+    def func_source(self):
+        return self._env.sources.get(self._func_choice.name)
+
+    @property
+    def jacobian_source(self):
+        """Source to derive the model's Jacobian from, ``None`` in the sandbox,
+        where the derivative would run outside of it"""
+        return None if self._sandboxed else self.func_source
+
+    @property
+    def model(self):
+        func = self.func
+        if func is None:
+            return None
+        # compiled models would evaluate the source outside of the sandbox
+        compile_ = self._compile.get() and not self._sandboxed
+        models = self._models if compile_ else self._python_models
+        return models.get(func, self.func_source)
+
     @property
     def ys(self):
         if self.xs is None or self.func is None:
             return None
-        return self.func(self.xs, **self.params)
+        return self.evaluate(self.xs)
+
+    def evaluate(self, xs):
+        with PROFILER.span("model"):
+            return self.model(xs, **self.params)
+
+    @staticmethod
+    def _stacked(value):
+        """Whether ``value`` is a list of datasets"""
+        return (
+            isinstance(value, (list, tuple))
+            and len(value) > 0
+            and all(np.ndim(item) >= 1 for item in value)
+        )
 
     @property
-    def xs(self):
+    def datasets(self):
+        """The Data choice if it is a list of datasets, else ``None``"""
+        value = self._data_choice.value
+        return value if self._stacked(value) else None
+
+    @property
+    def dataset_index(self):
+        datasets = self.datasets
+        if datasets is None:
+            return 0
+        try:
+            index = int(self._dataset.get())
+        except ValueError:
+            index = 0
+        return min(max(index, 0), len(datasets) - 1)
+
+    def _selected(self, value):
+        """The current dataset's item of a list that matches the datasets"""
+        datasets = self.datasets
+        if datasets is None or not self._stacked(value) or len(value) != len(datasets):
+            return value
+        item = value[self.dataset_index]
+        return item if isinstance(item, np.ndarray) else np.asarray(item)
+
+    @property
+    def dataset_xs(self):
         return self._xs_choice.value
 
+    @property
+    def dataset_sigma(self):
+        return self._sigma_choice.value
+
+    @property
+    def stream(self):
+        """The Data choice if it is a :class:`~ActFit.stream.Stream`"""
+        value = self._data_choice.value
+        return value if isinstance(value, Stream) else None
+
+    @property
+    def xs(self):
+        # a stream's first column as Space, its second as Data, third as Sigma
+        return self._selected(stream_column(self._xs_choice.value, 0))
+
     @property
     def data(self):
-        return self._data_choice.value
+        return self._selected(stream_column(self._data_choice.value, 1))
+
+    @property
+    def sigma(self):
+        """Uncertainties broadcast to the shape of the data, or ``None``"""
+        sigma = self._selected(stream_column(self._sigma_choice.value, 2))
+        data = self.data
+        if sigma is None or data is None:
+            return None
+        sigma = np.asarray(sigma, dtype=float)
+        if sigma.shape != np.shape(data):
+            sigma = np.broadcast_to(sigma, np.shape(data))
+        return sigma
+
+    @property
+    def roi(self):
+        """Region of interest of one-dimensional data, see :mod:`ActFit.roi`"""
+        return self._plot.roi
+
+    @property
+    def fit_arrays(self):
+        """``(xs, data, sigma)`` inside the region of interest, which fits use
+
+        Every access selects them again, so read them once per action.
+        """
+        return select(self.roi, self.xs, self.data, self.sigma)
 
     @property
     def plot_ready(self):
         return self.func is not None and self.xs is not None and self.data is not None
 
     @classmethod
-    def run_from_cmd(cls):
+    def run_from_cmd(cls, **kwargs):
         parser = argp.ArgumentParser()
+        parser.add_argument(
+            "--sandbox",
+            action="store_true",
+            help="execute the source in a separate, resource limited process",
+        )
+        parser.add_argument(
+            "--cpu-limit",
+            type=float,
+            default=10.0,
+            help="CPU seconds per execution or model call in the sandbox",
+        )
+        parser.add_argument(
+            "--memory-limit",
+            type=float,
+            default=None,
+            help="address space of the sandbox in MiB",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=60.0,
+            help="wall seconds per execution or model call in the sandbox",
+        )
+        parser.add_argument(
+            "--startup-report",
+            action="store_true",
+            help="print the startup milestones and import times on exit",
+        )
+        commands = parser.add_subparsers(dest="command")
+        batch_parser = commands.add_parser(
+            "batch", help="fit many data files without opening a window"
+        )
+        batch.add_arguments(batch_parser)
 
         args = parser.parse_args()
 
-        cls.run()
+        if args.command == "batch":
+            return batch.main(args)
+        if args.startup_report:
+            atexit.register(lambda: print(STARTUP.report(), file=sys.stderr))
+        return cls.run(
+            sandbox=args.sandbox,
+            cpu_limit=args.cpu_limit,
+            memory_limit=None
+            if args.memory_limit is None
+            else int(args.memory_limit * 2 ** 20),
+            timeout=args.timeout,
+            **kwargs,
+        )
 
     @classmethod
     def run(cls, **kwargs):
@@ -187,7 +644,10 @@ class App(ttk.Frame):
         s.theme_use("clam")
         app = cls(root, **kwargs)
         app.pack(fill=tk.BOTH, expand=True)
-        app.mainloop()
+        try:
+            app.mainloop()
+        finally:
+            app._env.close()
 
 
 if __name__ == "__main__":
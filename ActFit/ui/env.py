@@ -1,15 +1,21 @@
+from collections import namedtuple
 import tkinter as tk
 from tkinter import messagebox
 from tkinter.scrolledtext import ScrolledText
 import tkinter.ttk as ttk
 
 
+from ..source import function_sources, split_statements, statement_names
+from .profiler import PROFILER
 from .utils import *
 
 
 __all__ = ("Env",)
 
 
+Cell = namedtuple("Cell", ("text", "reads", "writes"))
+
+
 class Env:
     def __init__(self, globals_=None):
         self._pickers = []
@@ -19,13 +25,67 @@ class Env:
     def reset(self):
         self._globals = self._original_globals
         self.locals = {}
+        self.sources = {}
         self.callables = []
         self.non_callables = []
+        self.executed = 0
+        self._cells = []
         for picker in self._pickers:
             picker.clear()
 
-    def exec(self, code):
-        exec(code, self._globals, self.locals)
+    def exec(self, code, incremental=True):
+        """Execute source code statement by statement
+
+        In incremental mode only top-level statements that changed since the
+        last call, or that read or rebind a name one of those (re)bound, are
+        executed; every other binding in :attr:`locals` is kept.
+        """
+        with PROFILER.span("Env.exec"):
+            self._exec(code, incremental)
+
+    def _exec(self, code, incremental):
+        statements = split_statements(code)
+        previous = {}
+        for cell in self._cells if incremental else []:
+            previous.setdefault(cell.text, []).append(cell)
+        matched = [
+            previous[statement.text].pop(0) if previous.get(statement.text) else None
+            for statement in statements
+        ]
+        stale = self._cells if not incremental else sum(previous.values(), [])
+        dirty = set()
+        for cell in stale:
+            dirty.update(cell.writes)
+        for name in dirty:
+            self.locals.pop(name, None)
+
+        cells = []
+        self.executed = 0
+        try:
+            for statement, cell in zip(statements, matched):
+                reads, writes = statement_names(statement.node)
+                if cell is None or (reads | writes) & dirty:
+                    # pad with newlines to keep line numbers in tracebacks
+                    text = "\n" * (statement.lineno - 1) + statement.text
+                    exec(compile(text, "<source>", "exec"), self._globals, self.locals)
+                    dirty.update(writes)
+                    self.executed += 1
+                cells.append(Cell(statement.text, reads, writes))
+        finally:
+            self._cells = cells
+            self.sources = function_sources(code)
+            self._refresh()
+
+    def bind(self, name, value):
+        """Bind a value that does not come from the source, e.g. loaded data
+
+        Such bindings survive incremental re-runs unless a statement rebinds
+        the same name.
+        """
+        self.locals[name] = value
+        self._refresh()
+
+    def _refresh(self):
         self.callables = [key for key, value in self.locals.items() if callable(value)]
         self.non_callables = [
             key for key, value in self.locals.items() if not callable(value)
@@ -42,6 +102,9 @@ class Env:
     def get(self, key, default=None):
         return self.locals.get(key, default)
 
+    def close(self):
+        pass
+
     def build_src_view(self, master):
         class SourceView(ttk.Frame):
             def __init__(self, env, *args, **kwargs):
@@ -55,35 +118,45 @@ class Env:
                 self._run_button = ttk.Button(
                     self, text="Run", command=event_wrapper(self.run)
                 )
-                self._run_button.grid(column=0, row=1, columnspan=3, sticky="ew")
+                self._run_button.grid(column=0, row=1, columnspan=2, sticky="ew")
+                self._run_all_button = ttk.Button(
+                    self, text="Run All", command=event_wrapper(self.run_all)
+                )
+                self._run_all_button.grid(column=2, row=1, columnspan=2, sticky="ew")
                 self._reset_button = ttk.Button(
                     self, text="Reset", command=event_wrapper(self.reset)
                 )
-                self._reset_button.grid(column=3, row=1, columnspan=3, sticky="ew")
+                self._reset_button.grid(column=4, row=1, columnspan=2, sticky="ew")
 
             @property
             def text(self):
                 return self._text.get("1.0", "end-1c")
 
-            def run(self):
+            def run(self, incremental=True):
                 try:
-                    self._env.exec(self.text)
+                    self._env.exec(self.text, incremental=incremental)
                 except Exception as e:
                     messagebox.showwarning(type(e).__name__, e.args[0])
                 self.event_generate("<<SOURCE.DONE>>")
 
+            def run_all(self):
+                self.run(incremental=False)
+
             def reset(self):
                 self._text.delete("1.0", tk.END)
                 self._env.reset()
                 self.event_generate("<<SOURCE.RESET>>")
 
-            def populate(self, src):
+            def populate(self, src, run=True):
                 self._text.insert(tk.END, src)
-                self.run()
+                if run:
+                    self.run()
 
         return SourceView(self, master)
 
-    def build_picker(self, master, name, callable_=False, command=None):
+    def build_picker(
+        self, master, name, callable_=False, command=None, optional=False
+    ):
         class Picker(ttk.Frame):
             def __init__(self, env, *args, **kwargs):
                 super().__init__(*args, **kwargs)
@@ -112,17 +185,25 @@ class Env:
                 targets = (
                     self._env.callables if self._callable else self._env.non_callables
                 )
-                self.clear()
-                if targets:
-                    for name in targets:
-                        self._choice_menu["menu"].add_command(
-                            label=name, command=tk._setit(self._choice, name)
-                        )
-                    self._choice.set(targets[0])
+                if optional:
+                    targets = [""] + targets
+                current = self._choice.get()
+                self._choice_menu["menu"].delete(0, "end")
+                for name in targets:
+                    self._choice_menu["menu"].add_command(
+                        label=name or "(none)", command=tk._setit(self._choice, name)
+                    )
+                if current not in targets:
+                    self._choice.set(targets[0] if targets else "")
+
+            @property
+            def name(self):
+                return self._choice.get()
 
             @property
             def value(self):
-                return self._env.get(self._choice.get())
+                name = self._choice.get()
+                return self._env.get(name) if name else None
 
         picker = Picker(self, master)
         self._pickers.append(picker)
@@ -1,11 +1,17 @@
+from collections import deque
+import queue
+import time
 import tkinter as tk
 from tkinter import messagebox
 import tkinter.ttk as ttk
 
 import numpy as np
-import scipy.optimize as opt
 
+from ..cache import FitCache
+from ..fit import LOSSES, parameter_names
+from .history import History
 from .param_slider import ParamSlider
+from .worker import FitWorker, GlobalFitWorker, SeedWorker
 from .utils import *
 
 
@@ -13,6 +19,8 @@ __all__ = ("FitUI",)
 
 
 class FitUI(ttk.Frame):
+    POLL_INTERVAL = 50  # ms
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -20,8 +28,113 @@ class FitUI(ttk.Frame):
         self._slider_frame.pack(fill=tk.BOTH, expand=True)
         self._sliders = dict()
 
-        button = ttk.Button(self, text="Fit", command=event_wrapper(self.perform_fit))
-        button.pack(fill=tk.X, expand=True)
+        button_frame = ttk.Frame(self)
+        button_frame.pack(fill=tk.X, expand=True)
+        for column in range(3):
+            button_frame.columnconfigure(column, weight=1)
+
+        self._fit_button = ttk.Button(
+            button_frame, text="Fit", command=event_wrapper(self.perform_fit)
+        )
+        self._fit_button.grid(row=0, column=0, sticky="ew")
+        self._seed_button = ttk.Button(
+            button_frame, text="Auto-seed", command=event_wrapper(self.auto_seed)
+        )
+        self._seed_button.grid(row=0, column=1, sticky="ew")
+        self._cancel_button = ttk.Button(
+            button_frame,
+            text="Cancel",
+            command=event_wrapper(self.cancel_fit),
+            state=tk.DISABLED,
+        )
+        self._cancel_button.grid(row=0, column=2, sticky="ew")
+        self._undo_button = ttk.Button(
+            button_frame,
+            text="Undo",
+            command=event_wrapper(self.undo),
+            state=tk.DISABLED,
+        )
+        self._undo_button.grid(row=1, column=0, sticky="ew")
+        self._redo_button = ttk.Button(
+            button_frame,
+            text="Redo",
+            command=event_wrapper(self.redo),
+            state=tk.DISABLED,
+        )
+        self._redo_button.grid(row=1, column=1, sticky="ew")
+        self._global_button = ttk.Button(
+            button_frame, text="Global fit", command=event_wrapper(self.global_fit)
+        )
+        self._global_button.grid(row=1, column=2, sticky="ew")
+
+        self._loss = tk.StringVar(self, LOSSES[0])
+        loss_frame = ttk.Frame(button_frame)
+        loss_frame.grid(row=2, column=0, columnspan=2, sticky="ew")
+        ttk.Label(loss_frame, text="Loss:").pack(side=tk.LEFT)
+        ttk.Combobox(
+            loss_frame, textvariable=self._loss, values=LOSSES, state="readonly"
+        ).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self._absolute_sigma = tk.BooleanVar(self, False)
+        ttk.Checkbutton(
+            button_frame, text="Absolute sigma", variable=self._absolute_sigma
+        ).grid(row=2, column=2, sticky="w")
+
+        ttk.Button(
+            button_frame,
+            text="Uncertainty",
+            command=event_wrapper(self.uncertainty),
+        ).grid(row=4, column=2, sticky="ew")
+
+        self._live = tk.BooleanVar(self, False)
+        self._live_samples = tk.StringVar(self, "1000")
+        self._live_seconds = tk.StringVar(self, "5")
+        live_frame = ttk.Frame(button_frame)
+        live_frame.grid(row=3, column=0, columnspan=3, sticky="ew")
+        ttk.Checkbutton(
+            live_frame,
+            text="Live fit every",
+            variable=self._live,
+            command=event_wrapper(self._toggle_live),
+        ).pack(side=tk.LEFT)
+        ttk.Spinbox(
+            live_frame,
+            from_=1,
+            to=10**9,
+            increment=100,
+            width=8,
+            textvariable=self._live_samples,
+        ).pack(side=tk.LEFT)
+        ttk.Label(live_frame, text="samples or").pack(side=tk.LEFT)
+        ttk.Spinbox(
+            live_frame,
+            from_=0.1,
+            to=3600,
+            increment=1,
+            width=5,
+            textvariable=self._live_seconds,
+        ).pack(side=tk.LEFT)
+        ttk.Label(live_frame, text="s").pack(side=tk.LEFT)
+
+        self._status = tk.StringVar(self, "")
+        status_label = ttk.Label(self, textvariable=self._status, anchor="w")
+        status_label.pack(fill=tk.X, expand=True)
+        self._live_status = tk.StringVar(self, "")
+        live_label = ttk.Label(self, textvariable=self._live_status, anchor="w")
+        live_label.pack(fill=tk.X, expand=True)
+
+        self._worker = None
+        self._fitted = None
+        self._global = None
+        self._cache = FitCache()
+        self._func_name = None
+        self._states = dict()
+        self._histories = dict()
+        self.progress = None
+        self.fit_path = None
+        self._live_fit = None
+        self._live_count = 0
+        self._live_started = 0.0
+        self._live_finished = deque(maxlen=10)
 
     @property
     def params(self):
@@ -31,31 +144,316 @@ class FitUI(ttk.Frame):
     def boundaries(self):
         return {key: slider.boundary for key, slider in self._sliders.items()}
 
+    @property
+    def fitting(self):
+        return self._worker is not None
+
+    @property
+    def covariance(self):
+        """Covariance of the last fit, ``None`` once the parameters changed"""
+        if self._fitted is None:
+            return None
+        params, cov = self._fitted
+        if list(params) != list(self.params) or not np.allclose(
+            list(params.values()), list(self.params.values()), rtol=1e-6, atol=0
+        ):
+            return None
+        return cov
+
+    @property
+    def state(self):
+        """``{name: (lower, upper, value)}`` of all sliders with valid bounds"""
+        state = dict()
+        for name, slider in self._sliders.items():
+            try:
+                state[name] = slider.state
+            except ValueError:
+                pass
+        return state
+
+    @property
+    def _history(self):
+        return self._histories.setdefault(self._func_name, History())
+
     def update(self):
+        if self._func_name is not None:
+            self._states[self._func_name] = self.state
+        self._func_name = self.master.func_name
+        saved = self._states.get(self._func_name, {})
+        names = parameter_names(self.master.func) if self.master.func else []
+        sliders = dict()
+        for i, param in enumerate(names):
+            slider = self._sliders.pop(param, None)
+            if slider is None:
+                slider = ParamSlider(self._slider_frame, param)
+                slider.bind("<<PARAM.CHANGING>>", event_wrapper(self._remember))
+            if param in saved:
+                slider.restore(saved[param])
+            sliders[param] = slider
+            slider.grid(row=i, column=0, sticky="ew")
         for slider in self._sliders.values():
             slider.destroy()
-        self._sliders = dict()
-        if self.master.func is not None:
-            for i, param in enumerate(self.master.func.__code__.co_varnames[1:]):
-                self._sliders[param] = slider = ParamSlider(self._slider_frame, param)
-                slider.grid(row=i, column=0, sticky="ew")
+        self._sliders = sliders
+        self._update_history_buttons()
         self.event_generate("<<FITUI.UPDATED>>")
 
-    def perform_fit(self):
+    def _remember(self):
+        self._history.push(self.state)
+        self._update_history_buttons()
+
+    def _update_history_buttons(self):
+        history = self._history
+        self._undo_button.config(state=tk.NORMAL if history.can_undo else tk.DISABLED)
+        self._redo_button.config(state=tk.NORMAL if history.can_redo else tk.DISABLED)
+
+    def _restore(self, state):
+        for name, slider_state in state.items():
+            if name in self._sliders:
+                self._sliders[name].restore(slider_state)
+        self._update_history_buttons()
+        self.event_generate("<<PARAM.UPDATED>>")
+
+    def set_values(self, values):
+        """Move sliders to ``{name: value}``, as one undoable step"""
+        self._remember()
+        for name, value in values.items():
+            if name in self._sliders:
+                self._sliders[name].set_scale_value(value)
+        self.event_generate("<<PARAM.UPDATED>>")
+
+    def undo(self):
+        state = self._history.undo(self.state)
+        if state is not None:
+            self._restore(state)
+
+    def redo(self):
+        state = self._history.redo(self.state)
+        if state is not None:
+            self._restore(state)
+
+    @property
+    def _bounds(self):
+        return [
+            [v for v, _ in self.boundaries.values()],
+            [v for _, v in self.boundaries.values()],
+        ]
+
+    @property
+    def fit_kwargs(self):
+        """Weighting and loss options passed on to the fit, besides sigma"""
+        return dict(
+            absolute_sigma=self._absolute_sigma.get(),
+            loss=self._loss.get(),
+        )
+
+    def perform_fit(self, live=None):
+        """Fit from the current slider values in the background
+
+        :param live: :class:`~ActFit.stream.Snapshot` of the stream being
+            fitted; such refits bypass the fit cache and report their rate and
+            lag instead of errors
+        """
+        if self.fitting:
+            return
+        p0 = list(self.params.values())
+        xs, data, sigma = self.master.fit_arrays
+        self._start_worker(
+            "Fitting...",
+            FitWorker,
+            self.master.model,
+            xs,
+            data,
+            p0=p0,
+            bounds=self._bounds,
+            source=self.master.jacobian_source,
+            fit_kwargs=dict(self.fit_kwargs, sigma=sigma),
+            cache=self._cache if live is None else None,
+            identity=(self.master.func, self.master.func_source),
+        )
+        self._live_fit = live
+
+    def uncertainty(self):
+        """Ask for the parameter uncertainty from refits to resampled data"""
+        self.event_generate("<<FITUI.UNCERTAINTY>>")
+
+    def _toggle_live(self):
+        self._live_finished.clear()
+        self._live_status.set("")
+
+    def stream_updated(self, snapshot):
+        """Refit once enough new samples arrived, or enough time passed
+
+        Refits start from the current slider values, i.e. the last fit's
+        result.
+
+        :param snapshot: :class:`~ActFit.stream.Snapshot` of the Data stream
+        """
+        if not self._live.get() or self.fitting or not self.master.plot_ready:
+            return
+        new = snapshot.count - self._live_count
+        if new <= 0:
+            return
         try:
-            params, cov = opt.curve_fit(
-                self.master.func,
-                self.master.xs,
-                self.master.data,
-                p0=list(self.params.values()),
-                bounds=[
-                    [v for v, _ in self.boundaries.values()],
-                    [v for _, v in self.boundaries.values()],
-                ],
+            every = int(self._live_samples.get())
+            interval = float(self._live_seconds.get())
+        except ValueError:
+            return
+        if new < every and time.monotonic() - self._live_started < interval:
+            return
+        self._live_count = snapshot.count
+        self._live_started = time.monotonic()
+        self.perform_fit(live=snapshot)
+
+    def _live_done(self, snapshot):
+        now = time.monotonic()
+        finished = self._live_finished
+        finished.append(now)
+        rate = 0.0
+        if len(finished) > 1 and finished[-1] > finished[0]:
+            rate = (len(finished) - 1) / (finished[-1] - finished[0])
+        stream = self.master.stream
+        behind = stream.count - snapshot.count if stream is not None else 0
+        self._live_status.set(
+            f"Live: {rate:.2f} fits/s, {now - snapshot.time:.2f} s"
+            f" and {behind} samples behind acquisition"
+        )
+
+    def global_fit(self):
+        if self.fitting:
+            return
+        datasets = self.master.datasets
+        if datasets is None:
+            messagebox.showinfo(
+                "Global fit", "Choose a list of datasets as Data for a global fit."
             )
-            for name, value in zip(self._sliders, params):
-                self._sliders[name].set_scale_value(value)
-            self.event_generate("<<FITUI.DONE>>")
+            return
+        p0 = list(self.params.values())
+        if self._global is not None and self._global[0] is datasets:
+            p0 = self._global[1].params
+        fit_kwargs = dict(self.fit_kwargs, sigma=self.master.dataset_sigma)
+        self._start_worker(
+            "Fitting all datasets...",
+            GlobalFitWorker,
+            self.master.model,
+            self.master.dataset_xs,
+            datasets,
+            shared=[name for name, slider in self._sliders.items() if slider.shared],
+            p0=p0,
+            bounds=self._bounds,
+            source=self.master.jacobian_source,
+            index=self.master.dataset_index,
+            fit_kwargs=fit_kwargs,
+        )
+
+    def show_dataset(self, index):
+        """Show the global fit's parameters of dataset ``index``, if any"""
+        if self._global is None or self._global[0] is not self.master.datasets:
+            return
+        result = self._global[1]
+        self._apply_result(result.params[index], result.dataset_covariance(index))
+
+    def auto_seed(self):
+        if self.fitting:
+            return
+        xs, data, _ = self.master.fit_arrays
+        self._start_worker(
+            "Searching initial values...",
+            SeedWorker,
+            self.master.model,
+            xs,
+            data,
+            bounds=self._bounds,
+        )
+
+    def _start_worker(self, status, worker_cls, *args, **kwargs):
+        try:
+            self._worker = worker_cls(*args, **kwargs)
         except Exception as e:
             messagebox.showerror(type(e).__name__, e.args[0])
             raise e
+        self.progress = None
+        self._fit_button.config(state=tk.DISABLED)
+        self._seed_button.config(state=tk.DISABLED)
+        self._global_button.config(state=tk.DISABLED)
+        self._cancel_button.config(state=tk.NORMAL)
+        self._status.set(status)
+        self._worker.start()
+        self.event_generate("<<FITUI.STARTED>>")
+        self.after(self.POLL_INTERVAL, self._poll_worker)
+
+    def cancel_fit(self):
+        if self.fitting:
+            self._worker.cancel()
+            self._status.set("Cancelling...")
+
+    def _finish_fit(self):
+        self._worker = None
+        self._live_fit = None
+        self._fit_button.config(state=tk.NORMAL)
+        self._seed_button.config(state=tk.NORMAL)
+        self._global_button.config(state=tk.NORMAL)
+        self._cancel_button.config(state=tk.DISABLED)
+
+    def _apply_result(self, params, cov):
+        self._remember()
+        for name, value in zip(self._sliders, params):
+            self._sliders[name].set_scale_value(value)
+        self._fitted = dict(zip(self._sliders, params)), cov
+
+    @staticmethod
+    def _done_message(worker):
+        if getattr(worker, "cached", False):
+            return "Restored cached fit"
+        message = f"Done after {worker.nfev} evaluations"
+        jacobian = getattr(worker, "jacobian", None)
+        if jacobian is not None:
+            message += f" (Jacobian: {jacobian.method}"
+            if worker.saved_evaluations > 0:
+                message += f", saved {worker.saved_evaluations} evaluations"
+            message += ")"
+        return message
+
+    def _poll_worker(self):
+        worker = self._worker
+        if worker is None:
+            return
+        while True:
+            try:
+                kind, *payload = worker.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                self.progress = nfev, residual = payload
+                self._status.set(f"Evaluations: {nfev}  Residual: {residual:.6g}")
+                self.event_generate("<<FITUI.PROGRESS>>")
+            elif kind == "done":
+                params, cov = payload
+                if getattr(worker, "key", None) is not None and not worker.cached:
+                    self._cache.put(worker.key, params, cov)
+                if getattr(worker, "result", None) is not None:
+                    self._global = worker.datasets, worker.result
+                path = getattr(worker, "path", None)
+                self.fit_path = np.array(path) if path else None
+                live = self._live_fit
+                self._finish_fit()
+                self._status.set(self._done_message(worker))
+                self._apply_result(params, cov)
+                if live is not None:
+                    self._live_done(live)
+                self.event_generate("<<FITUI.DONE>>")
+                return
+            elif kind == "cancelled":
+                self._finish_fit()
+                self._status.set(f"Cancelled after {worker.nfev} evaluations")
+                self.event_generate("<<FITUI.CANCELLED>>")
+                return
+            elif kind == "error":
+                (e,) = payload
+                live = self._live_fit
+                self._finish_fit()
+                self._status.set(f"{type(e).__name__} after {worker.nfev} evaluations")
+                if live is None:
+                    # live refits retry with the next samples instead
+                    messagebox.showerror(type(e).__name__, e.args[0] if e.args else "")
+                return
+        self.after(self.POLL_INTERVAL, self._poll_worker)
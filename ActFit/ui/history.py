@@ -0,0 +1,44 @@
+from collections import deque
+
+
+__all__ = ("History",)
+
+
+class History:
+    """Undo/redo stacks of parameter states
+
+    :param maxlen: number of undo steps to keep
+    """
+
+    def __init__(self, maxlen=100):
+        self._undo = deque(maxlen=maxlen)
+        self._redo = []
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    def push(self, state):
+        """Remember a state before it gets replaced"""
+        if self._undo and self._undo[-1] == state:
+            return
+        self._undo.append(state)
+        self._redo.clear()
+
+    def undo(self, current):
+        """State before ``current``, or ``None``"""
+        if not self._undo:
+            return None
+        self._redo.append(current)
+        return self._undo.pop()
+
+    def redo(self, current):
+        """State undone last, or ``None``"""
+        if not self._redo:
+            return None
+        self._undo.append(current)
+        return self._redo.pop()
@@ -0,0 +1,227 @@
+import queue
+import tkinter as tk
+from tkinter import messagebox
+import tkinter.ttk as ttk
+
+import numpy as np
+
+from .profiler import STARTUP
+from .worker import LandscapeWorker
+from .utils import *
+
+
+__all__ = ("LandscapeView",)
+
+
+class LandscapeView(tk.Toplevel):
+    """χ² over a grid of two parameters within their slider bounds
+
+    Clicking a cell moves both sliders there. The current parameters and
+    the path of the last fit are drawn on top.
+    """
+
+    POLL_INTERVAL = 50  # ms
+    #: model values evaluated per landscape unless "Exact" is ticked
+    BUDGET = 2 * 10**8
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.title("χ² Landscape")
+
+        controls = ttk.Frame(self)
+        controls.pack(fill=tk.X)
+        names = list(self.master.params)
+        self._x_name = tk.StringVar(self, names[0] if names else "")
+        self._y_name = tk.StringVar(self, names[1] if len(names) > 1 else "")
+        ttk.Label(controls, text="x:").grid(column=0, row=0)
+        self._x_box = ttk.Combobox(
+            controls, textvariable=self._x_name, values=names, width=8, state="readonly"
+        )
+        self._x_box.grid(column=1, row=0)
+        ttk.Label(controls, text="y:").grid(column=2, row=0)
+        self._y_box = ttk.Combobox(
+            controls, textvariable=self._y_name, values=names, width=8, state="readonly"
+        )
+        self._y_box.grid(column=3, row=0)
+        ttk.Label(controls, text="Grid:").grid(column=4, row=0)
+        self._size = tk.StringVar(self, "100")
+        ttk.Spinbox(
+            controls, from_=10, to=1000, increment=10, width=5, textvariable=self._size
+        ).grid(column=5, row=0)
+        self._exact = tk.BooleanVar(self, False)
+        ttk.Checkbutton(controls, text="Exact", variable=self._exact).grid(
+            column=6, row=0
+        )
+        self._compute_button = ttk.Button(
+            controls, text="Compute", command=event_wrapper(self.compute)
+        )
+        self._compute_button.grid(column=7, row=0)
+        self._cancel_button = ttk.Button(
+            controls,
+            text="Cancel",
+            command=event_wrapper(self.cancel),
+            state=tk.DISABLED,
+        )
+        self._cancel_button.grid(column=8, row=0)
+
+        figure = STARTUP.import_module("matplotlib.figure")
+        backend = STARTUP.import_module("matplotlib.backends.backend_tkagg")
+        self._fig = figure.Figure(figsize=(5, 4), dpi=100)
+        self._ax = self._fig.add_subplot(111)
+        self._canvas = backend.FigureCanvasTkAgg(self._fig, master=self)
+        self._canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self._canvas.mpl_connect("button_press_event", self._clicked)
+        self._colorbar = None
+        self._point = None
+        self._path = None
+
+        self._status = tk.StringVar(self, "")
+        ttk.Label(self, textvariable=self._status).pack(fill=tk.X)
+
+        self._worker = None
+        self._landscape = None
+        self._computed_params = None
+
+    def compute(self):
+        if self._worker is not None or not self.master.plot_ready:
+            return
+        names = self._x_name.get(), self._y_name.get()
+        params = self.master.params
+        if names[0] == names[1] or not all(name in params for name in names):
+            messagebox.showwarning(
+                "χ² Landscape", "Choose two different parameters", parent=self
+            )
+            return
+        try:
+            n = int(self._size.get())
+            ranges = [self.master.boundaries[name] for name in names]
+        except ValueError as e:
+            messagebox.showwarning("χ² Landscape", e.args[0], parent=self)
+            return
+        max_points = None if self._exact.get() else max(100, self.BUDGET // n**2)
+        xs, data, sigma = self.master.fit_arrays
+        self._worker = LandscapeWorker(
+            self.master.model,
+            xs,
+            data,
+            params,
+            names,
+            ranges,
+            landscape_kwargs=dict(n=n, sigma=sigma, max_points=max_points),
+        )
+        self._computed_params = params
+        self._compute_button.config(state=tk.DISABLED)
+        self._cancel_button.config(state=tk.NORMAL)
+        self._status.set("Computing...")
+        self._worker.start()
+        self.after(self.POLL_INTERVAL, self._poll_worker)
+
+    def cancel(self):
+        if self._worker is not None:
+            self._worker.cancel()
+
+    def destroy(self):
+        # closing the window would otherwise leave the workers computing
+        self.cancel()
+        super().destroy()
+
+    def _finish(self, status):
+        self._worker = None
+        self._compute_button.config(state=tk.NORMAL)
+        self._cancel_button.config(state=tk.DISABLED)
+        self._status.set(status)
+
+    def _poll_worker(self):
+        worker = self._worker
+        if worker is None or not self.winfo_exists():
+            return
+        while True:
+            try:
+                kind, *payload = worker.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                done, fraction = payload
+                self._status.set(f"Computing... {fraction:.0%}")
+            elif kind == "done":
+                landscape, _ = payload
+                n = len(landscape.x)
+                self._finish(f"{n}×{n} grid")
+                self._show(landscape)
+                return
+            elif kind == "cancelled":
+                self._finish("Cancelled")
+                return
+            elif kind == "error":
+                (e,) = payload
+                self._finish(type(e).__name__)
+                messagebox.showerror(
+                    type(e).__name__, e.args[0] if e.args else "", parent=self
+                )
+                return
+        self.after(self.POLL_INTERVAL, self._poll_worker)
+
+    def _show(self, landscape):
+        self._landscape = landscape
+        self._fig.clf()
+        self._ax = self._fig.add_subplot(111)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            image = self._ax.imshow(
+                np.log10(landscape.chi2),
+                origin="lower",
+                extent=(
+                    landscape.x[0],
+                    landscape.x[-1],
+                    landscape.y[0],
+                    landscape.y[-1],
+                ),
+                aspect="auto",
+                cmap="viridis",
+            )
+        self._colorbar = self._fig.colorbar(image, ax=self._ax, label="log₁₀ χ²")
+        self._ax.set_xlabel(landscape.names[0])
+        self._ax.set_ylabel(landscape.names[1])
+        if landscape.n_sampled < landscape.n_points:
+            self._ax.set_title(
+                f"≈ from {landscape.n_sampled} of {landscape.n_points} points",
+                fontsize=9,
+            )
+        (self._path,) = self._ax.plot([], [], ".-", color="red", lw=1, ms=3)
+        (self._point,) = self._ax.plot([], [], "+", color="white", ms=14, mew=2)
+        self.update_overlay()
+
+    def update_overlay(self):
+        """Redraw the current parameters and the last fit's path"""
+        landscape = self._landscape
+        if landscape is None:
+            return
+        params = self.master.params
+        if not all(name in params for name in landscape.names):
+            return
+        order = list(params)
+        x, y = (order.index(name) for name in landscape.names)
+        self._point.set_data([params[landscape.names[0]]], [params[landscape.names[1]]])
+        path = self.master.fit_path
+        if path is not None and path.shape[1] == len(order):
+            self._path.set_data(path[:, x], path[:, y])
+        else:
+            self._path.set_data([], [])
+        others = {
+            name: value for name, value in params.items() if name not in landscape.names
+        }
+        computed = {
+            name: value
+            for name, value in self._computed_params.items()
+            if name not in landscape.names
+        }
+        if self._worker is None and others != computed:
+            self._status.set("Other parameters changed, compute again to update")
+        self._canvas.draw_idle()
+
+    def _clicked(self, event):
+        if self._landscape is None or event.inaxes is not self._ax:
+            return
+        if event.button != 1 or event.xdata is None:
+            return
+        x, y = self._landscape.nearest(event.xdata, event.ydata)
+        self.master.set_params(dict(zip(self._landscape.names, (x, y))))
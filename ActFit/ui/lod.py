@@ -0,0 +1,262 @@
+import copy
+
+import numpy as np
+
+
+__all__ = ("ImageDetail", "LevelOfDetail", "minmax_bins")
+
+
+def minmax_bins(xs, ys, n_bins):
+    """Pick the samples that keep the visual envelope of ``ys``
+
+    ``xs`` is split into ``n_bins`` equal-width bins, and from each bin the
+    first, last, smallest and largest sample is kept.
+
+    :param xs: sorted abscissae
+    :param ys: ordinates
+    :param n_bins: number of bins, typically the width of the axes in pixels
+    :return: ascending indices into ``xs``/``ys``
+    """
+    n = len(xs)
+    if n <= 4 * n_bins:
+        return np.arange(n)
+
+    edges = np.linspace(xs[0], xs[-1], n_bins + 1)[:-1]
+    starts = np.unique(np.searchsorted(xs, edges, side="left"))
+    stops = np.append(starts[1:], n)
+    picks = [starts, stops - 1]
+    for reduce in (np.fmin, np.fmax):
+        extremes = reduce.reduceat(ys, starts)
+        hits = np.flatnonzero(ys == np.repeat(extremes, stops - starts))
+        bins = np.searchsorted(starts, hits, side="right")
+        first = np.ones(len(hits), dtype=bool)
+        first[1:] = bins[1:] != bins[:-1]
+        picks.append(hits[first])
+    return np.unique(np.concatenate(picks))
+
+
+class LevelOfDetail:
+    """Decimated views of a dataset sized to the plot resolution
+
+    Multi-dimensional ``xs``, e.g. the ``(2, n)`` coordinates of scattered
+    points, are plotted against the sample index.
+
+    :param xs: abscissae, sorted or not
+    :param ys: ordinates
+    """
+
+    def __init__(self, xs, ys):
+        self._source = (xs, ys)
+        xs = np.asarray(xs)
+        self.ys = ys = np.asarray(ys)
+        self.coordinates = None
+        if xs.ndim > 1:
+            if xs.shape[-1] != len(ys):
+                raise ValueError(
+                    f"xs of shape {xs.shape} must end in the length of the data"
+                    f" {len(ys)}"
+                )
+            self.coordinates = xs
+            xs = np.arange(len(ys))
+        self.xs = xs
+        if np.all(xs[1:] >= xs[:-1]):
+            self._order = None
+            self._sorted_xs, self._sorted_ys = xs, ys
+        else:
+            self._order = np.argsort(xs, kind="stable")
+            self._sorted_xs, self._sorted_ys = xs[self._order], ys[self._order]
+        self.extent = (np.nanmin(xs), np.nanmax(xs))
+
+    @property
+    def n_points(self):
+        return len(self.xs)
+
+    def matches(self, xs, ys):
+        return self._source[0] is xs and self._source[1] is ys
+
+    def extend(self, xs, ys):
+        """Level of detail of ``xs``/``ys`` if they append to the current data
+
+        Only the new samples are examined, which makes following a growing
+        :class:`~ActFit.stream.Stream` cheap.
+
+        :return: the extended level of detail, or ``None`` if ``xs``/``ys``
+            don't start with the current data in the same memory, or would
+            need sorting
+        """
+        xs, ys = np.asarray(xs), np.asarray(ys)
+        n = len(self.xs)
+        if self.coordinates is not None or self._order is not None:
+            return None
+        if xs.ndim != 1 or len(xs) < n or len(ys) != len(xs):
+            return None
+        for new, old in ((xs, self.xs), (ys, self.ys)):
+            if (
+                new.__array_interface__["data"][0] != old.__array_interface__["data"][0]
+                or new.strides != old.strides
+            ):
+                return None
+        tail = xs[n:]
+        if not np.all(tail[1:] >= tail[:-1]) or (
+            n and len(tail) and tail[0] < xs[n - 1]
+        ):
+            return None
+        extended = copy.copy(self)
+        extended._source = (xs, ys)
+        extended.xs = extended._sorted_xs = xs
+        extended.ys = extended._sorted_ys = ys
+        if len(tail):
+            extended.extent = (
+                np.nanmin([self.extent[0], np.nanmin(tail)]),
+                np.nanmax([self.extent[1], np.nanmax(tail)]),
+            )
+        return extended
+
+    def at(self, indices):
+        """Model input at the samples ``indices``"""
+        if self.coordinates is None:
+            return self.xs[indices]
+        return self.coordinates[..., indices]
+
+    def _window(self, view):
+        if view is None:
+            return slice(0, len(self._sorted_xs))
+        lo, hi = view
+        return slice(
+            np.searchsorted(self._sorted_xs, lo, side="left"),
+            np.searchsorted(self._sorted_xs, hi, side="right"),
+        )
+
+    def _original(self, positions):
+        if self._order is None:
+            return positions
+        return self._order[positions]
+
+    def full(self, view=None):
+        """All samples inside ``view`` in ascending x order
+
+        For sorted data this is a slice, so indexing with it yields views.
+        """
+        return self._original(self._window(view))
+
+    def indices(self, n_bins, view=None):
+        """Min/max preserving selection of the samples inside ``view``"""
+        window = self._window(view)
+        picks = minmax_bins(self._sorted_xs[window], self._sorted_ys[window], n_bins)
+        return self._original(picks + window.start)
+
+
+def _linear(values, axis):
+    """``(start, step)`` of ``values`` evenly spaced along ``axis``, if they
+    change along it"""
+    n = values.shape[axis]
+    first = values[(0,) * values.ndim]
+    last = values[tuple(n - 1 if i == axis else 0 for i in range(values.ndim))]
+    step = (last - first) / (n - 1) if n > 1 else 1.0
+    if n > 1 and step == 0:
+        return None
+    return float(first), float(step)
+
+
+class ImageDetail:
+    """Strided views of two-dimensional data sized to the plot resolution
+
+    ``xs`` is an array ending in the shape of ``data``, e.g. a ``(2, H, W)``
+    meshgrid, or a list of such arrays. If its first two coordinates form an
+    ``"xy"`` indexed grid, extents are in their units, else in pixels.
+
+    :param xs: coordinates of every pixel
+    :param data: image
+    """
+
+    def __init__(self, xs, data):
+        self._source = (xs, data)
+        self.data = data = np.asarray(data)
+        if data.ndim != 2:
+            raise ValueError(f"can only plot 1D or 2D data, not {data.ndim}D")
+        if isinstance(xs, (list, tuple)):
+            self.xs = planes = xs
+        else:
+            self.xs = np.asarray(xs)
+            planes = list(self.xs) if self.xs.ndim == 3 else [self.xs]
+        if any(np.shape(plane) != data.shape for plane in planes):
+            raise ValueError(
+                f"xs must end in the shape of the data {data.shape},"
+                f" e.g. a meshgrid of shape (2, {data.shape[0]}, {data.shape[1]})"
+            )
+        self._axes = None
+        if len(planes) >= 2:
+            x, y = _linear(np.asarray(planes[0]), 1), _linear(np.asarray(planes[1]), 0)
+            if x is not None and y is not None:
+                self._axes = (x, y)
+        self.labels = ("x", "y") if self._axes is not None else ("column", "row")
+
+    @property
+    def n_points(self):
+        return self.data.size
+
+    def matches(self, xs, data):
+        return self._source[0] is xs and self._source[1] is data
+
+    def _coordinate(self, index, axis):
+        if self._axes is None:
+            return index
+        start, step = self._axes[axis]
+        return start + index * step
+
+    def _index(self, value, axis):
+        if self._axes is None:
+            return value
+        start, step = self._axes[axis]
+        return (value - start) / step
+
+    @property
+    def extent(self):
+        """``(left, right, bottom, top)`` of the whole image"""
+        rows, cols = self.data.shape
+        return self.extent_of((slice(0, rows), slice(0, cols)))
+
+    def extent_of(self, index):
+        """``(left, right, bottom, top)`` of the pixels ``data[index]``"""
+        edges = []
+        for axis, part in ((0, index[1]), (1, index[0])):
+            step = part.step or 1
+            last = part.start + step * (len(range(part.start, part.stop, step)) - 1)
+            edges += [
+                self._coordinate(part.start - step / 2, axis),
+                self._coordinate(last + step / 2, axis),
+            ]
+        return tuple(edges)
+
+    def full(self, view=None):
+        """``(rows, columns)`` slices of the pixels inside ``view``
+
+        :param view: ``(xlim, ylim)``, or ``None`` for the whole image
+        """
+        if view is None:
+            return tuple(slice(0, n) for n in self.data.shape)
+        index = []
+        for axis, (lo, hi) in ((1, view[1]), (0, view[0])):
+            n = self.data.shape[1 - axis]
+            lo, hi = sorted((self._index(lo, axis), self._index(hi, axis)))
+            start = min(max(int(np.floor(lo + 0.5)), 0), n - 1)
+            stop = min(max(int(np.ceil(hi + 0.5)), start + 1), n)
+            index.append(slice(start, stop))
+        return tuple(index)
+
+    def indices(self, pixels, view=None):
+        """Strided ``(rows, columns)`` slices with about one pixel per sample
+
+        :param pixels: ``(width, height)`` of the axes in pixels
+        """
+        index = []
+        for part, n_pixels in zip(self.full(view), pixels[::-1]):
+            step = max(1, -(-(part.stop - part.start) // max(n_pixels, 1)))
+            index.append(slice(part.start, part.stop, step))
+        return tuple(index)
+
+    def xs_at(self, index):
+        """Coordinates of the pixels ``data[index]``, as views"""
+        if isinstance(self.xs, (list, tuple)):
+            return type(self.xs)(np.asarray(plane)[index] for plane in self.xs)
+        return self.xs[(Ellipsis,) + tuple(index)]
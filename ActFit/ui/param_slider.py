@@ -23,11 +23,13 @@ class ParamSlider(ttk.Frame):
             self, width=5, justify=tk.RIGHT, textvariable=self._lower_bound
         )
         lower_bound_entry.grid(row=0, column=1, sticky="nse")
+        lower_bound_entry.bind("<FocusIn>", self._changing)
 
         self._scale = ttk.Scale(
             self, from_=1, to=100, orient=tk.HORIZONTAL, command=self._update_value
         )
         self._scale.grid(row=0, column=2, columnspan=2, sticky="ew")
+        self._scale.bind("<ButtonPress-1>", self._changing)
 
         self._upper_bound = tk.StringVar()
         self._upper_bound.set("10")
@@ -36,6 +38,7 @@ class ParamSlider(ttk.Frame):
             self, width=5, justify=tk.RIGHT, textvariable=self._upper_bound
         )
         upper_bound_entry.grid(row=0, column=4, sticky="nse")
+        upper_bound_entry.bind("<FocusIn>", self._changing)
 
         self._value = 1.0
         self._value_str = tk.StringVar()
@@ -45,16 +48,36 @@ class ParamSlider(ttk.Frame):
         )
         value_label.grid(row=0, column=5, sticky="w")
 
+        self._shared = tk.BooleanVar(self, True)
+        shared_check = ttk.Checkbutton(self, text="shared", variable=self._shared)
+        shared_check.grid(row=0, column=6, sticky="w")
+
         self.set_value(1)
 
     @property
     def value(self):
         return self._value
 
+    @property
+    def shared(self):
+        """Whether a global fit uses one value for all datasets"""
+        return self._shared.get()
+
     @property
     def boundary(self):
         return (float(self._lower_bound.get()), float(self._upper_bound.get()))
 
+    @property
+    def state(self):
+        """``(lower, upper, value)``"""
+        return self.boundary + (self._value,)
+
+    def restore(self, state):
+        lower, upper, value = state
+        self._lower_bound.set(f"{lower:.12g}")
+        self._upper_bound.set(f"{upper:.12g}")
+        self.set_scale_value(value)
+
     def set_value(self, x):
         y1, y2 = self.boundary
         self._value = y1 + (x - 1) * (y2 - y1) / 99
@@ -66,6 +89,9 @@ class ParamSlider(ttk.Frame):
         y1, y2 = self.boundary
         self._scale.set(1 + (x - y1) * 99 / (y2 - y1))
 
+    def _changing(self, *args):
+        self.event_generate("<<PARAM.CHANGING>>")
+
     def _update_value(self, *args):
         self.set_value(self._scale.get())
         self.event_generate("<<PARAM.UPDATED>>")
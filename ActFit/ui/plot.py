@@ -1,69 +1,717 @@
+import time
+from typing import NamedTuple, Optional
 import tkinter as tk
 from tkinter import messagebox
 from tkinter.scrolledtext import ScrolledText
 import tkinter.ttk as ttk
+import warnings
 import numpy as np
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-from matplotlib.backend_bases import key_press_handler as mpl_key_press_handler
 
+from ..roi import ROI
+from .lod import ImageDetail, LevelOfDetail, minmax_bins
+from .profiler import PROFILER, STARTUP
+from .utils import *
 
-__all__ = ("Plot",)
+
+__all__ = ("Evaluation", "Plot")
+
+
+class Evaluation(NamedTuple):
+    """Model values the plot computed, with the data at the same points
+
+    ``n_points`` counts the samples they stand for, those in view if
+    ``in_view``, else all the fit covers.
+    """
+
+    ys: np.ndarray
+    data: np.ndarray
+    n_points: int
+    sigma: Optional[np.ndarray] = None
+    in_view: bool = False
+
+
+_Canvas = None
+
+
+def _canvas_type():
+    """``FigureCanvasTkAgg`` timing its redraws, matplotlib is imported here"""
+    global _Canvas
+    if _Canvas is None:
+        backend = STARTUP.import_module("matplotlib.backends.backend_tkagg")
+
+        class _Canvas(backend.FigureCanvasTkAgg):
+            def draw(self):
+                with PROFILER.span("canvas.draw"):
+                    super().draw()
+
+    return _Canvas
+
+
+def _contour_artists(contours):
+    """Artists of a contour set, itself one since matplotlib 3.8"""
+    artist = STARTUP.import_module("matplotlib.artist")
+    if isinstance(contours, artist.Artist):
+        return [contours]
+    return list(contours.collections)
+
+
+def _block_mean(image, n_blocks):
+    """``image`` averaged over blocks, leaving at most ``n_blocks`` per axis"""
+    size = max(1, -(-max(image.shape) // n_blocks))
+    rows, cols = (n // size * size for n in image.shape)
+    if size == 1 or not rows or not cols:
+        return image
+    blocks = image[:rows, :cols].reshape(rows // size, size, cols // size, size)
+    return blocks.mean(axis=(1, 3))
+
+
+def _gaps(values, breaks):
+    """``values`` with ``nan`` inserted before ``breaks``, breaking a line"""
+    if breaks is None or not len(breaks):
+        return values
+    return np.insert(np.asarray(values, dtype=float), breaks, np.nan)
 
 
 class Plot(ttk.Frame):
+    FRAME_INTERVAL = 1000 // 60  # ms
+    #: noise is averaged out of the data contours over this many blocks
+    CONTOUR_BLOCKS = 48
+    #: mouse movement up to which pressing and releasing is a click
+    CLICK_PIXELS = 4
+    #: live statistics come from up to this many evenly spaced samples per
+    #: pixel of width, min/max picks would overstate the residuals
+    STATS_SAMPLES = 4
+
     def __init__(self, master=None, figsize=None, dpi=None, **kw):
         super().__init__(master=master, **kw)
 
-        self._fig = Figure(figsize=figsize or (5, 4), dpi=dpi or 100)
-        self._ax = self._fig.add_subplot(111)
+        # the figure is built on the first render, which imports matplotlib
+        self._figsize = figsize or (5, 4)
+        self._dpi = dpi or 100
+        self._fig = None
+        self._ax = None
         self._fit_plot = None
         self._data_plot = None
+        self._image_axes = None
+        self._images = None
+        self._contours = []
+        self._animated = []
+
+        self._lod = None
+        self._fit_xs = None
+        self._fit_inputs = None
+        self._fit_data = None
+        self._fit_indices = None
+        self._fit_count = None
+        self._fit_curve = None
+        self._fit_breaks = None
+        self._shown = None
+        self.evaluation = None
 
+        # fits and the model curve only cover the region of interest
+        self.roi = ROI()
+        self.editing_roi = False
+        self._roi_key = None
+        self._roi_mask = None
+        self._roi_segments = None
+        self._roi_count = 0
+        self._roi_patches = []
+        self._excluded_plot = None
+        self._drag = None
+        self._preview = None
+
+        self.show_profile = False
+        self._profile_text = None
+        self._setting_limits = False
+
+        self._background = None
+        self._pending = None
+        self._requests = set()
+        self._last_render = 0.0
+
+        self._build_placeholder()
+
+    def _build_placeholder(self):
+        width, height = self._figsize
+        self._placeholder = ttk.Frame(
+            self, width=int(width * self._dpi), height=int(height * self._dpi)
+        )
+        self._placeholder.pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+
+    def _build_figure(self):
+        figure = STARTUP.import_module("matplotlib.figure")
+        self._fig = figure.Figure(figsize=self._figsize, dpi=self._dpi)
+        self._build_axes(image=False)
+        if self._placeholder is not None:
+            self._placeholder.destroy()
+            self._placeholder = None
         self._build_canvas()
 
+    def _build_axes(self, image):
+        """One axes for 1D data, or data, model and residual images"""
+        self._fig.clf()
+        if image:
+            self._image_axes = self._fig.subplots(1, 3, sharex=True, sharey=True)
+            self._ax = self._image_axes[0]
+            for ax, title in zip(self._image_axes, ("Data", "Model", "Residual")):
+                ax.set_title(title)
+                # the shared axes only notify the one that was zoomed
+                ax.callbacks.connect("xlim_changed", self._view_changed)
+                ax.callbacks.connect("ylim_changed", self._view_changed)
+        else:
+            self._image_axes = None
+            self._ax = self._fig.add_subplot(111)
+            self._ax.callbacks.connect("xlim_changed", self._view_changed)
+        self._fit_plot = self._data_plot = self._excluded_plot = None
+        self._roi_patches = []
+        self._images = None
+        self._contours = []
+        self._animated = []
+        self._fit_inputs = None
+        self._background = None
+        self._profile_text = self._ax.text(
+            0.01,
+            0.99,
+            "",
+            transform=self._ax.transAxes,
+            va="top",
+            family="monospace",
+            fontsize=8,
+            animated=True,
+            bbox=dict(facecolor="white", alpha=0.8, edgecolor="none"),
+        )
+
     def _build_canvas(self):
-        self._canvas = FigureCanvasTkAgg(self._fig, master=self)
+        backend = STARTUP.import_module("matplotlib.backends.backend_tkagg")
+        self._background = None
+        self._canvas = _canvas_type()(self._fig, master=self)
+        self._toolbar = backend.NavigationToolbar2Tk(self._canvas, self)
+        self._toolbar.update()
+        editing = tk.BooleanVar(self._toolbar, self.editing_roi)
+        ttk.Checkbutton(
+            self._toolbar,
+            text="ROI",
+            variable=editing,
+            command=event_wrapper(lambda: self.edit_roi(editing.get())),
+        ).pack(side=tk.LEFT)
+        ttk.Button(
+            self._toolbar, text="Clear ROI", command=event_wrapper(self.clear_roi)
+        ).pack(side=tk.LEFT)
         self._canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
         self._canvas._tkcanvas.pack(side=tk.TOP, fill=tk.BOTH, expand=1)
         self._canvas.mpl_connect("key_press_event", self._key_press_handler)
+        self._canvas.mpl_connect("draw_event", self._draw_handler)
+        self._canvas.mpl_connect("button_press_event", self._pressed)
+        self._canvas.mpl_connect("motion_notify_event", self._dragged)
+        self._canvas.mpl_connect("button_release_event", self._released)
 
     def _key_press_handler(self, event):
-        mpl_key_press_handler(event, self._canvas)
+        backend_bases = STARTUP.import_module("matplotlib.backend_bases")
+        backend_bases.key_press_handler(event, self._canvas, self._toolbar)
+
+    @property
+    def _bbox(self):
+        """Region redrawn by blitting"""
+        return self._fig.bbox if self._image_axes is not None else self._ax.bbox
+
+    def _draw_handler(self, event):
+        # everything but the animated fit is static between full redraws
+        self._background = self._canvas.copy_from_bbox(self._bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for artist in self._animated:
+            artist.axes.draw_artist(artist)
+        if self._preview is not None:
+            self._ax.draw_artist(self._preview)
+        if self.show_profile:
+            self._profile_text.set_text(PROFILER.summary())
+            self._ax.draw_artist(self._profile_text)
+
+    def update_profile(self):
+        """Redraw the profiler overlay on top of the cached background"""
+        self._redraw_animated()
+
+    def _redraw_animated(self):
+        if self._background is None:
+            return
+        self._canvas.restore_region(self._background)
+        self._draw_animated()
+        self._canvas.blit(self._bbox)
+
+    def _view_changed(self, ax):
+        if not self._setting_limits:
+            self._schedule("view")
 
     def reset(self):
+        if self._fig is None:
+            return
         if hasattr(self, "_canvas"):
             self._canvas.get_tk_widget().destroy()
+            self._toolbar.destroy()
         self._build_canvas()
 
+    def edit_roi(self, editing=True):
+        """Drag over the plot to add a span to the region of interest
+
+        A click excludes the nearest sample or includes it again, a right
+        click removes the span under the cursor.
+        """
+        self.editing_roi = editing
+
+    def set_roi(self, roi):
+        self.roi = roi
+        self._schedule("refine")
+
+    def clear_roi(self):
+        self.set_roi(ROI())
+
+    def _roi_editable(self, event):
+        return (
+            self.editing_roi
+            and self._image_axes is None
+            and self._shown is not None
+            and event.inaxes is self._ax
+            and event.xdata is not None
+            and not self._toolbar.mode
+        )
+
+    def _pressed(self, event):
+        if not self._roi_editable(event):
+            return
+        if event.button == 3:
+            self.set_roi(self.roi.remove_span(event.xdata))
+        elif event.button == 1:
+            patches = STARTUP.import_module("matplotlib.patches")
+            self._drag = event.xdata, event.x
+            self._preview = patches.Rectangle(
+                (event.xdata, 0),
+                0,
+                1,
+                transform=self._ax.get_xaxis_transform(),
+                color="tab:green",
+                alpha=0.2,
+                animated=True,
+            )
+            self._ax.add_patch(self._preview)
+
+    def _dragged(self, event):
+        if self._drag is None or event.inaxes is not self._ax:
+            return
+        self._preview.set_width(event.xdata - self._drag[0])
+        self._redraw_animated()
+
+    def _released(self, event):
+        if self._drag is None:
+            return
+        (start, pixel), self._drag = self._drag, None
+        end = self._preview.get_x() + self._preview.get_width()
+        if event.inaxes is self._ax:
+            end = event.xdata
+        self._preview.remove()
+        self._preview = None
+        if abs(event.x - pixel) > self.CLICK_PIXELS:
+            self.set_roi(self.roi.add_span(start, end))
+            return
+        index = self._nearest_sample(event)
+        if index is not None:
+            self.set_roi(self.roi.toggle(index))
+        else:
+            self._redraw_animated()
+
+    def _nearest_sample(self, event):
+        """Index of the shown sample under the cursor, if any"""
+        shown = self._shown
+        if not len(shown):
+            return None
+        points = np.column_stack((self._lod.xs[shown], self._lod.ys[shown]))
+        distances = np.hypot(
+            *(self._ax.transData.transform(points) - (event.x, event.y)).T
+        )
+        nearest = np.nanargmin(distances) if np.isfinite(distances).any() else None
+        if nearest is None or distances[nearest] > 2 * self.CLICK_PIXELS:
+            return None
+        return int(shown[nearest])
+
+    def _roi_inside(self):
+        """Which samples of the level of detail are inside the region of
+        interest, ``None`` if all are"""
+        key = (self._lod, self.roi)
+        if key == self._roi_key:
+            return self._roi_mask
+        self._roi_key = key
+        self._roi_mask = self._roi_segments = None
+        if not self.roi.everything:
+            lod = self._lod
+            mask = self.roi.mask(lod.xs)
+            # spans in ascending x order, the curve isn't broken at excluded
+            # single samples
+            spans = self.roi._replace(excluded=()).mask(lod.xs)
+            order = lod.full()
+            segments = np.empty(len(mask), dtype=int)
+            segments[order] = np.cumsum(~spans[order])
+            self._roi_mask, self._roi_segments = mask, segments
+            self._roi_count = int(np.count_nonzero(mask))
+        return self._roi_mask
+
+    def _draw_roi(self):
+        for patch in self._roi_patches:
+            patch.remove()
+        self._roi_patches = []
+        if self.roi.spans:
+            patches = STARTUP.import_module("matplotlib.patches")
+            for lower, upper in self.roi.spans:
+                patch = patches.Rectangle(
+                    (lower, 0),
+                    upper - lower,
+                    1,
+                    transform=self._ax.get_xaxis_transform(),
+                    color="tab:green",
+                    alpha=0.1,
+                    linewidth=0,
+                )
+                self._ax.add_patch(patch)
+                self._roi_patches.append(patch)
+
     def plot(self):
-        try:
-            if self.master.plot_ready:
-                xs = self.master.xs
+        self._schedule("relimit")
 
-                data_ys = self.master.data
-                if not self._data_plot:
-                    self._data_plot = self._ax.scatter(
-                        xs, data_ys, marker="x", color="darkorange"
-                    )
-                else:
-                    self._data_plot.set_offsets(np.column_stack((xs, data_ys)))
+    def extend(self):
+        """Redraw data that grew, following it unless zoomed in"""
+        self._schedule("extend")
 
-                fit_ys = self.master.ys
-                if not self._fit_plot:
-                    self._fit_plot, *_ = self._ax.plot(xs, fit_ys, color="steelblue")
-                else:
-                    self._fit_plot.set_data(xs, fit_ys)
+    def refine(self):
+        self._schedule("refine")
 
-                all_ys = np.array([*fit_ys, *data_ys])
-                left, right = np.min(all_ys) - 1, np.max(all_ys) + 1
-                self._ax.set_ylim([left, right])
+    def update_fit(self):
+        self._schedule()
 
-                left, right = np.min(xs) - 1, np.max(xs) + 1
-                self._ax.set_xlim([left, right])
+    def _schedule(self, request=None):
+        if request is not None:
+            self._requests.add(request)
+        if self._pending is not None:
+            return
+        wait = self.FRAME_INTERVAL - (time.perf_counter() - self._last_render) * 1000
+        if wait > 0:
+            self._pending = self.after(int(wait), self._render)
+        else:
+            self._pending = self.after_idle(self._render)
 
-                self._ax.grid(True)
-                self._canvas.draw()
+    def _render(self):
+        with PROFILER.span("Plot.render"):
+            if self._fig is None:
+                self._build_figure()
+            self._render_requests()
+        STARTUP.mark("first plot")
+
+    def _render_requests(self):
+        self._pending = None
+        requests, self._requests = self._requests, set()
+        self._last_render = time.perf_counter()
+        try:
+            if not self.master.plot_ready:
+                self._evaluated(None, None)
+            else:
+                if requests or not self._blit_fit():
+                    self._draw_full(
+                        relimit="relimit" in requests,
+                        refine=bool(requests & {"refine", "view"}),
+                        keep_limits=requests == {"view"},
+                    )
         except Exception as e:
             messagebox.showerror(type(e).__name__, e.args[0])
             raise e
+
+    def _evaluated(self, ys, data, indices=None, n_points=None):
+        """Publish model values at the data ``indices``, which sample the
+        ``n_points`` samples in view"""
+        if ys is None:
+            self.evaluation = None
+        else:
+            sigma = self.master.sigma
+            if sigma is not None:
+                sigma = None if indices is None else sigma[indices]
+            total = self._lod.n_points
+            if self._roi_mask is not None:
+                total = self._roi_count
+            if n_points is None:
+                n_points = total
+            self.evaluation = Evaluation(
+                ys, data, n_points, sigma, in_view=n_points < total
+            )
+        self.event_generate("<<PLOT.EVALUATED>>")
+
+    @property
+    def _pixels(self):
+        return max(int(self._ax.bbox.width), 1)
+
+    def _blit_fit(self):
+        if self._background is None or self._fit_inputs is None:
+            return False
+
+        fit_ys, sampled_ys = self._evaluate_fit()
+        self._evaluated(sampled_ys, self._fit_data, self._fit_indices, self._fit_count)
+        if self._image_axes is not None:
+            # colors saturate until the next full redraw rescales them
+            self._set_images(fit_ys, self._fit_data)
+        else:
+            bottom, top = self._ax.get_ylim()
+            if np.size(fit_ys) and (
+                np.nanmin(fit_ys) < bottom or np.nanmax(fit_ys) > top
+            ):
+                return False
+            self._fit_plot.set_data(
+                _gaps(self._fit_xs, self._fit_breaks),
+                _gaps(fit_ys, self._fit_breaks),
+            )
+
+        self._canvas.restore_region(self._background)
+        self._draw_animated()
+        self._canvas.blit(self._bbox)
+        return True
+
+    def _evaluate_fit(self):
+        """Model at the curve's samples and at the samples of the statistics
+
+        Both are evaluated in one call, the curve's inputs come first.
+        """
+        ys = self.master.evaluate(self._fit_inputs)
+        if self._fit_curve is None:
+            return ys, ys
+        ys = np.broadcast_to(ys, (self._fit_curve + len(self._fit_indices),))
+        return ys[: self._fit_curve], ys[self._fit_curve :]
+
+    def _in_view(self, view, inside):
+        """Samples inside ``view`` and the region of interest, and how many"""
+        window = self._lod.full(view)
+        if inside is not None:
+            if isinstance(window, slice):
+                window = np.flatnonzero(inside[window]) + window.start
+            else:
+                window = window[inside[window]]
+        if isinstance(window, slice):
+            return window, window.stop - window.start
+        return window, len(window)
+
+    def _set_limits(self, xlim=None, ylim=None):
+        self._setting_limits = True
+        try:
+            if xlim is not None:
+                self._ax.set_xlim(xlim)
+            if ylim is not None:
+                self._ax.set_ylim(ylim)
+        finally:
+            self._setting_limits = False
+
+    def _draw_full(self, relimit=False, refine=False, keep_limits=False):
+        xs, data = self.master.xs, self.master.data
+        previous = self._lod
+        extended = None
+        if isinstance(self._lod, LevelOfDetail) and not self._lod.matches(xs, data):
+            extended = self._lod.extend(xs, data)
+        if extended is not None:
+            left, right = self._lod.extent
+            view = self._ax.get_xlim()
+            relimit = relimit or (view[0] <= left and view[1] >= right)
+            self._lod = extended
+        elif self._lod is None or not self._lod.matches(xs, data):
+            image = np.ndim(data) > 1
+            self._lod = ImageDetail(xs, data) if image else LevelOfDetail(xs, data)
+            if image != (self._image_axes is not None):
+                self._build_axes(image)
+            if previous is not None and previous.n_points != self._lod.n_points:
+                # excluded indices refer to other data
+                self.roi = self.roi._replace(excluded=())
+            relimit = True
+        if self._image_axes is not None:
+            self._roi_key = self._roi_mask = self._shown = None
+            self._draw_image(relimit, refine, keep_limits)
+            return
+        lod = self._lod
+        inside = self._roi_inside()
+
+        if relimit:
+            left, right = lod.extent
+            self._set_limits(xlim=[left - 1, right + 1])
+        view = self._ax.get_xlim()
+
+        self._shown = shown = lod.indices(self._pixels, view)
+        if inside is None:
+            kept, left_out = shown, shown[:0]
+        else:
+            kept, left_out = shown[inside[shown]], shown[~inside[shown]]
+        data_xs, data_ys = lod.xs[kept], lod.ys[kept]
+        if not self._data_plot:
+            self._data_plot = self._ax.scatter(
+                data_xs, data_ys, marker="x", color="darkorange"
+            )
+            self._excluded_plot = self._ax.scatter(
+                lod.xs[left_out], lod.ys[left_out], marker="x", color="lightgray"
+            )
+        else:
+            self._data_plot.set_offsets(np.column_stack((data_xs, data_ys)))
+            self._excluded_plot.set_offsets(
+                np.column_stack((lod.xs[left_out], lod.ys[left_out]))
+            )
+        self._draw_roi()
+
+        if refine:
+            # evaluate at every sample in view, then thin out the curve itself
+            window, n = self._in_view(view, inside)
+            fit_xs = lod.xs[window]
+            fit_ys = self.master.evaluate(lod.at(window))
+            self._evaluated(fit_ys, lod.ys[window], window, n)
+            picks = minmax_bins(fit_xs, fit_ys, self._pixels)
+            fit_xs, fit_ys = fit_xs[picks], fit_ys[picks]
+            segments = None
+            if inside is not None:
+                segments = self._roi_segments[window][picks]
+            self._fit_inputs = None
+        else:
+            fit_xs = data_xs
+            window, n = self._in_view(view, inside)
+            if n > len(kept):
+                # the statistics come from a uniform stride in view
+                step = max(-(-n // (self.STATS_SAMPLES * self._pixels)), 1)
+                if isinstance(window, slice):
+                    sampled = np.arange(window.start, window.stop, step)
+                else:
+                    sampled = window[::step]
+                self._fit_inputs = lod.at(np.concatenate((kept, sampled)))
+                self._fit_curve = len(kept)
+            else:
+                # every sample in view is on the curve
+                sampled = kept
+                self._fit_inputs = lod.at(kept)
+                self._fit_curve = None
+            self._fit_xs, self._fit_data = fit_xs, lod.ys[sampled]
+            self._fit_indices, self._fit_count = sampled, n
+            fit_ys, sampled_ys = self._evaluate_fit()
+            self._evaluated(sampled_ys, self._fit_data, sampled, n)
+            segments = None if inside is None else self._roi_segments[kept]
+        # no line across the gaps between separate regions
+        breaks = None if segments is None else np.flatnonzero(np.diff(segments)) + 1
+        if not refine:
+            self._fit_breaks = breaks
+        fit_xs, fit_ys = _gaps(fit_xs, breaks), _gaps(fit_ys, breaks)
+        if not self._fit_plot:
+            self._fit_plot, *_ = self._ax.plot(
+                fit_xs, fit_ys, color="steelblue", animated=True
+            )
+            self._animated = [self._fit_plot]
+        else:
+            self._fit_plot.set_data(fit_xs, fit_ys)
+
+        shown_ys = lod.ys[shown]
+        if not keep_limits and len(shown_ys):
+            bottom, top = np.nanmin(shown_ys), np.nanmax(shown_ys)
+            if np.size(fit_ys):
+                bottom = min(bottom, np.nanmin(fit_ys))
+                top = max(top, np.nanmax(fit_ys))
+            self._set_limits(ylim=[bottom - 1, top + 1])
+
+        self._ax.grid(True)
+        self._background = None
+        self._canvas.draw_idle()
+
+    def _set_images(self, fit_ys, data):
+        fit_ys = np.broadcast_to(fit_ys, data.shape)
+        self._images[1].set_data(fit_ys)
+        self._images[2].set_data(data - fit_ys)
+
+    def _draw_image(self, relimit=False, refine=False, keep_limits=False):
+        image = self._lod
+        if relimit:
+            left, right, bottom, top = image.extent
+            self._set_limits(xlim=[left, right], ylim=[bottom, top])
+        view = self._ax.get_xlim(), self._ax.get_ylim()
+        bbox = self._ax.bbox
+        shown = image.indices((max(int(bbox.width), 1), max(int(bbox.height), 1)), view)
+        data = image.data[shown]
+        window = image.full(view)
+        n = image.data[window].size
+
+        if refine:
+            # evaluate every pixel in view, then show as many as fit the axes
+            fit_ys = self.master.evaluate(image.xs_at(window))
+            self._evaluated(fit_ys, image.data[window], window, n)
+            fit_ys = np.broadcast_to(fit_ys, image.data[window].shape)
+            fit_ys = fit_ys[:: shown[0].step, :: shown[1].step]
+            self._fit_inputs = None
+        else:
+            self._fit_inputs = image.xs_at(shown)
+            self._fit_curve = None
+            fit_ys = self.master.evaluate(self._fit_inputs)
+            self._evaluated(fit_ys, data, shown, n)
+            self._fit_data = data
+            self._fit_indices, self._fit_count = shown, n
+
+        extent = image.extent_of(shown)
+        axes = self._image_axes
+        self._setting_limits = True
+        try:
+            if self._images is None:
+                options = dict(
+                    origin="lower",
+                    extent=extent,
+                    aspect="auto",
+                    interpolation="nearest",
+                )
+                data_image = axes[0].imshow(data, cmap="viridis", **options)
+                self._images = (
+                    data_image,
+                    axes[1].imshow(
+                        data, norm=data_image.norm, animated=True, **options
+                    ),
+                    axes[2].imshow(data, cmap="RdBu_r", animated=True, **options),
+                )
+                for ax in axes:
+                    ax.set_xlabel(image.labels[0])
+                axes[0].set_ylabel(image.labels[1])
+                self._fig.colorbar(
+                    data_image, ax=list(axes[:2]), orientation="horizontal"
+                )
+                self._fig.colorbar(
+                    self._images[2], ax=axes[2], orientation="horizontal"
+                )
+            else:
+                for artist in self._images:
+                    artist.set_extent(extent)
+                self._images[0].set_data(data)
+            self._set_images(fit_ys, data)
+
+            # contours of the data over the model, the image changes beneath
+            for artist in self._contours:
+                artist.remove()
+            self._contours = []
+            smooth = _block_mean(data, self.CONTOUR_BLOCKS)
+            if min(smooth.shape) >= 2:
+                with warnings.catch_warnings():
+                    # flat data has no contour levels
+                    warnings.simplefilter("ignore")
+                    contours = axes[1].contour(
+                        smooth,
+                        levels=8,
+                        colors="white",
+                        linewidths=0.5,
+                        origin="lower",
+                        extent=extent,
+                    )
+                self._contours = _contour_artists(contours)
+                for artist in self._contours:
+                    artist.set_animated(True)
+        finally:
+            self._setting_limits = False
+        self._animated = [self._images[1], *self._contours, self._images[2]]
+
+        if not keep_limits:
+            finite = data[np.isfinite(data)]
+            if len(finite):
+                self._images[0].set_clim(finite.min(), finite.max())
+            residual = np.abs(self._images[2].get_array())
+            limit = np.nanmax(residual) if residual.size else 0
+            limit = limit if np.isfinite(limit) and limit > 0 else 1.0
+            self._images[2].set_clim(-limit, limit)
+
+        self._background = None
+        self._canvas.draw_idle()
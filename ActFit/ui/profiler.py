@@ -0,0 +1,158 @@
+from collections import deque
+from contextlib import contextmanager
+import functools
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+
+__all__ = ("PROFILER", "Profiler", "STARTUP", "Startup")
+
+
+class Profiler:
+    """Wall time spans of UI handlers and other hot paths
+
+    Spans are only recorded while :attr:`enabled` is set; disabled, a
+    wrapped call costs one attribute lookup.
+
+    :param maxlen: number of spans kept for the trace export
+    :param window: number of recent spans per name averaged in :meth:`summary`
+    """
+
+    def __init__(self, maxlen=200000, window=50):
+        self.enabled = False
+        self._spans = deque(maxlen=maxlen)
+        self._recent = dict()
+        self._window = window
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+            self._recent.clear()
+
+    def record(self, name, category, start, duration):
+        thread = threading.get_ident()
+        with self._lock:
+            self._spans.append((name, category, start, duration, thread))
+            recent = self._recent.get(name)
+            if recent is None:
+                recent = self._recent[name] = deque(maxlen=self._window)
+            recent.append(duration)
+
+    @contextmanager
+    def span(self, name, category="ui"):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, time.perf_counter() - start)
+
+    def wrap(self, func, name=None, category="ui"):
+        """``func`` timed as a span named ``name``, its qualified name by default"""
+        name = name or getattr(func, "__qualname__", type(func).__qualname__)
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, category, start, time.perf_counter() - start)
+
+        return timed
+
+    def summary(self, n=8):
+        """Text table of the ``n`` names with the most recent time spent"""
+        with self._lock:
+            recent = [(name, list(times)) for name, times in self._recent.items()]
+        recent.sort(key=lambda item: sum(item[1]), reverse=True)
+        width = max([len(name) for name, _ in recent[:n]] + [5])
+        lines = [f"{'stage':<{width}}  last ms  mean ms"]
+        for name, times in recent[:n]:
+            lines.append(
+                f"{name:<{width}} {times[-1] * 1e3:>8.2f} "
+                f"{sum(times) / len(times) * 1e3:>8.2f}"
+            )
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """Recorded spans in the Chrome trace event format"""
+        with self._lock:
+            spans = list(self._spans)
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": (start - self._origin) * 1e6,
+                    "dur": duration * 1e6,
+                    "pid": pid,
+                    "tid": thread,
+                }
+                for name, category, start, duration, thread in spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def export(self, path):
+        """Write :meth:`chrome_trace` to ``path``, for chrome://tracing or Perfetto"""
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+#: profiler shared by all widgets
+PROFILER = Profiler()
+
+
+class Startup:
+    """Milestones of the application start and first imports of modules
+
+    Times are measured from the creation of the instance, i.e. from the first
+    import of this module.
+    """
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self.milestones = dict()
+        self.imports = dict()
+
+    def mark(self, name):
+        """Record the first time milestone ``name`` is reached"""
+        self.milestones.setdefault(name, time.perf_counter() - self._origin)
+
+    def import_module(self, name):
+        """Import a module, recording how long its first import took"""
+        module = sys.modules.get(name)
+        if module is None:
+            start = time.perf_counter()
+            with PROFILER.span(f"import {name}", "import"):
+                module = importlib.import_module(name)
+            self.imports.setdefault(name, time.perf_counter() - start)
+        return module
+
+    def report(self):
+        """Milestones and import times in milliseconds, as text"""
+        width = max(map(len, list(self.milestones) + list(self.imports) + [""]))
+        lines = ["since start:"]
+        for name, seconds in sorted(self.milestones.items(), key=lambda m: m[1]):
+            lines.append(f"  {name:<{width}} {seconds * 1e3:8.1f} ms")
+        lines.append("first imports:")
+        for name, seconds in self.imports.items():
+            lines.append(f"  {name:<{width}} {seconds * 1e3:8.1f} ms")
+        return "\n".join(lines)
+
+
+#: startup record of the application
+STARTUP = Startup()
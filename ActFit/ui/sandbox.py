@@ -0,0 +1,524 @@
+"""Execution of user source in a separate, resource limited process
+
+:class:`SandboxEnv` is a drop-in replacement for :class:`~ActFit.ui.env.Env`
+that executes the source in a worker process. Arrays the source creates are
+moved into memory-mapped files in shared memory (``/dev/shm`` where
+available) and mapped read-only by the UI process, so they are never
+pickled. Functions are replaced by :class:`ModelProxy` objects that forward
+calls to the worker; arguments that are shared arrays are passed by
+reference and large results come back through a file as well.
+
+Every request is limited in CPU time through ``RLIMIT_CPU`` and the worker's
+address space through ``RLIMIT_AS`` where the platform supports them, and in
+wall time from the UI side. A worker that dies or has to be killed is
+restarted on the next request, with the bound values and the last source
+that executed successfully.
+"""
+import inspect
+import math
+import mmap
+import multiprocessing
+import os
+import pickle
+import shutil
+import signal
+import tempfile
+import threading
+import uuid
+
+import numpy as np
+
+from .env import Env
+from .profiler import PROFILER
+
+
+__all__ = ("ModelProxy", "Sandbox", "SandboxEnv", "SandboxError", "SandboxTimeout")
+
+
+SHARED_RESULT_SIZE = 1 << 20  # bytes, larger call results are passed as files
+
+
+class SandboxError(Exception):
+    pass
+
+
+class SandboxTimeout(SandboxError):
+    pass
+
+
+def _shared_directory():
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return None
+
+
+def _shareable(value):
+    return (
+        isinstance(value, np.ndarray)
+        and value.dtype.kind in "biufc"
+        and value.ndim > 0
+        and value.size > 0
+    )
+
+
+def _describe(array):
+    """Descriptor of an array mapping a whole file region, or ``None``
+
+    Contiguous views of a memory-mapped array, such as ``np.asarray`` of it
+    or a slice, map a region of the same file.
+    """
+    if not isinstance(array, np.ndarray) or not (
+        array.flags.c_contiguous or array.flags.f_contiguous
+    ):
+        return None
+    mapped = array
+    while not (isinstance(mapped, np.memmap) and isinstance(mapped.base, mmap.mmap)):
+        mapped = mapped.base
+        if not isinstance(mapped, np.ndarray):
+            return None
+    if mapped.filename is None:
+        return None
+    start = array.__array_interface__["data"][0]
+    return dict(
+        path=mapped.filename,
+        dtype=array.dtype.str,
+        shape=array.shape,
+        offset=mapped.offset + start - mapped.__array_interface__["data"][0],
+        order="C" if array.flags.c_contiguous else "F",
+    )
+
+
+def _region(descriptor):
+    """Key telling apart the arrays of a file"""
+    return (
+        descriptor["path"],
+        descriptor["offset"],
+        descriptor["dtype"],
+        tuple(descriptor["shape"]),
+        descriptor["order"],
+    )
+
+
+def _attach(descriptor, mode="r"):
+    return np.memmap(
+        descriptor["path"],
+        dtype=descriptor["dtype"],
+        mode=mode,
+        offset=descriptor["offset"],
+        shape=tuple(descriptor["shape"]),
+        order=descriptor["order"],
+    )
+
+
+def _export(array, directory):
+    """Copy an array into a new file in ``directory``
+
+    :return: descriptor and the array mapped from the file
+    """
+    descriptor = dict(
+        path=os.path.join(directory, uuid.uuid4().hex),
+        dtype=array.dtype.str,
+        shape=array.shape,
+        offset=0,
+        order="F" if array.flags.f_contiguous and not array.flags.c_contiguous else "C",
+    )
+    shared = _attach(descriptor, "w+")
+    shared[...] = array
+    return descriptor, shared
+
+
+class _Server:
+    """The worker side: an :class:`Env` plus the arrays it exported"""
+
+    def __init__(self, directory, cpu_seconds):
+        self._env = Env(globals_={"np": np})
+        self._directory = directory
+        self._cpu_seconds = cpu_seconds
+        self._exported = {}
+        self._attached = {}
+
+    def _limit_cpu(self, seconds):
+        try:
+            import resource
+        except ImportError:
+            return
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = hard
+        if seconds is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            soft = math.ceil(usage.ru_utime + usage.ru_stime + seconds)
+            if hard != resource.RLIM_INFINITY:
+                soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+    def _remove(self, descriptor):
+        if os.path.dirname(descriptor["path"]) == self._directory:
+            try:
+                os.unlink(descriptor["path"])
+            except OSError:
+                pass
+
+    def _state(self):
+        """Descriptions of all locals, moving new arrays into shared files"""
+        locals_ = {}
+        exported = {}
+        for name, value in list(self._env.locals.items()):
+            if _shareable(value):
+                previous = self._exported.get(name)
+                if previous is not None and previous[0] is value:
+                    descriptor = previous[1]
+                else:
+                    descriptor = _describe(value)
+                    if descriptor is None:
+                        descriptor, value = _export(value, self._directory)
+                        self._env.locals[name] = value
+                exported[name] = (value, descriptor)
+                locals_[name] = ("array", descriptor)
+            elif callable(value):
+                try:
+                    params = list(inspect.signature(value).parameters)
+                except (TypeError, ValueError):
+                    params = None
+                locals_[name] = ("callable", params)
+            else:
+                try:
+                    pickle.dumps(value)
+                except Exception:
+                    continue
+                locals_[name] = ("value", value)
+        paths = {descriptor["path"] for _, descriptor in exported.values()}
+        for _, descriptor in self._exported.values():
+            if descriptor["path"] not in paths:
+                self._remove(descriptor)
+        self._exported = exported
+        return dict(
+            locals=locals_, sources=self._env.sources, executed=self._env.executed
+        )
+
+    def _resolve(self, arg):
+        if isinstance(arg, tuple) and len(arg) == 2 and arg[0] == "__shared__":
+            # one mapping per file, calls pass many regions of it
+            descriptor = arg[1]
+            dtype = np.dtype(descriptor["dtype"])
+            end = descriptor["offset"] + dtype.itemsize * int(
+                np.prod(descriptor["shape"])
+            )
+            mapped = self._attached.get(descriptor["path"])
+            if mapped is None or len(mapped) < end:
+                mapped = np.memmap(descriptor["path"], mode="r")
+                self._attached[descriptor["path"]] = mapped
+            return np.ndarray(
+                tuple(descriptor["shape"]),
+                dtype,
+                buffer=mapped,
+                offset=descriptor["offset"],
+                order=descriptor["order"],
+            )
+        return arg
+
+    def exec(self, code, incremental):
+        error = None
+        try:
+            self._env.exec(code, incremental=incremental)
+        except Exception as e:
+            error = e
+        return dict(self._state(), error=error)
+
+    def bind(self, name, kind, value):
+        self._env.bind(name, _attach(value) if kind == "array" else value)
+        return self._state()
+
+    def call(self, name, args, kwargs):
+        ys = self._env.locals[name](*map(self._resolve, args), **kwargs)
+        if _shareable(ys) and ys.nbytes >= SHARED_RESULT_SIZE:
+            descriptor, _ = _export(ys, self._directory)
+            return ("__shared__", descriptor)
+        return ys
+
+    def eval(self, code):
+        return self._env.eval(code)
+
+    def reset(self):
+        for _, descriptor in self._exported.values():
+            self._remove(descriptor)
+        self._exported = {}
+        self._attached = {}
+        self._env.reset()
+
+    def serve(self, connection):
+        def cpu_exceeded(signum, frame):
+            raise SandboxTimeout("CPU time limit exceeded")
+
+        if hasattr(signal, "SIGXCPU"):
+            signal.signal(signal.SIGXCPU, cpu_exceeded)
+        while True:
+            try:
+                request, *args = connection.recv()
+            except EOFError:
+                return
+            if request == "close":
+                self.reset()
+                return
+            self._limit_cpu(self._cpu_seconds)
+            try:
+                reply = ("ok", getattr(self, request)(*args))
+            except MemoryError:
+                reply = ("error", SandboxError("memory limit exceeded"))
+            except Exception as e:
+                reply = ("error", e)
+            finally:
+                self._limit_cpu(None)
+            try:
+                connection.send(reply)
+            except Exception as e:
+                connection.send(("error", SandboxError(f"unpicklable reply: {e}")))
+
+
+def _serve(connection, directory, cpu_seconds, memory_bytes):
+    if memory_bytes is not None:
+        try:
+            import resource
+
+            resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+        except (ImportError, ValueError, OSError):
+            pass
+    _Server(directory, cpu_seconds).serve(connection)
+
+
+class Sandbox:
+    """A worker process serving requests one at a time
+
+    :param cpu_seconds: CPU time limit of a single request
+    :param memory_bytes: address space limit of the worker
+    :param timeout: wall time limit of a single request, after which the
+        worker is killed
+    :param on_start: called after every start of a worker, e.g. to restore
+        its state
+    """
+
+    def __init__(
+        self, cpu_seconds=10.0, memory_bytes=None, timeout=60.0, on_start=None
+    ):
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.timeout = timeout
+        self.directory = None
+        self._on_start = on_start
+        self._process = None
+        self._connection = None
+        self._lock = threading.RLock()
+        self._attached = {}
+
+    @property
+    def running(self):
+        return self._process is not None and self._process.is_alive()
+
+    def start(self):
+        """Start the worker unless it is running"""
+        with self._lock:
+            if self.running:
+                return
+            self._stop()
+            context = multiprocessing.get_context("spawn")
+            self.directory = tempfile.mkdtemp(prefix="actfit-", dir=_shared_directory())
+            self._connection, child = context.Pipe()
+            self._process = context.Process(
+                target=_serve,
+                args=(child, self.directory, self.cpu_seconds, self.memory_bytes),
+                daemon=True,
+            )
+            self._process.start()
+            child.close()
+            if self._on_start is not None:
+                self._on_start()
+
+    def _stop(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+            self._process = None
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+        self._attached = {}
+
+    def close(self):
+        with self._lock:
+            if self.running:
+                try:
+                    self._connection.send(("close",))
+                    self._process.join(1.0)
+                except (OSError, EOFError):
+                    pass
+            self._stop()
+
+    def request(self, *message):
+        """Send a request and wait for its reply
+
+        :raises SandboxTimeout: if the reply takes longer than :attr:`timeout`;
+            the worker is killed
+        :raises SandboxError: if the worker died
+        """
+        with self._lock:
+            self.start()
+            try:
+                self._connection.send(message)
+                if not self._connection.poll(self.timeout):
+                    self._stop()
+                    raise SandboxTimeout(f"no reply within {self.timeout} s")
+                kind, payload = self._connection.recv()
+            except (OSError, EOFError):
+                code = self._process.exitcode if self._process is not None else None
+                self._stop()
+                raise SandboxError(f"worker died with exit code {code}")
+        if kind == "error":
+            raise payload
+        return payload
+
+    def attach(self, descriptor):
+        """Array of a descriptor, the same object for the same file region"""
+        key = _region(descriptor)
+        array = self._attached.get(key)
+        if array is None:
+            array = self._attached[key] = _attach(descriptor)
+        return array
+
+    def forget(self, keep):
+        """Drop attached arrays whose paths are not in ``keep``"""
+        self._attached = {k: a for k, a in self._attached.items() if k[0] in keep}
+
+    def reference(self, value):
+        """Argument for a call, passing shared arrays by reference"""
+        descriptor = _describe(value)
+        return value if descriptor is None else ("__shared__", descriptor)
+
+    def result(self, value):
+        """Map a call result passed as a file"""
+        if isinstance(value, tuple) and len(value) == 2 and value[0] == "__shared__":
+            ys = _attach(value[1], "c")
+            os.unlink(value[1]["path"])
+            return ys
+        return value
+
+
+class ModelProxy:
+    """A function living in a :class:`Sandbox`, callable from the UI process
+
+    :param sandbox: sandbox to forward calls to
+    :param name: name of the function in the sandbox
+    :param params: its parameter names, if known
+    """
+
+    def __init__(self, sandbox, name, params):
+        self._sandbox = sandbox
+        self.params = params
+        self.__name__ = self.__qualname__ = name
+        self.__globals__ = {"np": np}
+        if params is not None:
+            self.__signature__ = inspect.Signature(
+                [
+                    inspect.Parameter(p, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+                    for p in params
+                ]
+            )
+
+    def __call__(self, *args, **kwargs):
+        with PROFILER.span(f"sandbox {self.__name__}"):
+            args = [self._sandbox.reference(arg) for arg in args]
+            return self._sandbox.result(
+                self._sandbox.request("call", self.__name__, args, kwargs)
+            )
+
+
+class SandboxEnv(Env):
+    """:class:`~ActFit.ui.env.Env` executing the source in a :class:`Sandbox`
+
+    The source always sees numpy as ``np``; ``globals_`` is not passed on.
+    Locals that can't be pickled stay in the worker and are not offered.
+
+    :param cpu_seconds: CPU time limit of a single execution or call
+    :param memory_bytes: address space limit of the worker
+    :param timeout: wall time limit of a single execution or call
+    """
+
+    def __init__(
+        self, globals_=None, cpu_seconds=10.0, memory_bytes=None, timeout=60.0
+    ):
+        self.sandbox = Sandbox(cpu_seconds, memory_bytes, timeout, self._restore)
+        super().__init__(globals_)
+
+    def reset(self):
+        super().reset()
+        self._bound = {}
+        self._source = None
+        if self.sandbox.running:
+            self.sandbox.request("reset")
+
+    def _restore(self):
+        """Bring a new worker to the state of the last one"""
+        for name, (kind, value) in self._bound.items():
+            if kind == "array":
+                descriptor = _describe(value)
+                if descriptor is None or not os.path.exists(descriptor["path"]):
+                    # files of the previous worker are gone
+                    descriptor = _export(value, self.sandbox.directory)[0]
+                value = descriptor
+            self.sandbox.request("bind", name, kind, value)
+        if self._source is not None:
+            self.sandbox.request("exec", self._source, False)
+
+    def _apply(self, state):
+        locals_ = {}
+        for name, (kind, value) in state["locals"].items():
+            if kind == "array":
+                locals_[name] = self.sandbox.attach(value)
+            elif kind == "callable":
+                previous = self.locals.get(name)
+                if isinstance(previous, ModelProxy) and previous.params == value:
+                    locals_[name] = previous
+                else:
+                    locals_[name] = ModelProxy(self.sandbox, name, value)
+            else:
+                locals_[name] = value
+        self.sandbox.forget(
+            {
+                value["path"]
+                for kind, value in state["locals"].values()
+                if kind == "array"
+            }
+        )
+        self.locals = locals_
+        self.sources = state["sources"]
+        self.executed = state["executed"]
+        self._refresh()
+
+    def exec(self, code, incremental=True):
+        with PROFILER.span("Env.exec"):
+            # a source that got the worker killed must not be replayed
+            self._source = None
+            state = self.sandbox.request("exec", code, incremental)
+            self._source = code
+            self._apply(state)
+            if state["error"] is not None:
+                raise state["error"]
+
+    def bind(self, name, value):
+        self.sandbox.start()
+        if _shareable(value):
+            descriptor = _describe(value)
+            if descriptor is None:
+                descriptor, value = _export(value, self.sandbox.directory)
+            self._bound[name] = ("array", value)
+            self._apply(self.sandbox.request("bind", name, "array", descriptor))
+        else:
+            self._bound[name] = ("value", value)
+            self._apply(self.sandbox.request("bind", name, "value", value))
+
+    def eval(self, code):
+        return self.sandbox.request("eval", code)
+
+    def close(self):
+        self.sandbox.close()
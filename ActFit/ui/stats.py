@@ -0,0 +1,60 @@
+import tkinter as tk
+import tkinter.ttk as ttk
+
+from ..stats import fit_statistics
+from .utils import *
+
+
+__all__ = ("StatsPanel",)
+
+
+class StatsPanel(ttk.Frame):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._text = tk.StringVar(self, "")
+        label = ttk.Label(
+            self, textvariable=self._text, font=MONOSPACE_FONT, justify=tk.LEFT
+        )
+        label.pack(fill=tk.X, expand=True, anchor="w")
+
+    def update(self):
+        evaluation = self.master.evaluation
+        if evaluation is None:
+            self._text.set("")
+            return
+        params = self.master.params
+        stats = fit_statistics(
+            evaluation.ys,
+            evaluation.data,
+            len(params),
+            evaluation.n_points,
+            self.master.covariance,
+            evaluation.sigma,
+        )
+
+        summary = (
+            f"RSS {stats.rss:.6g}   χ²/dof {stats.reduced_chi2:.6g}"
+            f"   R² {stats.r_squared:.6f}"
+        )
+        where = " in view" if evaluation.in_view else ""
+        if stats.n_sampled < stats.n_points:
+            summary += (
+                f"   (≈ from {stats.n_sampled} of {stats.n_points} points{where})"
+            )
+        elif where:
+            summary += f"   ({stats.n_points} points{where})"
+        lines = [summary]
+        if stats.errors is not None:
+            width = max(len(name) for name in params)
+            for (name, value), error in zip(params.items(), stats.errors):
+                lines.append(f"{name:>{width}} = {value:+.6g} ± {error:.3g}")
+            if len(params) > 1:
+                lines.append(
+                    " " * width + "".join(f"{name:>8}" for name in params)
+                )
+                for name, row in zip(params, stats.correlations):
+                    lines.append(
+                        f"{name:>{width}}" + "".join(f"{c:>+8.3f}" for c in row)
+                    )
+        self._text.set("\n".join(lines))
@@ -0,0 +1,231 @@
+import math
+import queue
+import time
+import tkinter as tk
+from tkinter import messagebox
+import tkinter.ttk as ttk
+
+import numpy as np
+
+from ..uncertainty import METHODS
+from .profiler import STARTUP
+from .worker import UncertaintyWorker
+from .utils import *
+
+
+__all__ = ("UncertaintyView",)
+
+
+class UncertaintyView(tk.Toplevel):
+    """Histograms of parameters refitted to resampled data
+
+    The histograms and intervals are redrawn while the refits finish.
+    """
+
+    POLL_INTERVAL = 50  # ms
+    REDRAW_INTERVAL = 0.5  # s between redraws of the partial histograms
+    LEVELS = (0.6827, 0.95)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.title("Parameter Uncertainty")
+
+        controls = ttk.Frame(self)
+        controls.pack(fill=tk.X)
+        self._method = tk.StringVar(self, METHODS[0])
+        ttk.Label(controls, text="Method:").grid(column=0, row=0)
+        ttk.Combobox(
+            controls,
+            textvariable=self._method,
+            values=METHODS,
+            width=12,
+            state="readonly",
+        ).grid(column=1, row=0)
+        ttk.Label(controls, text="Samples:").grid(column=2, row=0)
+        self._samples = tk.StringVar(self, "1000")
+        ttk.Spinbox(
+            controls,
+            from_=10,
+            to=10**6,
+            increment=100,
+            width=7,
+            textvariable=self._samples,
+        ).grid(column=3, row=0)
+        self._compute_button = ttk.Button(
+            controls, text="Compute", command=event_wrapper(self.compute)
+        )
+        self._compute_button.grid(column=4, row=0)
+        self._cancel_button = ttk.Button(
+            controls,
+            text="Cancel",
+            command=event_wrapper(self.cancel),
+            state=tk.DISABLED,
+        )
+        self._cancel_button.grid(column=5, row=0)
+
+        figure = STARTUP.import_module("matplotlib.figure")
+        backend = STARTUP.import_module("matplotlib.backends.backend_tkagg")
+        self._fig = figure.Figure(figsize=(6, 4), dpi=100)
+        self._canvas = backend.FigureCanvasTkAgg(self._fig, master=self)
+        self._canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+        columns = ("value", "error", "68%", "95%")
+        self._table = ttk.Treeview(self, columns=columns, height=4)
+        self._table.heading("#0", text="Parameter")
+        self._table.column("#0", width=80)
+        for column, text in zip(
+            columns, ("Fitted", "Std. dev.", "68.3% interval", "95% interval")
+        ):
+            self._table.heading(column, text=text)
+            self._table.column(column, width=140)
+        self._table.pack(fill=tk.X)
+
+        self._status = tk.StringVar(self, "")
+        ttk.Label(self, textvariable=self._status).pack(fill=tk.X)
+
+        self._worker = None
+        self._drawn = None
+        self._last_draw = 0.0
+        self._started = 0.0
+        self._note = ""
+
+    def compute(self):
+        if self._worker is not None or not self.master.plot_ready:
+            return
+        try:
+            n = int(self._samples.get())
+            boundaries = self.master.boundaries
+        except ValueError as e:
+            messagebox.showwarning("Parameter Uncertainty", e.args[0], parent=self)
+            return
+        xs, data, sigma = self.master.fit_arrays
+        self._worker = UncertaintyWorker(
+            self.master.model,
+            xs,
+            data,
+            self.master.params,
+            resample_kwargs=dict(
+                method=self._method.get(),
+                n=n,
+                bounds=(
+                    [lower for lower, _ in boundaries.values()],
+                    [upper for _, upper in boundaries.values()],
+                ),
+                source=self.master.jacobian_source,
+                sigma=sigma,
+                **self.master.fit_kwargs,
+            ),
+        )
+        self._note = ""
+        if self.master.covariance is None:
+            self._note = ", starting from the sliders rather than a fit"
+        self._drawn = None
+        self._started = time.monotonic()
+        self._compute_button.config(state=tk.DISABLED)
+        self._cancel_button.config(state=tk.NORMAL)
+        self._status.set("Refitting...")
+        self._worker.start()
+        self.after(self.POLL_INTERVAL, self._poll_worker)
+
+    def cancel(self):
+        if self._worker is not None:
+            self._worker.cancel()
+
+    def destroy(self):
+        # closing the window would otherwise leave the workers computing
+        self.cancel()
+        super().destroy()
+
+    def _finish(self, status):
+        self._worker = None
+        self._compute_button.config(state=tk.NORMAL)
+        self._cancel_button.config(state=tk.DISABLED)
+        self._status.set(status)
+
+    def _summary(self, uncertainty):
+        done = len(uncertainty.success)
+        converged = int(np.count_nonzero(uncertainty.success))
+        seconds = time.monotonic() - self._started
+        return (
+            f"{converged} of {done} refits converged,"
+            f" {done / seconds:.1f} refits/s{self._note}"
+        )
+
+    def _poll_worker(self):
+        worker = self._worker
+        if worker is None or not self.winfo_exists():
+            return
+        while True:
+            try:
+                kind, *payload = worker.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                done, fraction = payload
+                self._status.set(f"Refitting... {done} ({fraction:.0%})")
+            elif kind == "done":
+                uncertainty, _ = payload
+                self._finish(self._summary(uncertainty))
+                self._show(uncertainty)
+                return
+            elif kind == "cancelled":
+                self._finish("Cancelled")
+                return
+            elif kind == "error":
+                (e,) = payload
+                self._finish(type(e).__name__)
+                messagebox.showerror(
+                    type(e).__name__, e.args[0] if e.args else "", parent=self
+                )
+                return
+        partial = worker.partial
+        now = time.monotonic()
+        if partial is not self._drawn and now - self._last_draw > self.REDRAW_INTERVAL:
+            self._show(partial)
+        self.after(self.POLL_INTERVAL, self._poll_worker)
+
+    def _show(self, uncertainty):
+        self._drawn = uncertainty
+        self._last_draw = time.monotonic()
+        intervals = [uncertainty.interval(level) for level in self.LEVELS]
+        errors = uncertainty.errors
+        converged = uncertainty.converged
+
+        self._fig.clf()
+        n = len(uncertainty.names)
+        columns = min(n, 3)
+        rows = math.ceil(n / columns) if n else 0
+        bins = int(np.clip(np.sqrt(len(converged)), 10, 50))
+        for i, name in enumerate(uncertainty.names):
+            ax = self._fig.add_subplot(rows, columns, i + 1)
+            if len(converged):
+                ax.hist(converged[:, i], bins=bins, color="tab:blue", alpha=0.7)
+            (lower, upper), (lower_95, upper_95) = (
+                (interval[0][i], interval[1][i]) for interval in intervals
+            )
+            if np.isfinite(lower):
+                ax.axvspan(lower, upper, color="tab:orange", alpha=0.2)
+                ax.axvline(lower_95, color="tab:orange", ls="--", lw=1)
+                ax.axvline(upper_95, color="tab:orange", ls="--", lw=1)
+            ax.axvline(uncertainty.params[i], color="red", lw=1)
+            ax.set_title(name, fontsize=9)
+            ax.tick_params(labelsize=7)
+            ax.set_yticks([])
+        self._fig.tight_layout()
+        self._canvas.draw_idle()
+
+        self._table.delete(*self._table.get_children())
+        for i, name in enumerate(uncertainty.names):
+            self._table.insert(
+                "",
+                tk.END,
+                text=name,
+                values=(
+                    f"{uncertainty.params[i]:.6g}",
+                    f"{errors[i]:.3g}",
+                    *(
+                        f"[{interval[0][i]:.6g}, {interval[1][i]:.6g}]"
+                        for interval in intervals
+                    ),
+                ),
+            )
@@ -1,12 +1,17 @@
+from .profiler import PROFILER
+
+
 __all__ = ("MONOSPACE_FONT", "event_wrapper", "chain_call")
 
 
 MONOSPACE_FONT = ("consolas", 10)
 
 
-def event_wrapper(func):
+def event_wrapper(func, name=None):
+    timed = PROFILER.wrap(func, name)
+
     def inner(*args):
-        return func()
+        return timed()
 
     return inner
 
@@ -15,4 +20,7 @@ def chain_call(*funcs):
     def inner():
         return [func() for func in funcs]
 
+    inner.__qualname__ = " + ".join(
+        getattr(func, "__qualname__", type(func).__qualname__) for func in funcs
+    )
     return inner
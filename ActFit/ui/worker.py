@@ -0,0 +1,392 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from ..fit import _per_dataset, active_fit
+from ..globalfit import global_fit
+from ..jacobian import build_jacobian
+from ..landscape import chi2_landscape
+from ..seed import auto_seed
+from ..uncertainty import resample_fit
+from .profiler import PROFILER, STARTUP
+
+
+__all__ = (
+    "FitCancelled",
+    "Worker",
+    "FitWorker",
+    "GlobalFitWorker",
+    "LandscapeWorker",
+    "SeedWorker",
+    "UncertaintyWorker",
+)
+
+
+class FitCancelled(Exception):
+    pass
+
+
+class Worker(threading.Thread):
+    """Base class for background computations driven from the Tk loop
+
+    Messages are posted to :attr:`messages` as tuples and are meant to be
+    drained from the Tk main loop:
+
+    - ``("progress", count, residual)``
+    - ``("done", params, cov)``
+    - ``("cancelled",)``
+    - ``("error", exception)``
+
+    :param interval: minimal time in seconds between two progress messages
+    """
+
+    #: modules imported by the thread before :meth:`compute`, off the Tk loop
+    IMPORTS = ("scipy.optimize",)
+
+    def __init__(self, interval=0.1):
+        super().__init__(daemon=True)
+        self._interval = interval
+        self._cancel = threading.Event()
+        self._last_report = 0.0
+        self.messages = queue.Queue()
+        self.nfev = 0
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def _progress(self, count, residual):
+        """Check for cancellation and report progress, throttled
+
+        :param residual: residual or a callable computing it on demand
+        """
+        if self._cancel.is_set():
+            raise FitCancelled()
+        self.nfev = count
+        now = time.perf_counter()
+        if now - self._last_report >= self._interval:
+            self._last_report = now
+            if callable(residual):
+                residual = residual()
+            self.messages.put(("progress", count, float(residual)))
+
+    def compute(self):
+        raise NotImplementedError()
+
+    def run(self):
+        self._last_report = time.perf_counter()
+        try:
+            for name in self.IMPORTS:
+                STARTUP.import_module(name)
+            with PROFILER.span(type(self).__name__, "worker"):
+                params, cov = self.compute()
+        except FitCancelled:
+            self.messages.put(("cancelled",))
+        except Exception as e:
+            self.messages.put(("error", e))
+        else:
+            self.messages.put(("done", params, cov))
+
+
+class FitWorker(Worker):
+    """Run :func:`ActFit.fit.active_fit` on a background thread
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable
+    :param data: dependent data
+    :param p0: initial parameters
+    :param bounds: ``(lower, upper)`` parameter bounds
+    :param source: source text of the model, used to derive its Jacobian
+    :param fit_kwargs: passed on to :func:`~ActFit.fit.active_fit`, e.g.
+        ``sigma`` or ``loss``
+    :param cache: :class:`~ActFit.cache.FitCache` to look the fit up in
+        first; its key checksums the arrays, so it is computed in this thread
+        and left in :attr:`key` for the caller to store the result under
+    :param identity: ``(func, source)`` identifying the model in the cache
+        key, by default ``func`` and ``source``
+    """
+
+    def __init__(
+        self,
+        func,
+        xs,
+        data,
+        p0,
+        bounds,
+        source=None,
+        fit_kwargs=None,
+        cache=None,
+        identity=None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._func = func
+        self._xs = xs
+        self._data = data
+        self._p0 = p0
+        self._bounds = bounds
+        self._source = source
+        self._fit_kwargs = fit_kwargs or {}
+        self._cache = cache
+        self._identity = (func, source) if identity is None else identity
+        self.key = None
+        self.cached = False
+        self.jacobian = None
+        self.njev = 0
+        self.path = []
+
+    @property
+    def saved_evaluations(self):
+        """Model evaluations saved compared to finite differences
+
+        Only a symbolic Jacobian saves any, a complex step costs about as
+        much as the evaluations it replaces.
+        """
+        if self.jacobian is None or self.jacobian.method != "symbolic":
+            return 0
+        return self.njev * (len(self._p0) - self.jacobian.evaluations)
+
+    def _callback(self, nfev, params, ys):
+        self.path.append(np.array(params, dtype=float))
+        self._progress(nfev, lambda: np.sum(np.square(ys - self._data)))
+
+    def _jac(self, xs, *params):
+        if self._cancel.is_set():
+            raise FitCancelled()
+        self.njev += 1
+        return self.jacobian.func(xs, *params)
+
+    def _lookup(self):
+        with PROFILER.span("cache_key", "worker"):
+            try:
+                self.key = self._cache.key(
+                    *self._identity,
+                    self._xs,
+                    self._data,
+                    self._p0,
+                    self._bounds,
+                    **self._fit_kwargs,
+                )
+            except (TypeError, ValueError):
+                return None
+        return self._cache.get(self.key)
+
+    def compute(self):
+        if self._cache is not None:
+            cached = self._lookup()
+            if cached is not None:
+                self.cached = True
+                return cached
+        with PROFILER.span("build_jacobian", "worker"):
+            self.jacobian = build_jacobian(self._func, self._xs, self._p0, self._source)
+        kwargs = dict(self._fit_kwargs)
+        if self.jacobian.func is not None:
+            # finite differences otherwise, which "lm" takes no name for
+            kwargs["jac"] = self._jac
+        with PROFILER.span("curve_fit", "worker"):
+            return active_fit(
+                self._func,
+                self._xs,
+                self._data,
+                p0=self._p0,
+                bounds=self._bounds,
+                callback=self._callback,
+                **kwargs,
+            )
+
+
+class SeedWorker(Worker):
+    """Run :func:`ActFit.seed.auto_seed` on a background thread
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable
+    :param data: dependent data
+    :param bounds: ``(lower, upper)`` corners of the search box
+    :param n_samples: number of samples drawn from the box
+    """
+
+    def __init__(self, func, xs, data, bounds, n_samples=1024, **kwargs):
+        super().__init__(**kwargs)
+        self._func = func
+        self._xs = xs
+        self._data = data
+        self._bounds = bounds
+        self._n_samples = n_samples
+
+    def _callback(self, n_done, residuals):
+        self._progress(n_done, lambda: np.min(residuals[:n_done]))
+
+    def compute(self):
+        result = auto_seed(
+            self._func,
+            self._xs,
+            self._data,
+            self._bounds,
+            n_samples=self._n_samples,
+            callback=self._callback,
+        )
+        return result.params, result.covariance
+
+
+class GlobalFitWorker(Worker):
+    """Run :func:`ActFit.globalfit.global_fit` on a background thread
+
+    The reported parameters and covariance are those of dataset ``index``,
+    the full result is kept as :attr:`result`.
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable, shared or one per dataset
+    :param datasets: sequence of dependent data arrays
+    :param shared: names of the shared parameters
+    :param p0: initial parameters, one row or one per dataset
+    :param bounds: ``(lower, upper)`` parameter bounds
+    :param source: source text of the model, used to derive its Jacobian
+    :param index: dataset to report
+    :param fit_kwargs: passed on to :func:`~ActFit.globalfit.global_fit`
+    """
+
+    def __init__(
+        self,
+        func,
+        xs,
+        datasets,
+        shared,
+        p0,
+        bounds,
+        source=None,
+        index=0,
+        fit_kwargs=None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._func = func
+        self._xs = xs
+        self.datasets = datasets
+        self._shared = shared
+        self._p0 = p0
+        self._bounds = bounds
+        self._source = source
+        self._index = index
+        self._fit_kwargs = fit_kwargs or {}
+        self.jacobian = None
+        self.saved_evaluations = 0
+        self.result = None
+
+    def _callback(self, nfev, params, residuals):
+        self._progress(nfev, lambda: np.dot(residuals, residuals))
+
+    def compute(self):
+        xs = self._xs[0] if _per_dataset(self._xs, self.datasets) else self._xs
+        p0 = np.atleast_2d(self._p0)[0]
+        with PROFILER.span("build_jacobian", "worker"):
+            self.jacobian = build_jacobian(self._func, xs, p0, self._source)
+        with PROFILER.span("global_fit", "worker"):
+            self.result = global_fit(
+                self._func,
+                self._xs,
+                self.datasets,
+                self._shared,
+                p0=self._p0,
+                bounds=self._bounds,
+                jac=self.jacobian.func,
+                callback=self._callback,
+                **self._fit_kwargs,
+            )
+        return (
+            self.result.params[self._index],
+            self.result.dataset_covariance(self._index),
+        )
+
+
+class LandscapeWorker(Worker):
+    """Run :func:`ActFit.landscape.chi2_landscape` on a background thread
+
+    The ``done`` message carries the :class:`~ActFit.landscape.Landscape` in
+    place of the parameters, progress messages the finished fraction in
+    place of the residual.
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable
+    :param data: dependent data
+    :param params: all parameters by name
+    :param names: the two parameters to vary
+    :param ranges: their ``(lower, upper)`` ranges
+    :param landscape_kwargs: passed on to
+        :func:`~ActFit.landscape.chi2_landscape`
+    """
+
+    IMPORTS = ()
+
+    def __init__(
+        self, func, xs, data, params, names, ranges, landscape_kwargs=None, **kwargs
+    ):
+        super().__init__(**kwargs)
+        self._func = func
+        self._xs = xs
+        self._data = data
+        self._params = params
+        self._names = names
+        self._ranges = ranges
+        self._landscape_kwargs = landscape_kwargs or {}
+
+    def _callback(self, done, total):
+        self._progress(done, done / total)
+
+    def compute(self):
+        landscape = chi2_landscape(
+            self._func,
+            self._xs,
+            self._data,
+            self._params,
+            self._names,
+            self._ranges,
+            callback=self._callback,
+            **self._landscape_kwargs,
+        )
+        return landscape, None
+
+
+class UncertaintyWorker(Worker):
+    """Run :func:`ActFit.uncertainty.resample_fit` on a background thread
+
+    The ``done`` message carries the :class:`~ActFit.uncertainty.Uncertainty`
+    in place of the parameters, progress messages the finished fraction in
+    place of the residual. The refits finished so far are kept as
+    :attr:`partial`.
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable
+    :param data: dependent data
+    :param params: fitted parameters by name
+    :param resample_kwargs: passed on to
+        :func:`~ActFit.uncertainty.resample_fit`
+    """
+
+    def __init__(self, func, xs, data, params, resample_kwargs=None, **kwargs):
+        super().__init__(**kwargs)
+        self._func = func
+        self._xs = xs
+        self._data = data
+        self._params = params
+        self._resample_kwargs = resample_kwargs or {}
+        self.partial = None
+
+    def _callback(self, done, total, partial):
+        self.partial = partial
+        self._progress(done, done / total)
+
+    def compute(self):
+        uncertainty = resample_fit(
+            self._func,
+            self._xs,
+            self._data,
+            self._params,
+            callback=self._callback,
+            **self._resample_kwargs,
+        )
+        return uncertainty, None
@@ -0,0 +1,331 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import mmap
+import os
+import tempfile
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+import warnings
+
+import numpy as np
+
+from .fit import Bounds, active_fit, parameter_names
+
+__all__ = ("METHODS", "Uncertainty", "resample_fit")
+
+
+#: ways :func:`resample_fit` draws synthetic datasets
+METHODS = ("bootstrap", "monte_carlo")
+
+
+class Uncertainty(NamedTuple):
+    """Parameters refitted to resampled data
+
+    :param names: parameter names
+    :param params: parameters fitted to the data, the resamples' origin
+    :param samples: one row of refitted parameters per resample, ``nan``
+        where the refit failed
+    :param success: which refits converged
+    :param method: one of :data:`METHODS`
+    """
+
+    names: Tuple[str, ...]
+    params: np.ndarray
+    samples: np.ndarray
+    success: np.ndarray
+    method: str
+
+    @property
+    def converged(self) -> np.ndarray:
+        """Parameters of the converged refits, ``(n, p)``"""
+        return self.samples[self.success]
+
+    @property
+    def errors(self) -> np.ndarray:
+        """Standard deviation of each parameter over the converged refits"""
+        converged = self.converged
+        if len(converged) < 2:
+            return np.full(len(self.names), np.nan)
+        return converged.std(axis=0, ddof=1)
+
+    @property
+    def covariance(self) -> np.ndarray:
+        """Parameter covariance over the converged refits"""
+        converged = self.converged
+        if len(converged) < 2:
+            return np.full((len(self.names),) * 2, np.nan)
+        return np.atleast_2d(np.cov(converged, rowvar=False))
+
+    def interval(self, level: float = 0.6827) -> Tuple[np.ndarray, np.ndarray]:
+        """Central percentile interval of each parameter
+
+        Unlike :attr:`errors`, the interval needn't be symmetric around
+        :attr:`params`, as for strongly non-linear models.
+
+        :param level: probability covered, e.g. 0.95
+        :return: lower and upper ends
+        """
+        converged = self.converged
+        if len(converged) == 0:
+            nan = np.full(len(self.names), np.nan)
+            return nan, nan.copy()
+        tail = 50 * (1 - level)
+        lower, upper = np.percentile(converged, [tail, 100 - tail], axis=0)
+        return lower, upper
+
+
+def _shared_directory():
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return None
+
+
+def _share(value, created):
+    """Descriptor of a numeric array that worker processes map from a file
+
+    Arrays that already map a whole file, e.g. ones loaded by
+    :mod:`ActFit.loaders`, are mapped again, others are copied into a new
+    file in shared memory whose path is appended to ``created``. Other values
+    are returned as they are and pickled.
+    """
+    if not (
+        isinstance(value, np.ndarray)
+        and value.dtype.kind in "biuf"
+        and value.ndim > 0
+        and value.size > 0
+    ):
+        return value
+    if (
+        isinstance(value, np.memmap)
+        and isinstance(value.base, mmap.mmap)
+        and value.filename is not None
+        and value.flags.c_contiguous
+    ):
+        return ("memmap", value.filename, value.dtype.str, value.shape, value.offset)
+    fd, path = tempfile.mkstemp(prefix="actfit-", dir=_shared_directory())
+    os.close(fd)
+    created.append(path)
+    shared = np.memmap(path, dtype=value.dtype, mode="w+", shape=value.shape)
+    shared[...] = value
+    shared.flush()
+    return ("memmap", path, value.dtype.str, value.shape, 0)
+
+
+def _attach(value):
+    if isinstance(value, tuple) and len(value) == 5 and value[0] == "memmap":
+        _, path, dtype, shape, offset = value
+        return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+    return value
+
+
+def _noise(xs, data, fitted, sigma, n_params, method, absolute_sigma):
+    """What :func:`_resample` adds to the model values
+
+    :return: centred residuals, in units of ``sigma`` if given, to bootstrap
+        from, or the standard deviation of Monte-Carlo noise
+    """
+    residuals = np.ravel(data - fitted)
+    if sigma is not None:
+        residuals = residuals / np.ravel(sigma)
+    finite = np.isfinite(residuals)
+    dof = max(np.count_nonzero(finite) - n_params, 1)
+    if method == "bootstrap":
+        residuals = np.where(finite, residuals - residuals[finite].mean(), 0.0)
+        # residuals of a fit are smaller than the noise by about this factor
+        return residuals * np.sqrt(len(residuals) / dof)
+    if sigma is not None and absolute_sigma:
+        return np.asarray(sigma, dtype=float)
+    scale = np.sqrt(np.sum(np.square(residuals[finite])) / dof)
+    return scale if sigma is None else scale * np.asarray(sigma, dtype=float)
+
+
+def _resample(rng, fitted, noise, sigma, method):
+    """Synthetic data, the model values plus resampled noise"""
+    if method == "bootstrap":
+        drawn = noise[rng.integers(0, noise.size, noise.size)].reshape(fitted.shape)
+        return fitted + (drawn if sigma is None else drawn * sigma)
+    return fitted + rng.standard_normal(fitted.shape) * noise
+
+
+_worker_state = None
+
+
+def _init_worker(func, source, xs, fitted, noise, sigma, params, bounds, options):
+    import dill
+
+    _prepare(
+        dill.loads(func),
+        source,
+        *map(_attach, (xs, fitted, noise, sigma)),
+        params,
+        bounds,
+        options,
+    )
+
+
+def _prepare(func, source, xs, fitted, noise, sigma, params, bounds, options):
+    # imported by the first refit otherwise
+    import scipy.optimize
+
+    global _worker_state
+    jac = None
+    if source is not None:
+        from .jacobian import build_jacobian
+
+        jacobian = build_jacobian(func, xs, params, source)
+        if jacobian.func is not None:
+            jac = jacobian.func
+    _worker_state = (func, jac, xs, fitted, noise, sigma, params, bounds, options)
+
+
+def _refit(seeds):
+    """Refit the model to the resamples drawn from ``(index, seed)`` pairs"""
+    import scipy.optimize as opt
+
+    func, jac, xs, fitted, noise, sigma, params, bounds, options = _worker_state
+    method = options["method"]
+    kwargs = {key: value for key, value in options.items() if key != "method"}
+    if jac is not None:
+        kwargs["jac"] = jac
+    indices = np.array([index for index, _ in seeds], dtype=int)
+    samples = np.full((len(seeds), len(params)), np.nan)
+    success = np.zeros(len(seeds), dtype=bool)
+    for i, (_, seed) in enumerate(seeds):
+        data = _resample(np.random.default_rng(seed), fitted, noise, sigma, method)
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", opt.OptimizeWarning)
+                with np.errstate(all="ignore"):
+                    samples[i], _ = active_fit(
+                        func,
+                        xs,
+                        data,
+                        p0=params,
+                        bounds=bounds,
+                        sigma=sigma,
+                        **kwargs,
+                    )
+        except (RuntimeError, ValueError):
+            continue
+        success[i] = np.all(np.isfinite(samples[i]))
+    return indices, samples, success
+
+
+def resample_fit(
+    func: Callable,
+    xs,
+    data,
+    params: Dict[str, float],
+    method: str = "bootstrap",
+    n: int = 1000,
+    bounds: Bounds = (-np.inf, np.inf),
+    sigma=None,
+    absolute_sigma: bool = False,
+    source: Optional[str] = None,
+    seed: Optional[int] = None,
+    processes: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    callback: Optional[Callable] = None,
+    **kwargs,
+) -> Uncertainty:
+    """Parameter uncertainty from refits to resampled data
+
+    The model evaluated at ``params``, usually the result of a fit, plus
+    resampled noise gives ``n`` synthetic datasets, each refitted starting
+    from ``params``. ``"bootstrap"`` draws the fit's residuals with
+    replacement, ``"monte_carlo"`` draws normally distributed noise of
+    ``sigma``, or of the residuals' spread if ``sigma`` is relative or not
+    given. The spread of the refitted parameters doesn't rely on the model
+    being linear near the optimum, unlike the covariance of the fit.
+
+    Refits are spread across a process pool, which maps ``xs``, the model
+    values, the noise and ``sigma`` from files in shared memory instead of
+    pickling them for every worker. Models that can't be pickled with dill
+    are refitted in this process. Every resample has its own random seed, so
+    the result doesn't depend on the number of processes.
+
+    :param func: model function ``func(xs, *params)``
+    :param xs: independent variable
+    :param data: dependent data
+    :param params: fitted parameters by name
+    :param method: one of :data:`METHODS`
+    :param n: number of resamples
+    :param bounds: ``(lower, upper)`` parameter bounds of the refits
+    :param sigma: uncertainties of ``data``
+    :param absolute_sigma: whether ``sigma`` is absolute rather than relative
+    :param source: source text of the model, used to derive its Jacobian
+    :param seed: seed of the resamples, random by default
+    :param processes: number of worker processes, defaults to the number of
+        CPUs; ``1`` refits in the calling process
+    :param chunksize: resamples per task, defaults to eight tasks per worker
+    :param callback: called as ``callback(done, total, partial)`` after every
+        task, with an :class:`Uncertainty` of the finished resamples; raising
+        from it aborts
+    :param kwargs: passed on to :func:`~ActFit.fit.active_fit`, e.g. ``loss``
+    :return: the refitted parameters
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown method {method!r}, expected one of {METHODS}")
+    names = tuple(parameter_names(func))
+    values = np.array([params[name] for name in names], dtype=float)
+    data = np.asarray(data, dtype=float)
+    if sigma is not None:
+        sigma = np.broadcast_to(np.asarray(sigma, dtype=float), data.shape)
+    with np.errstate(all="ignore"):
+        fitted = np.array(np.broadcast_to(func(xs, *values), data.shape), dtype=float)
+    noise = _noise(xs, data, fitted, sigma, len(names), method, absolute_sigma)
+    if method == "bootstrap" and not np.any(noise):
+        raise ValueError("the model fits the data exactly, nothing to resample")
+    options = dict(kwargs, method=method, absolute_sigma=absolute_sigma)
+
+    seeds = list(enumerate(np.random.SeedSequence(seed).spawn(n)))
+    processes = processes or os.cpu_count() or 1
+    chunksize = chunksize or max(1, -(-n // (processes * 8)))
+    chunks = [seeds[i : i + chunksize] for i in range(0, n, chunksize)]
+    initargs = (source, xs, fitted, noise, sigma, values, bounds, options)
+
+    pickled = None
+    if processes > 1 and len(chunks) > 1:
+        import dill
+
+        try:
+            pickled = dill.dumps(func)
+        except Exception:
+            pickled = None
+
+    samples = np.full((n, len(names)), np.nan)
+    success = np.zeros(n, dtype=bool)
+    finished = np.zeros(n, dtype=bool)
+    created = []
+    pool = None
+    futures = []
+    try:
+        if pickled is None:
+            _prepare(func, *initargs)
+            results = map(_refit, chunks)
+        else:
+            shared = [_share(value, created) for value in (xs, fitted, noise, sigma)]
+            initargs = (source, *shared, values, bounds, options)
+            pool = ProcessPoolExecutor(
+                min(processes, len(chunks)),
+                initializer=_init_worker,
+                initargs=(pickled,) + initargs,
+            )
+            futures = [pool.submit(_refit, chunk) for chunk in chunks]
+            results = (future.result() for future in as_completed(futures))
+        for indices, chunk_samples, chunk_success in results:
+            samples[indices] = chunk_samples
+            success[indices] = chunk_success
+            finished[indices] = True
+            if callback is not None:
+                partial = Uncertainty(
+                    names, values, samples[finished], success[finished], method
+                )
+                callback(int(np.count_nonzero(finished)), n, partial)
+    finally:
+        for future in futures:
+            future.cancel()
+        if pool is not None:
+            # wait for running tasks before their shared files disappear
+            pool.shutdown(wait=True)
+        for path in created:
+            os.remove(path)
+    return Uncertainty(names, values, samples, success, method)
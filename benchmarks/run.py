@@ -0,0 +1,455 @@
+"""Timing of the interactive fitting paths
+
+Runs without a display: matplotlib renders through Agg and the Tk widgets
+are replaced by :class:`StandIn`, which keeps the widget methods the code
+under test calls but runs scheduled callbacks on demand. The real
+:class:`~ActFit.ui.plot.Plot` and the real properties of
+:class:`~ActFit.ui.app.App` are timed on top of it. Fits are timed the way
+``FitUI.perform_fit`` runs them, from the cache lookup to the ``done``
+message of the :class:`~ActFit.ui.worker.FitWorker` thread.
+
+Usage::
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --sizes 2 3 4 --only model_eval plot
+    python -m benchmarks.run --compare old.json new.json
+"""
+
+import argparse
+from datetime import datetime, timezone
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import numpy as np
+import tkinter.ttk as ttk
+
+from ActFit.cache import FitCache
+from ActFit.compiled import ModelCache
+from ActFit.fit import active_fit, parameter_names
+from ActFit.ui.app import App
+from ActFit.ui.env import Env
+from ActFit.ui.plot import Plot
+from ActFit.ui.sandbox import SandboxEnv
+from ActFit.ui.worker import FitWorker, UncertaintyWorker
+
+#: sample source of ``ActFit.ui.__main__`` with a variable number of points
+SOURCE = """def f(xs, m, b, c):
+    return m * np.sin(b * xs) + c
+
+def g(xs, a, b, c, d, e):
+    return a * np.power(xs - e, 3) + b * np.power(xs - e, 2) + c * (xs - e) + d
+
+xs = np.linspace(0, np.pi*2, {n})
+
+data = np.sin(xs) + np.random.rand({n})*3"""
+
+#: a beam profile of about ``n`` pixels, fitted as an image
+IMAGE_SOURCE = """def beam(xs, a, x0, y0, w, c):
+    return a * np.exp(-((xs[0] - x0) ** 2 + (xs[1] - y0) ** 2) / (2 * w ** 2)) + c
+
+y, x = np.mgrid[0:1:{side}j, 0:1:{side}j]
+xs = np.stack([x, y])
+data = beam(xs, 2, 0.4, 0.6, 0.1, 0.5) + np.random.rand({side}, {side})"""
+
+MODELS = ("f", "g")
+SIZES = (2, 3, 4, 5, 6, 7)
+BENCHMARKS = (
+    "env_exec",
+    "model_eval",
+    "sandbox_eval",
+    "fit",
+    "plot",
+    "image_plot",
+    "uncertainty",
+)
+#: resamples refitted per ``uncertainty`` run
+RESAMPLES = 100
+
+
+class StandIn(ttk.Frame):
+    """Widget base that never creates a Tk window
+
+    ``after`` and ``after_idle`` callbacks are queued and run by
+    :meth:`run_pending`, virtual events are dropped.
+    """
+
+    def __init__(self, master=None, **kwargs):
+        self.master = master
+        self._queue = []
+
+    def after(self, ms, func=None, *args):
+        self._queue.append((func, args))
+        return f"after#{len(self._queue)}"
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, id):
+        pass
+
+    def event_generate(self, sequence, **kwargs):
+        pass
+
+    def run_pending(self):
+        while self._queue:
+            func, args = self._queue.pop(0)
+            func(*args)
+
+
+class HeadlessPlot(Plot, StandIn):
+    def _build_placeholder(self):
+        self._placeholder = None
+
+    def _build_canvas(self):
+        self._background = None
+        self._canvas = FigureCanvasAgg(self._fig)
+        self._canvas.mpl_connect("draw_event", self._draw_handler)
+
+
+class _Choice:
+    def __init__(self, env, name):
+        self._env = env
+        self.name = name
+
+    @property
+    def value(self):
+        return self._env.get(self.name) if self.name else None
+
+
+class _Sliders:
+    def __init__(self, params):
+        self.params = params
+        self.covariance = None
+
+
+class _Option:
+    def __init__(self, value):
+        self._value = value
+
+    def get(self):
+        return self._value
+
+
+class Host:
+    """The parts of :class:`~ActFit.ui.app.App` the timed code uses"""
+
+    _stacked = App.__dict__["_stacked"]
+    _selected = App._selected
+    datasets = App.datasets
+    dataset_index = App.dataset_index
+    params = App.params
+    func = App.func
+    func_name = App.func_name
+    func_source = App.func_source
+    jacobian_source = App.jacobian_source
+    model = App.model
+    ys = App.ys
+    evaluate = App.evaluate
+    xs = App.xs
+    data = App.data
+    sigma = App.sigma
+    plot_ready = App.plot_ready
+    evaluation = App.evaluation
+    covariance = App.covariance
+
+    def __init__(self, env, func_name, compile_=True):
+        self._env = env
+        self._models = ModelCache()
+        self._python_models = ModelCache(backends=[])
+        self._compile = _Option(compile_)
+        self._sandboxed = isinstance(env, SandboxEnv)
+        self._func_choice = _Choice(env, func_name)
+        self._xs_choice = _Choice(env, "xs")
+        self._data_choice = _Choice(env, "data")
+        self._sigma_choice = _Choice(env, None)
+        self._fitui = _Sliders(
+            {name: 1.0 for name in parameter_names(env.get(func_name))}
+        )
+        self._plot = HeadlessPlot(self)
+
+
+def _measure(func, repeat, budget=1.0):
+    """Wall times of up to ``repeat`` calls, fewer if a call exceeds ``budget``"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        if sum(times) > budget * repeat:
+            break
+    return times
+
+
+def _result(benchmark, n, times, **labels):
+    return dict(
+        benchmark=benchmark,
+        n=n,
+        **labels,
+        repeat=len(times),
+        best=min(times),
+        median=statistics.median(times),
+        mean=statistics.mean(times),
+    )
+
+
+def bench_env_exec(n, repeat):
+    env = Env(globals_={"np": np})
+    source = SOURCE.format(n=n)
+    yield _result("env_exec", n, _measure(lambda: env.exec(source, False), repeat))
+    # edit one function, the data statements are kept
+    edited = source.replace("m * np.sin", "m * np.cos")
+    sources = [edited, source]
+
+    def rerun():
+        sources.reverse()
+        env.exec(sources[0])
+
+    yield _result("env_exec", n, _measure(rerun, repeat), mode="incremental")
+
+
+def bench_model_eval(n, repeat):
+    env = Env(globals_={"np": np})
+    env.exec(SOURCE.format(n=n))
+    for model in MODELS:
+        for compile_ in (False, True):
+            host = Host(env, model, compile_)
+            host.ys  # compile and verify outside the timing
+            times = _measure(lambda: host.ys, repeat)
+            yield _result(
+                "model_eval",
+                n,
+                times,
+                model=model,
+                backend=host.model.backend or "python",
+            )
+
+
+def bench_sandbox_eval(n, repeat):
+    env = SandboxEnv(globals_={"np": np})
+    try:
+        env.exec(SOURCE.format(n=n))
+        for model in MODELS:
+            host = Host(env, model)
+            host.ys  # start the worker outside the timing
+            times = _measure(lambda: host.ys, repeat)
+            yield _result("sandbox_eval", n, times, model=model)
+    finally:
+        env.close()
+
+
+def bench_fit(n, repeat):
+    # the first fit imports scipy, outside of the timing
+    import scipy.optimize
+
+    env = Env(globals_={"np": np})
+    env.exec(SOURCE.format(n=n))
+    for model in MODELS:
+        host = Host(env, model)
+        host.ys
+
+        def fit():
+            p0 = list(host.params.values())
+            bounds = ([-10] * len(p0), [10] * len(p0))
+            # an empty cache, so the worker computes the key but fits anyway
+            worker = FitWorker(
+                host.model,
+                host.xs,
+                host.data,
+                p0=p0,
+                bounds=bounds,
+                source=host.jacobian_source,
+                cache=FitCache(),
+                identity=(host.func, host.func_source),
+            )
+            worker.start()
+            kind, *_ = worker.messages.get()
+            while kind == "progress":
+                kind, *_ = worker.messages.get()
+            if kind != "done":
+                raise RuntimeError(f"fit ended with {kind!r}")
+
+        times = _measure(fit, repeat, budget=10.0)
+        yield _result(
+            "fit", n, times, model=model, backend=host.model.backend or "python"
+        )
+
+
+def bench_plot(n, repeat):
+    env = Env(globals_={"np": np})
+    env.exec(SOURCE.format(n=n))
+    for model in MODELS:
+        host = Host(env, model)
+        plot = host._plot
+        host.ys
+
+        def request(method):
+            def run():
+                method()
+                plot.run_pending()
+
+            return run
+
+        for name, method in (
+            ("plot", plot.plot),
+            ("refine", plot.refine),
+            ("update_fit", plot.update_fit),
+        ):
+            if name == "update_fit":
+                # blit from the background cached by a decimated redraw
+                request(plot.plot)()
+            times = _measure(request(method), repeat)
+            yield _result("plot", n, times, model=model, request=name)
+
+
+def bench_image_plot(n, repeat):
+    env = Env(globals_={"np": np})
+    env.exec(IMAGE_SOURCE.format(side=int(np.sqrt(n))))
+    host = Host(env, "beam")
+    plot = host._plot
+
+    def request(method):
+        def run():
+            method()
+            plot.run_pending()
+
+        return run
+
+    for name, method in (
+        ("plot", plot.plot),
+        ("refine", plot.refine),
+        ("update_fit", plot.update_fit),
+    ):
+        if name == "update_fit":
+            # only the model and residual images are redrawn
+            request(plot.plot)()
+        times = _measure(request(method), repeat)
+        yield _result("image_plot", n, times, model="beam", request=name)
+
+
+def bench_uncertainty(n, repeat):
+    env = Env(globals_={"np": np})
+    env.exec(SOURCE.format(n=n))
+    host = Host(env, "f")
+    bounds = ([-10] * 3, [10] * 3)
+    params, _ = active_fit(host.func, host.xs, host.data, p0=[1, 1, 1], bounds=bounds)
+    for method in ("bootstrap", "monte_carlo"):
+
+        def resample():
+            worker = UncertaintyWorker(
+                host.model,
+                host.xs,
+                host.data,
+                dict(zip(host.params, params)),
+                resample_kwargs=dict(
+                    method=method,
+                    n=RESAMPLES,
+                    bounds=bounds,
+                    source=host.jacobian_source,
+                    seed=0,
+                ),
+            )
+            worker.start()
+            kind, *_ = worker.messages.get()
+            while kind == "progress":
+                kind, *_ = worker.messages.get()
+            if kind != "done":
+                raise RuntimeError(f"resampling ended with {kind!r}")
+
+        times = _measure(resample, repeat, budget=10.0)
+        yield _result("uncertainty", n, times, model="f", method=method)
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=SIZES, benchmarks=BENCHMARKS, repeat=5, log=sys.stderr):
+    results = []
+    for exponent in sizes:
+        n = 10**exponent
+        for benchmark in benchmarks:
+            for result in globals()["bench_" + benchmark](n, repeat):
+                if log is not None:
+                    labels = " ".join(
+                        str(value)
+                        for key, value in result.items()
+                        if key not in ("repeat", "best", "median", "mean")
+                    )
+                    print(f"{labels}: {result['median'] * 1e3:.3f} ms", file=log)
+                results.append(result)
+    return {
+        "commit": _commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def _key(result):
+    return tuple(
+        (key, value)
+        for key, value in result.items()
+        if key not in ("repeat", "best", "median", "mean")
+    )
+
+
+def compare(old, new, out=sys.stdout):
+    """Print the ratio of the median times of two result files"""
+    before = {_key(result): result for result in old["results"]}
+    for result in new["results"]:
+        previous = before.get(_key(result))
+        if previous is None:
+            continue
+        ratio = result["median"] / previous["median"]
+        labels = " ".join(str(value) for _, value in _key(result))
+        print(f"{labels}: {ratio:.2f}x", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=SIZES,
+        help="decimal exponents of the number of points",
+    )
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="JSON file to write, default stdout")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files"
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            compare(json.load(old), json.load(new))
+        return
+
+    report = run(args.sizes, args.only, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ setup(
     version="1.0",
     description="A small library and tools to help fitting functions to data.",
     long_description=long_description,
-    packages=find_namespace_packages(),
+    packages=find_namespace_packages(include=["ActFit", "ActFit.*"]),
     author="Philipp Stärk, Tim Fischer",
     classifiers=["Programming Language :: Python :: 3"],
     install_requires=requirements,
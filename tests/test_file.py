@@ -0,0 +1,189 @@
+import io
+import os
+
+import dill
+import numpy as np
+import pytest
+
+from ActFit.file import (
+    Archive,
+    dump,
+    dumps,
+    load,
+    load_params,
+    loads,
+    read,
+    reads,
+)
+
+
+def line(xs, m, b):
+    return m * xs + b
+
+
+def wave(xs, a, w):
+    return a * np.sin(w * xs)
+
+
+def _archive(path, fits):
+    with Archive(path, "a") as archive:
+        for key, (func, params) in fits.items():
+            archive.append(key, func, params)
+
+
+def test_dumps_reads_round_trip():
+    xs = np.linspace(0, 1, 11)
+    data = 2 * xs + 1
+    covariance = np.array([[0.01, 0.002], [0.002, 0.04]])
+    fit = reads(
+        dumps(
+            line,
+            {"m": 2.0, "b": 1.0},
+            bounds={"m": (0, 5), "b": (-1, 1)},
+            covariance=covariance,
+            stats={"rss": 0.0},
+            xs=xs,
+            data=data,
+            extra={"run": 42},
+        )
+    )
+    assert fit.name == "line"
+    assert fit.params == {"m": 2.0, "b": 1.0}
+    assert fit.bounds == {"m": (0.0, 5.0), "b": (-1.0, 1.0)}
+    np.testing.assert_array_equal(fit.covariance, covariance)
+    assert fit.stats == {"rss": 0.0}
+    assert fit.extra == {"run": 42}
+    assert sorted(fit.array_names) == ["data", "xs"]
+    np.testing.assert_array_equal(fit.xs, xs)
+    np.testing.assert_array_equal(fit.data, data)
+    np.testing.assert_allclose(fit.function()(xs, **fit.params), data)
+
+
+def test_read_maps_arrays_of_files(tmp_path):
+    path = tmp_path / "line.actfit"
+    xs = np.arange(100.0)
+    with open(path, "wb") as file:
+        dump(line, {"m": 1.0, "b": 0.0}, file, xs=xs)
+    fit = read(path)
+    assert isinstance(fit.xs, np.memmap)
+    np.testing.assert_array_equal(fit.xs, xs)
+    assert fit.data is None
+
+
+def test_dump_needs_source():
+    source = "def scaled(xs, a):\n    return a * xs\n"
+    namespace = {}
+    exec(source, namespace)
+    with pytest.raises(ValueError):
+        dumps(namespace["scaled"], {"a": 1.0})
+    fit = reads(dumps(namespace["scaled"], {"a": 1.0}, source=source))
+    assert fit.source == source
+    assert fit.function()(2.0, **fit.params) == 2.0
+
+
+def test_loads_container():
+    func, params = loads(dumps(wave, {"a": 1.5, "w": 2.0}))
+    assert params == {"a": 1.5, "w": 2.0}
+    assert func(np.pi / 4, **params) == pytest.approx(1.5)
+
+
+def test_load_legacy_dill():
+    func, params = load(io.BytesIO(dill.dumps((line, {"m": 3.0, "b": -1.0}))))
+    assert params == {"m": 3.0, "b": -1.0}
+    assert func(2.0, **params) == 5.0
+
+
+def test_archive_append_reopen(tmp_path):
+    path = tmp_path / "fits.actarc"
+    _archive(path, {"a": (line, {"m": 1.0, "b": 0.0})})
+    _archive(path, {"b": (wave, {"a": 2.0, "w": 3.0})})
+    with Archive(path) as archive:
+        assert list(archive) == ["a", "b"]
+        assert "b" in archive and "c" not in archive
+        assert archive.index["a"]["function"] == "line"
+        fit = archive["b"]
+        assert fit.name == "wave"
+        assert fit.params == {"a": 2.0, "w": 3.0}
+        with pytest.raises(ValueError):
+            archive.append("c", line, {"m": 0.0, "b": 0.0})
+
+
+def test_archive_arrays(tmp_path):
+    path = tmp_path / "fits.actarc"
+    xs = np.linspace(0, 1, 7)
+    with Archive(path, "w") as archive:
+        archive.append("a", line, {"m": 1.0, "b": 0.0}, xs=xs, data=xs)
+        archive.append("b", line, {"m": 2.0, "b": 0.0}, xs=xs, data=2 * xs)
+    with Archive(path) as archive:
+        np.testing.assert_array_equal(archive["a"].data, xs)
+        np.testing.assert_array_equal(archive["b"].data, 2 * xs)
+
+
+def test_archive_replaces_keys_across_flushes(tmp_path):
+    path = tmp_path / "fits.actarc"
+    for i in range(20):
+        _archive(path, {f"k{i % 7}": (line, {"m": float(i), "b": 0.0})})
+    with Archive(path) as archive:
+        assert len(archive) == 7
+        assert archive["k3"].params["m"] == 17.0
+        assert archive.index["k6"]["params"]["m"] == 13.0
+
+
+def test_archive_index_grows_linearly(tmp_path):
+    path = tmp_path / "fits.actarc"
+    sizes = []
+    for i in range(64):
+        _archive(path, {f"k{i}": (line, {"m": float(i), "b": 0.0})})
+        sizes.append(os.path.getsize(path))
+    # a full index per flush would add 64 * 63 / 2 entries of dead space
+    assert sizes[-1] < 2 * 64 * (sizes[1] - sizes[0])
+
+
+def test_load_params(tmp_path):
+    path = tmp_path / "fits.actarc"
+    _archive(
+        path,
+        {
+            "first": (line, {"m": 1.0, "b": 2.0}),
+            "second": (wave, {"a": 3.0, "w": 4.0}),
+        },
+    )
+    params = load_params(path)
+    assert list(params.dtype.names) == ["key", "m", "b", "a", "w"]
+    assert list(params["key"]) == ["first", "second"]
+    assert params["m"][0] == 1.0 and np.isnan(params["m"][1])
+    assert params["w"][1] == 4.0 and np.isnan(params["w"][0])
+
+
+def test_archive_recovers_from_unfinished_append(tmp_path):
+    path = tmp_path / "fits.actarc"
+    _archive(path, {"a": (line, {"m": 1.0, "b": 0.0})})
+    # a crash while appending leaves part of a fit after the trailer
+    with open(path, "ab") as file:
+        file.write(dumps(line, {"m": 9.0, "b": 9.0})[:100])
+    with Archive(path, "a") as archive:
+        assert list(archive) == ["a"]
+        archive.append("b", line, {"m": 2.0, "b": 0.0})
+    with Archive(path) as archive:
+        assert list(archive) == ["a", "b"]
+        assert archive["b"].params == {"m": 2.0, "b": 0.0}
+
+
+def test_archive_recovers_from_torn_index(tmp_path):
+    path = tmp_path / "fits.actarc"
+    _archive(path, {"a": (line, {"m": 1.0, "b": 0.0})})
+    _archive(path, {"b": (line, {"m": 2.0, "b": 0.0})})
+    # a crash while flushing leaves the last index record incomplete
+    with open(path, "r+b") as file:
+        file.truncate(os.path.getsize(path) - 30)
+    assert list(load_params(path)["key"]) == ["a"]
+    with Archive(path) as archive:
+        assert list(archive) == ["a"]
+
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / "line.actfit"
+    with open(path, "wb") as file:
+        dump(line, {"m": 1.0, "b": 0.0}, file)
+    with pytest.raises(ValueError):
+        Archive(path)